@@ -1,13 +1,28 @@
 # Imports
-from genericpath import exists
-from dash import Dash, html, dcc, Input, Output, State
+import time
+_started = time.perf_counter()
+import importlib
+from dash import Dash, html, dcc, Input, Output, State, ClientsideFunction, no_update, callback_context
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import pandas as pd
-import plotly.express as px
 from hplib import hplib as hpl
-from PLZtoWeatherRegion import getregion
-from gethpfromHeizlast import fitting_hp
-from simulate import simulate
+import src.preload as preload
+import src.binning as binning
+import src.memo as memo
+import src.resultcache as resultcache
+import src.resultsindex as resultsindex
+import src.sessionstore as sessionstore
+import uuid
+
+# Modules only the callbacks need (plotly, numba, scipy), imported on
+# first use. Under gunicorn the master imports them before forking the workers
+# (warm(), gunicorn.conf.py), so they are shared like the datasets below.
+DEFERRED = ['plotly.express', 'PLZtoWeatherRegion', 'gethpfromHeizlast', 'simulate', 'src.jobs', 'src.surrogate']
+# Engine of the simulations of the app (README, Engines): the kernel is about
+# 100 times faster than the loop, its annual values are within 0.15 % of it
+# (tests/test_engines.py, benchmarks/golden.py).
+ENGINE = 'kernel'
 
 # Initialize app with stylsheet and sub-path
 app = Dash(__name__,
@@ -23,7 +38,9 @@ app.title = 'Wärmepumpen Web-Tool'
 server = app.server
 
 # Prepare data
-df = pd.read_pickle('results_summary.pkl')
+# loaded once per process, in the master with gunicorn's preload_app; read-only so that the workers share it (src/preload.py)
+df = preload.readonly(pd.read_pickle('results_summary.pkl'))
+results = resultsindex.ResultsIndex(df)     # partitions for update_graph and update_graph2
 heatpumps=hpl.load_database()
 wp_all=hpl.load_all_heat_pumps()
 same_Built=hpl.Same_Built()
@@ -108,13 +125,13 @@ parameter1 = dbc.Card([
             ),
             html.Div("Gebäudetyp: "),
             dcc.Dropdown(
-                df['Gebäudetyp'].unique(),
+                df['Gebäudetyp'].unique().tolist(),
                 'Neubau (35/28)',
                 id='sort2',
             ),
             html.Div("PV-Ausrichtung: "),
             dcc.Dropdown(
-                df['PV-Ausrichtung'].unique(),
+                df['PV-Ausrichtung'].unique().tolist(),
                 'Süd',
                 id='sort3',
             ),
@@ -187,7 +204,7 @@ parameter6 = dbc.Card(dbc.CardBody(
             [
             html.H5("Reihen", className="card-title"),
             dcc.Dropdown(
-                df.select_dtypes(include=['object', 'int64' ]).columns,
+                df.select_dtypes(include=['object', 'category', 'int64' ]).columns,
                 'Jahr',
                 id='facet-column',
             ),
@@ -197,7 +214,7 @@ parameter7 = dbc.Card(dbc.CardBody(
             [
             html.H5("Farbe", className="card-title"),
             dcc.Dropdown(
-                df.select_dtypes(include=['object', 'int64' ]).columns,
+                df.select_dtypes(include=['object', 'category', 'int64' ]).columns,
                 'WP-Kategorie',
                 id='colour',
             ),
@@ -207,7 +224,7 @@ parameter8 = dbc.Card(dbc.CardBody(
             [
             html.H5("Wetter", className="card-title"),
             dcc.Checklist(
-                df['Art des Jahres'].unique(),
+                df['Art des Jahres'].unique().tolist(),
                 ['durchschnittliches Jahr'],
                 id='crossfilter-typ',
                 inline=True,
@@ -253,7 +270,7 @@ parameter10 = dbc.Card(dbc.CardBody(
             dcc.Slider(0, 20, 1, value=5, id='sim_pv_kwp'),
             html.Div("PV-Ausrichtung: "),
             dcc.Dropdown(
-                df['PV-Ausrichtung'].unique(),
+                df['PV-Ausrichtung'].unique().tolist(),
                 'Süd',
                 id='sim_pv_ausrichtung',
             ),
@@ -310,6 +327,9 @@ button = dbc.Card(dbc.CardBody(
         html.Button('Delete all',id='delete_all', n_clicks=0),
         html.Br(),
         html.Button('Delete last',id='delete_last', n_clicks=0),
+        html.Br(),
+        dcc.Markdown(id='sim_progress'),
+        dcc.Interval(id='sim_poll', interval=2000),
     ]))
 
 ergebnis1 = dbc.Card(dbc.CardBody(
@@ -488,8 +508,15 @@ app.layout = dbc.Container(
         ),
         html.Div(id="tab-content", className="p-4"),
         dcc.Store(id='color_graph'),     
+        # figures without costs and the grid supply and feed-in of their points, priced in the browser
+        dcc.Store(id='overview_energy'),
+        dcc.Store(id='graph2_energy'),
+        dcc.Store(id='economics_energy'),
+        # keys of the heat pumps to simulate and their results in src/sessionstore.py
         dcc.Store(id='simhp'),
         dcc.Store(id='simresults'),
+        dcc.Store(id='sim_batch'),
+        dcc.Store(id='session', storage_type='session'),
         dcc.Store(data=0,id='clicks_add_hp')
     ],fluid=True
 )
@@ -499,28 +526,37 @@ app.layout = dbc.Container(
     Output('region', 'value'),
     Input('Standort', 'value'))
 def standorttoregion(standort):
-    return region[getregion(standort)-1]
+    from PLZtoWeatherRegion import getregion
+    try:
+        return region[getregion(standort)-1]
+    except (LookupError, NotImplementedError):     # incomplete or unknown input, keep the region
+        raise PreventUpdate
+
+# The electricity prices only change the costs: the callbacks below store their
+# figures with the grid supply and feed-in of every bar and point, and
+# assets/prices.js computes the costs, the order of the bars and the range of
+# the y-axis in the browser, without a request to the server.
+ENERGY = {'supply': 'Netzbezug [kWh]', 'feedin': 'Netzeinspeisung [kWh]'}
 
 @app.callback(
-    Output('crossfilter-indicator-scatter', 'figure'),
+    Output('overview_energy', 'data'),
     Output('color_graph','data'),
     Input('region', 'value'),
     Input('sort2', 'value'),
     Input('sort3', 'value'),
-    Input('strombezugskosten', 'value'),
-    Input('einspeisevergütung', 'value'),
     )
-def update_graph(standort, gebäudetyp,pv,strombezugskosten, einspeisevergütung):
-    dff = df[(df['Standort'] == region.index(standort)+1)&(df['Gebäudetyp']==gebäudetyp)&(df['Jahr']==2015)&(df['Art des Jahres']=='durchschnittliches Jahr')&(df['Batteriespeicher [kWh]']==0)&(df['PV-Ausrichtung']==pv)]
-    dff['bilanzielle Energiekosten'] = dff['Netzbezug [kWh]'].values * strombezugskosten/100 - dff['Netzeinspeisung [kWh]'].values * einspeisevergütung/100
-    dff.loc[dff['WP-Name']=='Generic','WP-Name']='Generic '+ dff.loc[dff['WP-Name']=='Generic','WP-Kategorie'] +' '+ dff.loc[dff['WP-Name']=='Generic','WP-Typ']
-    
-    dff=dff.sort_values('bilanzielle Energiekosten')
+@memo.memoize('update_graph')
+def update_graph(standort, gebäudetyp,pv):
+    import plotly.express as px
+    dff = results.overview(region.index(standort)+1, gebäudetyp, pv)
+    # costs and the order of the bars follow in the browser
+    dff = dff.assign(**{'bilanzielle Energiekosten': 0.0, 'row': range(len(dff))})
     fig=px.bar(data_frame=dff,
                     y='bilanzielle Energiekosten',                    
                     x='WP-Name',
                     hover_name='WP-Name',
                     hover_data=['WP-Hersteller'],
+                    custom_data=['row'],
                     color='WP-Kategorie',
                     labels=dict(y='Bilanzielle Stromkosten [€/a]',x='Wärmepumpe',color='WP-Kategorie'),
                     height=450,
@@ -532,7 +568,6 @@ def update_graph(standort, gebäudetyp,pv,strombezugskosten, einspeisevergütung
     xanchor="right",
     x=0.99,
     ))
-    fig.update_yaxes(range=[dff['bilanzielle Energiekosten'].min()*0.9,dff['bilanzielle Energiekosten'].max()*1.05])
     fig.update_layout(yaxis_title='Bilanzielle Stromkosten [€/a]',
                 xaxis_title='Wärmepumpe (klicken für mehr Infos)',
                 title_x=0)
@@ -549,52 +584,44 @@ def update_graph(standort, gebäudetyp,pv,strombezugskosten, einspeisevergütung
     else:
         fig['data'][1]['marker']['color']='#636efa'
         fig['data'][0]['marker']['color']='#EF553B'
-    return fig, fig['data'][0]['marker']['color']
+    energy = dict(figure=fig, range=True, **resultsindex.energies(fig, dff, ENERGY))
+    return energy, fig['data'][0]['marker']['color']
+
+app.clientside_callback(
+    ClientsideFunction('prices', 'costs'),
+    Output('crossfilter-indicator-scatter', 'figure'),
+    Input('overview_energy', 'data'),
+    Input('strombezugskosten', 'value'),
+    Input('einspeisevergütung', 'value'),
+    )
 
 @app.callback(
-    Output('graph2', 'figure'),
+    Output('graph2_energy', 'data'),
     Input('crossfilter-indicator-scatter', 'clickData'),
     Input('region', 'value'),
     Input('sort2', 'value'),
     Input('sort3', 'value'),
-    Input('strombezugskosten', 'value'),
-    Input('einspeisevergütung', 'value'),
     Input('color_graph', 'data')
     )
-def update_graph2(wp_name,standort, gebäudetyp, pv, strombezugskosten, einspeisevergütung, color_graph):
-    df_f = df[(df['Standort'] == region.index(standort)+1)&(df['Gebäudetyp']==gebäudetyp)&(df['Jahr']==2015)&(df['Art des Jahres']=='durchschnittliches Jahr')&(df['Batteriespeicher [kWh]']==0)&(df['PV-Ausrichtung']==pv)]
-    df_f['bilanzielle Energiekosten'] = df_f['Netzbezug [kWh]'].values * strombezugskosten/100 - df_f['Netzeinspeisung [kWh]'].values * einspeisevergütung/100
-    df_f.loc[df_f['WP-Name']=='Generic','WP-Name']='Generic '+ df_f.loc[df_f['WP-Name']=='Generic','WP-Kategorie'] +' '+ df_f.loc[df_f['WP-Name']=='Generic','WP-Typ']
-    
-    df_f=df_f.sort_values('bilanzielle Energiekosten')
+@memo.memoize('update_graph2', lambda wp_name, *inputs: [wp_name['points'][0]['hovertext'], wp_name['points'][0]['curveNumber'], *inputs])
+def update_graph2(wp_name,standort, gebäudetyp, pv, color_graph):
+    import plotly.express as px
     wpname=wp_name['points'][0]['hovertext']
-
-    if wp_name['points'][0]['hovertext'].startswith('Generic'):
-        if wp_name['points'][0]['hovertext'].endswith('Luft/Wasser einstufig'):
-            df_f = df[(df['Standort'] == region.index(standort)+1)&(df['Jahr']==2015)&(df['Gebäudetyp']==gebäudetyp)&(df['PV-Ausrichtung']==pv)&(df['WP-Name']=='Generic')&(df['WP-Kategorie']=='Luft/Wasser')&(df['WP-Typ']=='einstufig')]
-        elif wp_name['points'][0]['hovertext'].endswith('Luft/Wasser geregelt'):
-            df_f = df[(df['Standort'] == region.index(standort)+1)&(df['Jahr']==2015)&(df['Gebäudetyp']==gebäudetyp)&(df['PV-Ausrichtung']==pv)&(df['WP-Name']=='Generic')&(df['WP-Kategorie']=='Luft/Wasser')&(df['WP-Typ']=='geregelt')]
-        elif wp_name['points'][0]['hovertext'].endswith('einstufig'):
-            df_f = df[(df['Standort'] == region.index(standort)+1)&(df['Jahr']==2015)&(df['Gebäudetyp']==gebäudetyp)&(df['PV-Ausrichtung']==pv)&(df['WP-Name']=='Generic')&(df['WP-Kategorie']!='Luft/Wasser')&(df['WP-Typ']=='einstufig')]
-        elif wp_name['points'][0]['hovertext'].endswith('geregelt'):
-            df_f = df[(df['Standort'] == region.index(standort)+1)&(df['Jahr']==2015)&(df['Gebäudetyp']==gebäudetyp)&(df['PV-Ausrichtung']==pv)&(df['WP-Name']=='Generic')&(df['WP-Kategorie']!='Luft/Wasser')&(df['WP-Typ']=='geregelt')]
-    else:
-        df_f = df[(df['Standort'] == region.index(standort)+1)&(df['Jahr']==2015)&(df['Gebäudetyp']==gebäudetyp)&(df['PV-Ausrichtung']==pv)&(df['WP-Name']==wpname)]
-    
-    df_f['Kosten [€/a]'] = df_f['Netzbezug [kWh]'].values * strombezugskosten/100 - df_f['Netzeinspeisung [kWh]'].values * einspeisevergütung/100
+    df_f = results.model(region.index(standort)+1, gebäudetyp, pv, wpname)
+    df_f = df_f.assign(**{'Kosten [€/a]': 0.0, 'row': range(len(df_f))})
 
     fig = px.bar(df_f,
                 x='Batteriespeicher [kWh]',
                 y='Kosten [€/a]',
                 barmode='group',
                 color='Art des Jahres',
+                custom_data=['row'],
                 height=450
                 )
     fig.update_layout(xaxis_title='Batteriespeicher [kWh]',
                 yaxis_title='Bilanzielle Stromkosten [€/a]',
                 title_x=0
                 )
-    fig.update_yaxes(range=[df_f['Kosten [€/a]'].min()*0.9,df_f['Kosten [€/a]'].max()*1.05])
     fig.update_xaxes(dtick=1)
     fig.update_layout(legend=dict(
     yanchor="top",
@@ -628,12 +655,21 @@ def update_graph2(wp_name,standort, gebäudetyp, pv, strombezugskosten, einspeis
             fig['data'][1]['marker']['color']='#CBCEFF'
             fig['data'][2]['marker']['color']='#0410AE'
 
-    return fig
+    return dict(figure=fig, range=True, **resultsindex.energies(fig, df_f, ENERGY))
+
+app.clientside_callback(
+    ClientsideFunction('prices', 'costs'),
+    Output('graph2', 'figure'),
+    Input('graph2_energy', 'data'),
+    Input('strombezugskosten', 'value'),
+    Input('einspeisevergütung', 'value'),
+    )
 
 @app.callback(
     Output('wp-infos', 'children'),
     Input('crossfilter-indicator-scatter', 'clickData'),
     Input('graph2', 'clickData'))
+@memo.memoize('update_table', lambda wp_name, Wp_name: wp_name['points'][0]['hovertext'])
 def update_table(wp_name, Wp_name):
     wpname=wp_name['points'][0]['hovertext']
     hp=heatpumps.loc[heatpumps['Model']==wpname]
@@ -671,32 +707,84 @@ def update_table(wp_name, Wp_name):
     )
 def update_graph(xaxis_column_name, yaxis_column_name,
                 year, typ,facetcolumn,colour,plottype):
-    dfff = pd.DataFrame()
-    for weathertyp in typ:
-        for jahr in year:
-            dfff=pd.concat([dfff,df.loc[(df['Jahr'] == jahr)&(df['Art des Jahres']==weathertyp)]])
-    if plottype == 'Histogramm':
+    import plotly.express as px
+    columns = list(dict.fromkeys([xaxis_column_name, yaxis_column_name, facetcolumn, colour, 'WP-Name']))
+    dfff = preload.writable(df.loc[df['Jahr'].isin(year) & df['Art des Jahres'].isin(typ), columns])
+    facets = max(1, len(dfff[facetcolumn].unique()))
+    # many rows are counted in bins on the server (src/binning.py), the figure size stays independent of the data
+    binned = len(dfff) > binning.POINTS
+    if plottype == 'Histogramm' and binned:
+        bins, width = binning.histogram(dfff, xaxis_column_name, [facetcolumn, colour])
+        fig = px.bar(bins,
+                    x=xaxis_column_name,
+                    y=binning.COUNT,
+                    facet_row=facetcolumn,
+                    facet_col_wrap=2,
+                    color=colour,
+                    height=400*facets,
+                    facet_row_spacing=0.14/facets,
+                    barmode="overlay",
+            )
+        if width:
+            fig.update_traces(width=width)
+    elif plottype == 'Histogramm':
         fig = px.histogram(x=dfff[xaxis_column_name],
                     hover_name=dfff['WP-Name'],
                     facet_row=dfff[facetcolumn],
                     facet_col_wrap=2,
                     color=dfff[colour],
-                    height=400*len(dfff[facetcolumn].unique()),
-                    facet_row_spacing=0.14/len(dfff[facetcolumn].unique()), 
+                    height=400*facets,
+                    facet_row_spacing=0.14/facets, 
                     barmode="overlay",
             )
+    elif plottype == 'Boxplot' and binned:
+        # boxes drawn from their statistics, the row numbers in customdata assign them to the traces
+        stats = binning.boxes(dfff, xaxis_column_name, yaxis_column_name, [facetcolumn, colour])
+        fig = px.box(stats.assign(row=stats.index),
+                    x=xaxis_column_name,
+                    y='median',
+                    custom_data=['row'],
+                    facet_row=facetcolumn,
+                    facet_col_wrap=2,
+                    color=colour,
+                    height=400*facets,
+                    facet_row_spacing=0.14/facets,
+                    points=False,
+            )
+        for trace in fig.data:
+            rows = stats.loc[[row[0] for row in trace.customdata]]
+            trace.update(y=None, customdata=None, **{name: rows[name].to_numpy() for name in ['q1', 'median', 'q3', 'lowerfence', 'upperfence']})
+        fig.update_yaxes(title=yaxis_column_name)
     elif plottype == 'Boxplot':
+        # without hover names, the boxes only show their statistics
         fig = px.box(x=dfff[xaxis_column_name],
                     y=dfff[yaxis_column_name],
-                    hover_name=dfff['WP-Name'],
                     facet_row=dfff[facetcolumn],
                     facet_col_wrap=2,
                     color=dfff[colour],
-                    height=400*len(dfff[facetcolumn].unique()),
-                    facet_row_spacing=0.14/len(dfff[facetcolumn].unique()),
+                    height=400*facets,
+                    facet_row_spacing=0.14/facets,
                     points=False, 
             )
         fig.update_yaxes(title=yaxis_column_name)
+    elif plottype == 'Scatterplot' and binned:
+        # density of all heat pumps, the colours are not distinguished
+        cells, xwidth, ywidth = binning.density(dfff, xaxis_column_name, yaxis_column_name, [facetcolumn])
+        fig = px.density_heatmap(cells,
+                    x=xaxis_column_name,
+                    y=yaxis_column_name,
+                    z=binning.COUNT,
+                    histfunc='sum',
+                    facet_row=facetcolumn,
+                    facet_col_wrap=2,
+                    height=400*facets,
+                    facet_row_spacing=0.14/facets,
+            )
+        if xwidth:
+            fig.update_traces(xbins=dict(start=cells[xaxis_column_name].min()-xwidth/2, end=cells[xaxis_column_name].max()+xwidth/2, size=xwidth))
+        if ywidth:
+            fig.update_traces(ybins=dict(start=cells[yaxis_column_name].min()-ywidth/2, end=cells[yaxis_column_name].max()+ywidth/2, size=ywidth))
+        fig.update_yaxes(title=yaxis_column_name)
     elif plottype == 'Scatterplot':
         fig = px.scatter(x=dfff[xaxis_column_name],
                     y=dfff[yaxis_column_name],
@@ -704,11 +792,11 @@ def update_graph(xaxis_column_name, yaxis_column_name,
                     facet_row=dfff[facetcolumn],
                     facet_col_wrap=2,
                     color=dfff[colour],
-                    height=400*len(dfff[facetcolumn].unique()),
-                    facet_row_spacing=0.14/len(dfff[facetcolumn].unique()), 
+                    height=400*facets,
+                    facet_row_spacing=0.14/facets, 
+                    render_mode='webgl' if len(dfff) > binning.WEBGL else 'svg',
             )
         fig.update_yaxes(title=yaxis_column_name)
-    fig.update_traces(customdata=dfff['WP-Name'])
     fig.update_xaxes(title=xaxis_column_name)
     fig.update_layout(legend=dict(
     yanchor="top",
@@ -728,7 +816,11 @@ def update_graph(xaxis_column_name, yaxis_column_name,
     Output('sim_region', 'value'),
     Input('sim_Standort', 'value'))
 def standorttoregion(standort):
-    return region[getregion(standort)-1]
+    from PLZtoWeatherRegion import getregion
+    try:
+        return region[getregion(standort)-1]
+    except (LookupError, NotImplementedError):     # incomplete or unknown input, keep the region
+        raise PreventUpdate
 
 @app.callback(
     Output('wptochoose','figure'),
@@ -741,6 +833,8 @@ def standorttoregion(standort):
     Input('eff_tww','value'),
 )
 def clickbutton(sim_region,wärmebedarf,t_heiz,baujahr,personen,eff_tww):
+    import plotly.express as px
+    from gethpfromHeizlast import fitting_hp
     hp,Heizlast, T_min=fitting_hp(wärmebedarf,region.index(sim_region)+1,t_heiz,baujahr,personen,[0.4,0.6,0.7,0.85][nutzungsgrad_tww.index(eff_tww)])
     fig = px.bar(hp, x='Model',y='COP', color='WP-Kategorie', hover_data=hp.columns)
     fig.layout.xaxis.update(showticklabels=False)
@@ -766,6 +860,7 @@ def clickbutton(sim_region,wärmebedarf,t_heiz,baujahr,personen,eff_tww):
     State('clicks_add_hp','value'),
 )
 def simulatehp(heatpumps,sim_region,wärmebedarf,t_heiz,baujahr,personen,eff_tww,pv_kwp,pv_ausrichtung,df,n_clicks,search_hp,n_clicks_before):
+    from simulate import scenario
     try: # for button click
         if (n_clicks>n_clicks_before):
             heatpump=same_Built.all_to_database(search_hp)
@@ -774,56 +869,76 @@ def simulatehp(heatpumps,sim_region,wärmebedarf,t_heiz,baujahr,personen,eff_tww
         if (n_clicks>0):
             heatpump=same_Built.all_to_database(search_hp)
             heatpumps=dict({'points': [{'x': heatpump}]})
-    model=(heatpumps['points'][0]['x']).replace('/','')
-    if exists('src/simulation_data/simulations/'+str(region.index(sim_region)+1)+'_'+str(wärmebedarf)+'_'+str(t_heiz)+'_'+str(personen)+'_'+str([0.4,0.6,0.7,0.85][nutzungsgrad_tww.index(eff_tww)])+'_'+str(baujahr)+'_'+model+'_'+str(pv_kwp)+'_'+pv_ausrichtung+'.csv'):
+    if resultcache.contains(scenario(region.index(sim_region)+1,wärmebedarf,t_heiz,personen,[0.4,0.6,0.7,0.85][nutzungsgrad_tww.index(eff_tww)],baujahr,heatpumps['points'][0]['x'],pv_kwp,pv_ausrichtung,engine=ENGINE)):
         sim='Ja'
     else:
         sim='Nein'
     try:
-        df=pd.DataFrame.from_dict(df)
+        df=sessionstore.get(df)
         if (len(df)>=10):
             df=pd.DataFrame()
         simhp_value=pd.concat([df, pd.DataFrame({'Region':[region.index(sim_region)+1],'Wärmebedarf':[wärmebedarf],'Vorlauf':[t_heiz],'Personen':[personen],'Nutzungsgrad_TWW':[eff_tww],'Baujahr':[baujahr],'Models':[heatpumps['points'][0]['x']], 'kWp':[pv_kwp],'PV-Ausrichtung':[pv_ausrichtung],'Bereits simuliert':[sim]})])
     except:
         simhp_value=pd.DataFrame({'Region':[region.index(sim_region)+1],'Wärmebedarf':[wärmebedarf],'Vorlauf':[t_heiz],'Personen':[personen],'Nutzungsgrad_TWW':[eff_tww],'Baujahr':[baujahr],'Models':[heatpumps['points'][0]['x']], 'kWp':[pv_kwp],'PV-Ausrichtung':[pv_ausrichtung],'Bereits simuliert':[sim]})
 
-    return simhp_value.to_dict(orient='list'),n_clicks
+    return sessionstore.put(simhp_value),n_clicks
 
 @app.callback(
     Output('sim_hp', 'children'),
     Input('simhp','value')
 )
 def showsimhp(simhp):
-    return(pd.DataFrame.from_dict(simhp).to_markdown())
+    simhp=sessionstore.get(simhp)
+    return((pd.DataFrame() if simhp is None else simhp).to_markdown())
 
 @app.callback(
-    Output('simresults','value'),
+    Output('sim_batch','data'),
+    Output('session','data'),
     Input('startsim', 'n_clicks'),
-    State('simhp', 'value')
+    State('simhp', 'value'),
+    State('session','data'),
 )
-def cleardata(click,para):
-    del para['Bereits simuliert']
-    para_dict=para
-    para=pd.DataFrame.from_dict(para)
-    results_summary=pd.DataFrame()
-    
+def cleardata(click,para,session):
+    # the simulations run in the background (src/jobs.py), pollsimulation() collects the results
+    from simulate import scenario
+    import src.jobs as jobs
+    if not click or not para:
+        raise PreventUpdate
+    para=sessionstore.get(para, ['Region','Wärmebedarf','Vorlauf','Personen','Nutzungsgrad_TWW','Baujahr','Models','kWp','PV-Ausrichtung'])
+    if para is None:    # expired
+        raise PreventUpdate
+    if session is None:
+        session=uuid.uuid4().hex
+    scenarios=[]
     for simulation in para.index:
         eff_tww=[0.4,0.6,0.7,0.85][nutzungsgrad_tww.index(para.iloc[simulation,4])]
-        path='src/simulation_data/simulations/'
-        for element in para_dict:
-            if element=='Nutzungsgrad_TWW':
-                path=path+str(eff_tww)+'_'
-            else:
-                if element=='Models':
-                    path=path+(para_dict[element][simulation].replace('/',''))+'_'
-                else:
-                    path=path+(str(para_dict[element][simulation]))+'_'
-        path=path[:-1]+'.csv'
-        if exists(path):
-            results_summary=pd.concat([results_summary,pd.read_csv(path)])
-        else:
-            results_summary=pd.concat([results_summary,simulate(para.iloc[simulation,0],para.iloc[simulation,1],para.iloc[simulation,2],para.iloc[simulation,3],eff_tww,para.iloc[simulation,5],para.iloc[simulation,6],para.iloc[simulation,7],para.iloc[simulation,8])])
-    return(results_summary.to_dict(orient='list'))
+        scenarios.append(scenario(para.iloc[simulation,0],para.iloc[simulation,1],para.iloc[simulation,2],para.iloc[simulation,3],eff_tww,para.iloc[simulation,5],para.iloc[simulation,6],para.iloc[simulation,7],para.iloc[simulation,8],engine=ENGINE))
+    return jobs.submit(session, scenarios), session
+
+@app.callback(
+    Output('sim_progress','children'),
+    Output('simresults','value'),
+    Output('sim_poll','disabled'),
+    Input('sim_poll','n_intervals'),
+    Input('sim_batch','data'),
+)
+def pollsimulation(n_intervals,batch):
+    import src.jobs as jobs
+    import src.surrogate as surrogate
+    if batch is None:
+        return '', no_update, True
+    progress=jobs.status(batch)
+    if not progress['Status'].isin(['queued','running']).any():
+        return progress.to_markdown(index=False), sessionstore.put(jobs.results(batch)), True
+    if callback_context.triggered[0]['prop_id']!='sim_batch.data':
+        return progress.to_markdown(index=False), no_update, False
+    # new batch: estimates from earlier simulations (src/surrogate.py) until the exact results are available
+    results_summary=jobs.results(batch).assign(Ergebnis='Simulation')
+    for parameters in jobs.scenarios(batch):
+        estimate=surrogate.estimate(parameters)
+        if estimate is not None:
+            results_summary=pd.concat([results_summary,estimate.assign(**{'WP-Name':parameters['wp_model'],'Ergebnis':'Schätzung'})])
+    return progress.to_markdown(index=False), sessionstore.put(results_summary), False
 
 """@app.callback(
     Output('simhp', 'value'),
@@ -835,16 +950,36 @@ def delete_last(clicks, simhp):
     return pd.DataFrame().to_dict(orient='list')"""
 
 @app.callback(
-    Output('economics','figure'),
+    Output('economics_energy','data'),
     Input('simresults','value'),
+)
+def calceconomics(results_summary):
+    import plotly.express as px
+    results_summary=sessionstore.get(results_summary, ['E_bat','E_gs','E_gf','E_gs_std','E_gf_std','WP-Name','Ergebnis','WP-Laufzeit','WP-Typ'])
+    if results_summary is None:
+        raise PreventUpdate
+    # costs and their uncertainty follow in the browser
+    results_summary['bilanzielle Stromkosten']=0.0
+    results_summary['row']=range(len(results_summary))
+    if 'Ergebnis' not in results_summary:
+        results_summary['Ergebnis']='Simulation'
+    # standard deviation of the estimates, 0 for simulated results
+    results_summary['Unsicherheit']=0.0
+    for column in ['E_gs_std','E_gf_std']:
+        results_summary[column]=results_summary[column].fillna(0) if column in results_summary else 0.0
+    for column in ['WP-Laufzeit','WP-Typ']:
+        if column not in results_summary:
+            results_summary[column]=None
+    fig=px.line(results_summary, x='E_bat', y='bilanzielle Stromkosten', color='WP-Name', line_dash='Ergebnis', error_y='Unsicherheit', hover_data=['WP-Laufzeit','WP-Typ'], custom_data=['row'])
+    return dict(figure=fig, **resultsindex.energies(fig, results_summary, {'supply': 'E_gs', 'feedin': 'E_gf', 'supply_std': 'E_gs_std', 'feedin_std': 'E_gf_std'}))
+
+app.clientside_callback(
+    ClientsideFunction('prices', 'costs'),
+    Output('economics','figure'),
+    Input('economics_energy','data'),
     Input('sim_strombezugskosten', 'value'),
     Input('sim_einspeisevergütung','value')
 )
-def calceconomics(results_summary,strombezugskosten,einspeisevergütung):
-    results_summary=pd.DataFrame.from_dict(results_summary)
-    results_summary['bilanzielle Stromkosten'] = results_summary['E_gs'].values * strombezugskosten/100 - results_summary['E_gf'].values * einspeisevergütung/100
-    fig=px.line(results_summary, x='E_bat', y='bilanzielle Stromkosten', color='WP-Name', hover_data=['WP-Laufzeit','WP-Typ'])
-    return fig
 
 @app.callback(
     Output("tab-content", "children"),
@@ -868,5 +1003,20 @@ def render_tab_content(active_tab):
     return "No tab selected"
 #############################################
 
+def warm():
+    """
+    Imports the DEFERRED modules, builds the index of the weather regions and loads the modules plotly
+    needs for the first figure of every trace type (validators, template), in the gunicorn master before the fork.
+    """
+    for module in DEFERRED:
+        importlib.import_module(module)
+    importlib.import_module('PLZtoWeatherRegion').index()
+    import plotly.express as px
+    for plot in (px.bar, px.box, px.histogram, px.line, px.scatter):
+        plot(x=[0, 1], y=[0, 1]).to_json()
+
+# seconds to import this module, logged by gunicorn.conf.py
+load_time = time.perf_counter() - _started
+
 if __name__ == '__main__':
     app.run_server(debug=False)
\ No newline at end of file
@@ -0,0 +1,43 @@
+// Costs of the plots of the results tab and of the simulation from the
+// electricity prices, computed in the browser: the callbacks of app.py store
+// their figure with the grid supply and feed-in of the points of every trace
+// (resultsindex.energies()), so moving a price slider only evaluates
+//
+//   costs = supply * strombezugskosten/100 - feedin * einspeisevergütung/100
+//
+// without a request to the server. The bars of all heat pumps are ordered by
+// these costs (categoryorder 'total ascending'), the range of the y-axis is
+// set like on the server (90 % of the minimum to 105 % of the maximum).
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    prices: {
+        costs: function (energy, strombezugskosten, einspeisevergütung) {
+            if (!energy) {
+                return window.dash_clientside.no_update;
+            }
+            var all = [];
+            var data = energy.figure.data.map(function (trace, i) {
+                var y = energy.supply[i].map(function (supply, j) {
+                    return supply * strombezugskosten/100 - energy.feedin[i][j] * einspeisevergütung/100;
+                });
+                all = all.concat(y);
+                var priced = Object.assign({}, trace, {y: y});
+                if (energy.supply_std) {
+                    // uncertainty of the estimates, 0 for simulated results
+                    priced.error_y = Object.assign({}, trace.error_y, {
+                        array: energy.supply_std[i].map(function (supply, j) {
+                            return supply * strombezugskosten/100 + energy.feedin_std[i][j] * einspeisevergütung/100;
+                        })
+                    });
+                }
+                return priced;
+            });
+            var layout = energy.figure.layout;
+            if (energy.range && all.length) {
+                var range = [Math.min.apply(null, all)*0.9, Math.max.apply(null, all)*1.05];
+                layout = Object.assign({}, layout, {yaxis: Object.assign({}, layout.yaxis, {range: range})});
+            }
+            return {data: data, layout: layout};
+        }
+    }
+});
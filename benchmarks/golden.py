@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import sys
+import warnings
+import numpy as np
+import src.datastore as datastore
+from simulate import simulate
+import benchmarks.synthetic as synthetic
+
+# Golden results of simulate() on the synthetic workspace. The reference is the
+# original step by step implementation (engine='loop'), every faster variant
+# in VARIANTS has to reproduce its results_summary within the tolerance. New
+# engines or options are checked by adding them to VARIANTS.
+# The golden file also holds a fingerprint of the synthetic input data: if the
+# generator or numpy produce other data, check() fails instead of comparing
+# against results of other inputs; regenerate the file with update(). The
+# golden results belong to the csv workspace, the float32 binary format
+# (synthetic.make(binary=True)) changes the inputs.
+
+PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden.json')
+BATTERY_SIZES = [0, 2, 5, 10]   # the loop engine simulates every battery size with bslib step by step
+SCENARIOS = [
+    # air/water inverter, new building with the low energy household profile
+    dict(standort=7, E_gas=10000, T_vorlauf=35, n_Personen=4, eff_tww=0.4, Baujahr=2020,
+         wp_model='AIM14EMX3PH', pv_kwp=8, pv_orientation='Ost-West'),
+    # brine/water inverter
+    dict(standort=7, E_gas=15000, T_vorlauf=35, n_Personen=4, eff_tww=0.4, Baujahr=2010,
+         wp_model='VWF 157/4 35 & 55', pv_kwp=5, pv_orientation='Süd'),
+    # brine/water on/off, old building with heating rod
+    dict(standort=7, E_gas=30000, T_vorlauf=55, n_Personen=4, eff_tww=0.85, Baujahr=1990,
+         wp_model='WPF 16 basic, all climates', pv_kwp=5, pv_orientation='Süd'),
+]
+# The kernel evaluates the heat pump model with the terms in another order. The
+# rounding differences flip single hysteresis switches during the year, which
+# moves the annual values by up to 0.15 % (0.13 % measured) and the peaks of the
+# grid supply by less than 0.01 %. The tolerances are these deviations with a
+# small margin, relative, absolute for values below 1 (ratios, rounded shares).
+VARIANTS = {                    # name: (options of simulate(), tolerance, tolerance of the PEAKS)
+    'kernel': (dict(engine='kernel'), 2e-3, 2e-3),
+    'low_memory': (dict(engine='kernel', low_memory=True), 2e-3, 2e-3),
+}
+PEAKS = ['P_gs_avg_max_1h', 'P_gs_avg_max_24h']     # maxima of the hourly and daily mean grid supply
+
+
+def fingerprint():
+    """
+    Returns
+    -------
+    dict with the sums of the synthetic profiles used by SCENARIOS
+    """
+    arrays = {}
+    for standort in sorted({s['standort'] for s in SCENARIOS}):
+        for name, values in list(datastore.weather(standort).items()) + list(datastore.pv(standort).items()):
+            arrays[name + ' ' + str(standort)] = values
+        arrays['existing_house ' + str(standort)] = datastore.electrical_load(standort)
+        arrays['low_energy_house ' + str(standort)] = datastore.electrical_load(standort, low_energy_house=True)
+    for n_Personen in sorted({s['n_Personen'] for s in SCENARIOS}):
+        arrays['dhw ' + str(n_Personen)] = datastore.dhw_load(n_Personen)
+    return {name: float(np.sum(values, dtype=np.float64)) for name, values in arrays.items()}
+
+
+def _numeric(summary):
+    return {column: summary[column].tolist() for column in summary.columns
+            if np.issubdtype(summary[column].dtype, np.number)}
+
+
+def update():
+    """
+    Simulates SCENARIOS with the loop engine and writes the golden file (several minutes per scenario).
+    Run in the synthetic workspace.
+    """
+    golden = {'fingerprint': fingerprint(), 'battery_sizes': BATTERY_SIZES, 'scenarios': []}
+    for parameters in SCENARIOS:
+        summary = simulate(**parameters, engine='loop', battery_sizes=BATTERY_SIZES, cache=False)
+        golden['scenarios'].append({'parameters': parameters, 'results': _numeric(summary)})
+    with open(PATH, 'w') as file:
+        json.dump(golden, file, indent=1, ensure_ascii=False)
+
+
+def check(variants=None):
+    """
+    Compares the variants with the golden results. Run in the synthetic workspace.
+    Parameters
+    ----------
+    variants: names of VARIANTS, default all
+    Returns
+    -------
+    list of dicts with variant, scenario, column, expected and actual value of every deviation
+    beyond the tolerance, empty if all variants agree
+    """
+    with open(PATH) as file:
+        golden = json.load(file)
+    expected_fingerprint, actual_fingerprint = golden['fingerprint'], fingerprint()
+    for name, value in expected_fingerprint.items():
+        if not np.isclose(actual_fingerprint.get(name, np.nan), value, rtol=1e-12):
+            raise ValueError('the synthetic data differ from the data of the golden results ('+name+'), '
+                             'regenerate them with python -m benchmarks.golden --update')
+    deviations = []
+    for variant in variants or VARIANTS:
+        options, rtol, peak_rtol = VARIANTS[variant]
+        for i, scenario in enumerate(golden['scenarios']):
+            summary = simulate(**scenario['parameters'], **options, battery_sizes=golden['battery_sizes'], cache=False)
+            for column, expected in scenario['results'].items():
+                actual = summary[column].to_numpy(dtype=float)
+                expected = np.asarray(expected, dtype=float)
+                tolerance = peak_rtol if column in PEAKS else rtol
+                for row in np.flatnonzero(np.abs(actual - expected) > tolerance * np.maximum(np.abs(expected), 1)):
+                    deviations.append({'variant': variant, 'scenario': i, 'column': column,
+                                       'E_bat': golden['battery_sizes'][row],
+                                       'expected': expected[row], 'actual': actual[row]})
+    return deviations
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Golden results of simulate(), see benchmarks/golden.py')
+    parser.add_argument('variants', nargs='*', help='names of VARIANTS, default all')
+    parser.add_argument('--update', action='store_true', help='simulate the reference and write '+PATH)
+    parser.add_argument('--workspace', default=os.path.join(synthetic.ROOT, 'benchmarks', 'workspace'),
+                        help='folder of the synthetic data')
+    options = parser.parse_args()
+    warnings.simplefilter('ignore')
+    if not os.path.exists(os.path.join(options.workspace, 'results_summary.pkl')):
+        synthetic.make(options.workspace)
+    os.chdir(options.workspace)
+    if options.update:
+        update()
+    deviations = check(options.variants or None)
+    for deviation in deviations:
+        print(deviation)
+    print(str(len(deviations)) + ' deviations')
+    sys.exit(1 if deviations else 0)
@@ -0,0 +1,393 @@
+import argparse
+import datetime
+import importlib.metadata
+import inspect
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+import numpy as np
+import benchmarks.synthetic as synthetic
+
+# Benchmarks of the simulation, the heat pump fitting and the callbacks of the
+# web app on the synthetic workspace (benchmarks/synthetic.py). Every case is
+# called once to warm up (numba compilation, input data) and then timed
+# --repeat times; the minimum is compared with a saved baseline:
+#
+#   python -m benchmarks.run --save-baseline     # on the reference version
+#   python -m benchmarks.run                     # fails if a case got slower than --threshold
+#
+# Cases of the web app need dash and plotly, geocoding in getregion() needs the
+# network (--network); unavailable cases are reported as skipped. --golden also checks
+# the results of the fast engines against the reference (benchmarks/golden.py).
+
+ROOT = synthetic.ROOT
+WORKSPACE = os.path.join(ROOT, 'benchmarks', 'workspace')
+RESULTS = os.path.join(ROOT, 'benchmarks', 'results.json')
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+THRESHOLD = 0.2             # relative slowdown of the minimum time that fails the run
+NOISE = 0.005               # s, smaller differences are not counted as slowdown
+NETWORK = False             # run the cases that need the network
+SCENARIO = dict(standort=7, E_gas=15000, T_vorlauf=35, n_Personen=4, eff_tww=0.4, Baujahr=2010,
+                wp_model='VWF 157/4 35 & 55', pv_kwp=5, pv_orientation='Süd')
+THERMAL = {name: value for name, value in SCENARIO.items() if name not in ('pv_kwp', 'pv_orientation')}
+
+CASES = {}                  # name: setup function, returns the function to time
+
+
+class Skip(Exception):
+    pass
+
+
+def case(name):
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+# Simulation ######################################
+
+@case('thermal.kernel')
+def _():
+    from simulate import thermal
+    return lambda: thermal(**THERMAL, cache=False, engine='kernel')
+
+
+@case('thermal.low_memory')
+def _():
+    from simulate import thermal
+    return lambda: thermal(**THERMAL, cache=False, engine='kernel', low_memory=True)
+
+
+@case('thermal.loop_15min')
+def _():
+    from simulate import thermal
+    return lambda: thermal(**THERMAL, cache=False, engine='loop', resolution=15)
+
+
+def _P_diff():
+    import src.datastore as datastore
+    from simulate import thermal
+    P_el_gesamt = thermal(**THERMAL, cache=False, engine='kernel')['P_el_gesamt']
+    return datastore.pv(SCENARIO['standort'])[SCENARIO['pv_orientation']]*SCENARIO['pv_kwp'] - P_el_gesamt
+
+
+@case('battery.simulate')
+def _():
+    import src.battery as battery
+    P_diff = _P_diff()
+    e_bat = np.asarray(battery.SIZES, dtype=float)
+    return lambda: battery.simulate(P_diff, e_bat, e_bat*battery.C_RATE)
+
+
+@case('battery.balance')
+def _():
+    import src.battery as battery
+    P_diff = _P_diff()
+    e_bat = np.asarray(battery.SIZES, dtype=float)
+    return lambda: battery.balance(P_diff, e_bat, e_bat*battery.C_RATE)
+
+
+@case('simulate.electrical')
+def _():
+    # PV, battery sweep and KPI block with a cached thermal stage, a new PV size per call
+    from simulate import simulate
+    sizes = itertools.count()
+    parameters = dict(SCENARIO)
+    del parameters['pv_kwp']
+    return lambda: simulate(**parameters, engine='kernel', pv_kwp=5 + next(sizes)/1000)
+
+
+@case('simulate.full')
+def _():
+    from simulate import simulate
+    return lambda: simulate(**SCENARIO, engine='kernel', cache=False)
+
+
+@case('simulate.low_memory')
+def _():
+    from simulate import simulate
+    return lambda: simulate(**SCENARIO, engine='kernel', cache=False, low_memory=True)
+
+
+@case('simulate.cached')
+def _():
+    from simulate import simulate
+    return lambda: simulate(**SCENARIO, engine='kernel')
+
+
+# Heat pump fitting and region ####################
+
+@case('fitting_hp')
+def _():
+    from gethpfromHeizlast import fitting_hp
+    return lambda: fitting_hp(15000, 7, 35, 2010, 4, 0.4)
+
+
+@case('fitting_hp.cold')
+def _():
+    # first request of a process, including reading hp_Normheizlast.csv
+    import src.datastore as datastore
+    from gethpfromHeizlast import fitting_hp
+
+    def run():
+        datastore.clear()
+        fitting_hp(15000, 7, 35, 2010, 4, 0.4)
+    return run
+
+
+@case('getregion')
+def _():
+    # offline index: PLZ of a station, other PLZ, place name, beginning of a place name
+    try:
+        from PLZtoWeatherRegion import getregion
+    except ImportError as error:
+        raise Skip(str(error))
+
+    def run():
+        for query in ('26789', '26721', '01067', 'München', 'Augs'):
+            getregion(query)
+    return run
+
+
+@case('getregion.geocode')
+def _():
+    if not NETWORK:
+        raise Skip('needs --network')
+    try:
+        import PLZtoWeatherRegion
+    except ImportError as error:
+        raise Skip(str(error))
+
+    def run():
+        PLZtoWeatherRegion._locations.clear()
+        PLZtoWeatherRegion.getregion('Hesel', geocode=True)
+    return run
+
+
+# Callbacks of the web app ########################
+
+def _app():
+    try:
+        import app
+    except ImportError as error:
+        raise Skip(str(error))
+    return app
+
+
+def _callback(app, output, memoized=False):
+    # function of a callback by its output, also if app.py reuses its name, by default without memoization (src/memo.py)
+    for key, value in app.app.callback_map.items():
+        if output in key:
+            return value['callback'].__wrapped__ if memoized else inspect.unwrap(value['callback'])
+    raise Skip('no callback for ' + output)
+
+
+@case('app.import')
+def _():
+    # cold start of a process without preloading, like a gunicorn worker without preload_app
+    _app()
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.environ.get('PYTHONPATH', '')]))
+    return lambda: subprocess.run([sys.executable, '-c', 'import app'], env=environment, check=True)
+
+
+@case('app.update_graph')
+def _():
+    app = _app()
+    update_graph = _callback(app, 'overview_energy.data')
+    return lambda: update_graph(app.region[6], 'Neubau (35/28)', 'Süd')
+
+
+@case('app.update_graph.memo')
+def _():
+    # memoized figure of update_graph (src/memo.py), a hit after the warm-up call
+    app = _app()
+    update_graph = _callback(app, 'overview_energy.data', memoized=True)
+    return lambda: update_graph(app.region[6], 'Neubau (35/28)', 'Süd')
+
+
+@case('app.update_graph2')
+def _():
+    app = _app()
+    update_graph2 = _callback(app, 'graph2_energy.data')
+    generic = {'points': [{'curveNumber': 0, 'hovertext': 'Generic Luft/Wasser geregelt'}]}
+    model = {'points': [{'curveNumber': 1, 'hovertext': app.df.loc[app.df['WP-Name'] != 'Generic', 'WP-Name'].iloc[0]}]}
+
+    def run():
+        update_graph2(generic, app.region[6], 'Neubau (35/28)', 'Süd', '#636efa')
+        update_graph2(model, app.region[6], 'Neubau (35/28)', 'Süd', '#636efa')
+    return run
+
+
+@case('app.graph3')
+def _():
+    app = _app()
+    update_graph = _callback(app, 'graph3.figure')
+
+    def run():
+        for plottype in ('Histogramm', 'Boxplot', 'Scatterplot'):
+            update_graph('Standort', 'JAZ', [2015], ['durchschnittliches Jahr'], 'Jahr', 'WP-Kategorie', plottype)
+    return run
+
+
+@case('app.graph3.all')
+def _():
+    # all years and weather types, aggregated on the server (src/binning.py)
+    app = _app()
+    update_graph = _callback(app, 'graph3.figure')
+    years, types = [int(year) for year in app.df['Jahr'].unique()], list(app.df['Art des Jahres'].unique())
+
+    def run():
+        for plottype in ('Histogramm', 'Boxplot', 'Scatterplot'):
+            update_graph('Standort', 'JAZ', years, types, 'Jahr', 'WP-Kategorie', plottype)
+    return run
+
+
+@case('app.clickbutton')
+def _():
+    app = _app()
+    clickbutton = _callback(app, 'wptochoose.figure')
+    return lambda: clickbutton(app.region[6], 15000, 35, 2010, 4, app.nutzungsgrad_tww[0])
+
+
+@case('app.calceconomics')
+def _():
+    app = _app()
+    from simulate import simulate
+    import src.sessionstore as sessionstore
+    calceconomics = _callback(app, 'economics_energy.data')
+    results = sessionstore.put(simulate(**SCENARIO, engine='kernel'))
+    return lambda: calceconomics(results)
+
+
+###################################################
+
+def measure(run, repeat):
+    """
+    Returns
+    -------
+    dict with minimum, median and all times [s] of repeat calls after a warm-up call
+    """
+    run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times), 'times': times}
+
+
+def environment():
+    versions = {}
+    for package in ('numpy', 'pandas', 'numba', 'hplib', 'bslib', 'dash', 'plotly'):
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+            'python': platform.python_version(), 'machine': platform.platform(), 'cpus': os.cpu_count(),
+            'packages': versions}
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """
+    Parameters
+    ----------
+    results, baseline: benchmark results as written by run()
+    threshold: relative slowdown of the minimum time that counts as regression
+    Returns
+    -------
+    dict case: (baseline [s], current [s], ratio, regression) of the cases timed in both
+    """
+    comparison = {}
+    for name, current in results['cases'].items():
+        before = baseline['cases'].get(name)
+        if 'min' not in current or not before or 'min' not in before:
+            continue
+        ratio = current['min'] / before['min']
+        comparison[name] = (before['min'], current['min'], ratio,
+                            ratio > 1 + threshold and current['min'] - before['min'] > NOISE)
+    return comparison
+
+
+def run(names, repeat, workspace=WORKSPACE):
+    """
+    Runs the benchmark cases in the synthetic workspace, which is created if necessary.
+    Returns
+    -------
+    dict with the environment and per case the times or the reason for skipping it
+    """
+    if not os.path.exists(os.path.join(workspace, 'results_summary.pkl')):
+        print('writing synthetic data to ' + workspace)
+        synthetic.make(workspace)
+    directory = os.getcwd()
+    os.chdir(workspace)
+    try:
+        import src.resultcache as resultcache
+        resultcache.clear()     # the same cache misses in every run
+        results = {'environment': environment(), 'repeat': repeat, 'cases': {}}
+        for name in names:
+            try:
+                results['cases'][name] = measure(CASES[name](), repeat)
+                print('%-28s %9.4f s (median %.4f s)' % (name, results['cases'][name]['min'],
+                                                         results['cases'][name]['median']))
+            except Skip as reason:
+                results['cases'][name] = {'skipped': str(reason)}
+                print('%-28s skipped: %s' % (name, reason))
+    finally:
+        os.chdir(directory)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks on synthetic data, see benchmarks/run.py')
+    parser.add_argument('cases', nargs='*', help='names or prefixes of the cases, default all')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workspace', default=WORKSPACE, help='folder of the synthetic data')
+    parser.add_argument('--output', default=RESULTS, help='json file of the results')
+    parser.add_argument('--baseline', default=BASELINE, help='json file of the results to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as baseline')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--network', action='store_true', help='include geocoding in getregion() (Nominatim)')
+    parser.add_argument('--golden', action='store_true', help='check the engines against the golden results')
+    options = parser.parse_args()
+    NETWORK = options.network
+    warnings.simplefilter('ignore')
+    names = [name for name in CASES if not options.cases
+             or any(name == prefix or name.startswith(prefix + '.') for prefix in options.cases)]
+    results = run(names, options.repeat, options.workspace)
+    failed = False
+    if options.golden:
+        os.chdir(options.workspace)
+        import benchmarks.golden as golden
+        results['golden'] = golden.check()
+        os.chdir(ROOT)
+        for deviation in results['golden']:
+            print('golden: ' + str(deviation))
+        print('golden: %d deviations' % len(results['golden']))
+        failed = bool(results['golden'])
+    with open(options.output, 'w') as file:
+        json.dump(results, file, indent=1)
+    if options.save_baseline:
+        with open(options.baseline, 'w') as file:
+            json.dump(results, file, indent=1)
+    elif os.path.exists(options.baseline):
+        with open(options.baseline) as file:
+            baseline = json.load(file)
+        print('\ncompared with ' + options.baseline + ' (' + str(baseline['environment']['commit']) + ')')
+        for name, (before, current, ratio, regression) in compare(results, baseline, options.threshold).items():
+            print('%-28s %9.4f s -> %9.4f s  %+6.1f %%%s' % (name, before, current, (ratio - 1)*100,
+                                                          '  REGRESSION' if regression else ''))
+            failed |= regression
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,196 @@
+import os
+import shutil
+import sys
+import numpy as np
+import pandas as pd
+from hplib import hplib as hpl
+import src.binary
+from src.datastore import YEAR_TYPES
+
+# Synthetic input data for the benchmarks. The 1-minute datasets of the
+# simulation are not part of the repository, so make() writes a workspace with
+# files of the same names, columns and lengths: weather, PV, household and DHW
+# profiles, hp_Normheizlast.csv and a results_summary.pkl for the web app. The
+# values are plausible (seasons, day/night, heating periods), not measured, and
+# only depend on the seed, so timings and golden results are reproducible.
+# TRJ-Tabelle.csv and T_zones_Ger_final.csv are small and copied from the repo.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MINUTES = 525600                # one year of 1-minute values
+REGIONS = (7,)                  # test reference year regions with profiles
+PERSONS = (4,)                  # DHW profiles
+YEARS = ((2015, 'a'),)          # test reference years with profiles
+BUILDINGS = {'Neubau (35/28)': 35, 'Bestand (55/45)': 55, 'Altbau (70/55)': 70}  # Gebäudetyp: flow temperature
+HEATPUMPS = 40                  # heat pump models in results_summary.pkl, plus the four Generic ones
+BATTERIES = range(11)           # kWh
+
+
+def _time(year):
+    return pd.date_range(str(year), periods=MINUTES, freq='min').strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _weather(rng, T_min_ref, year_type):
+    day = np.arange(MINUTES) / 1440
+    offset = {'a': 0.0, 's': 1.5, 'w': -2.0}[year_type]
+    daily = np.repeat(rng.normal(0, 3, 365), 1440)     # warm and cold days
+    T = 9.5 + offset - (9.5 - T_min_ref / 2) * np.cos(2 * np.pi * (day - 15) / 365) - 3 * np.cos(2 * np.pi * day) + daily
+    # 24h average of the hourly means, a few distinct values per day as in the test reference years
+    T_24h = np.repeat(pd.Series(T.reshape(-1, 60).mean(axis=1)).rolling(24, min_periods=1).mean().to_numpy(), 60)
+    return T, T_24h
+
+
+def _pv(rng):
+    day = np.arange(MINUTES) / 1440
+    elevation = np.sin(2 * np.pi * (day - 0.25)) + 0.35 * np.cos(2 * np.pi * (day - 172) / 365) - 0.2
+    clouds = np.repeat(rng.uniform(0.15, 1.0, 365 * 24), 60)
+    south = 850 * np.clip(elevation, 0, None) * clouds
+    east_west = 720 * np.clip(elevation, 0, None) ** 0.8 * clouds
+    return south, east_west
+
+
+def profiles(path, regions=REGIONS, persons=PERSONS, years=YEARS, seed=0):
+    """
+    Writes the 1-minute profiles of the simulation.
+    Parameters
+    ----------
+    path: simulation data folder, e.g. <workspace>/src/simulation_data/
+    regions: test reference year regions (1-15)
+    persons: numbers of persons of the DHW profiles
+    years: (year, year_type) of the weather and PV profiles
+    seed: random seed
+    """
+    rng = np.random.default_rng(seed)
+    for folder in ('weather', 'pv', 'electrical_load', 'dhw_load'):
+        os.makedirs(os.path.join(path, folder), exist_ok=True)
+    trj = pd.read_csv(os.path.join(path, 'TRJ-Tabelle.csv'))
+    for year, year_type in years:
+        time = _time(year)
+        for standort in regions:
+            T_min_ref = trj.loc[(trj['TRY'] == standort) & (trj['Year'] == year) & (trj['Type'] == year_type),
+                                'T_min_ref'].iloc[0]
+            T, T_24h = _weather(rng, T_min_ref, year_type)
+            pd.DataFrame({'time': time, 'temperature [degC]': T, 'temperature 24h [degC]': T_24h}).to_csv(
+                os.path.join(path, 'weather', 'weather_%d_%s_%d_1min.csv' % (standort, year_type, year)), index=False)
+            south, east_west = _pv(rng)
+            pd.DataFrame({'time': time, 'Süd': south, 'Ost-West': east_west}).to_csv(
+                os.path.join(path, 'pv', 'pv_%d_%s_%d_1min.csv' % (standort, year_type, year)), index=False)
+    # household: base load, evening peak and short appliance peaks, all 15 regions
+    day = np.arange(MINUTES) / 1440
+    shape = 250 + 250 * np.exp(-((day % 1 - 0.8) * 12) ** 2) + 150 * np.exp(-((day % 1 - 0.3) * 15) ** 2)
+    existing = {str(standort): np.clip(shape + rng.exponential(120, MINUTES)
+                                       + (rng.uniform(0, 1, MINUTES) < 0.004) * rng.uniform(1000, 3000, MINUTES), 50, None)
+                for standort in range(1, 16)}
+    pd.DataFrame(existing).to_csv(os.path.join(path, 'electrical_load', 'existing_house.csv'), index=False)
+    pd.DataFrame({column: 0.8 * values for column, values in existing.items()}).to_csv(
+        os.path.join(path, 'electrical_load', 'low_energy_house.csv'), index=False)
+    for n_Personen in persons:
+        draws = (rng.uniform(0, 1, MINUTES) < 0.004 * n_Personen) * rng.uniform(3, 12, MINUTES)    # l/min
+        pd.DataFrame({'time': _time(2015), 'flow [l/min]': draws, 'load [W]': draws * 4.19 * 35 / 60 * 1000}).to_csv(
+            os.path.join(path, 'dhw_load', 'dhw_%d.csv' % n_Personen), index=False)
+
+
+def normheizlast(path):
+    """
+    Writes hp_Normheizlast.csv (src/concat.ipynb) for all heat pumps of hplib with
+    a simple model of the heating power and COP at the design temperature.
+    """
+    models = hpl.load_database()
+    models = models[models['Model'] != 'Generic']
+    models = models[models['Group'].isin([1, 2, 4, 5])]
+    trj = pd.read_csv(os.path.join(path, 'TRJ-Tabelle.csv')).head(15)
+    frames = []
+    for standort, T_min_ref in enumerate(trj['T_min_ref'], 1):
+        for air, T_max in ((True, 71), (False, 70)):
+            group = models[models['Group'].isin([1, 4] if air else [2, 5])]
+            T_in = T_min_ref if air else 3.0
+            for T_vorlauf in range(25, T_max):
+                frames.append(pd.DataFrame({
+                    'Standort': standort, 'Manufacturer': group['Manufacturer'].values, 'Model': group['Model'].values,
+                    'Gruppe': group['Group'].values.astype(int), 'Normaußentemperatur': T_min_ref,
+                    'Vorlauftemperatur': T_vorlauf,
+                    'Normheizlast': group['P_th_h_ref [W]'].values * (1 + 0.02 * (T_in + 7) - 0.004 * (T_vorlauf - 52)),
+                    'COP': np.clip(group['COP_ref'].values * (1 + 0.025 * (T_in + 7) - 0.02 * (T_vorlauf - 52)), 1, None)}))
+    hp = pd.concat(frames, ignore_index=True)
+    hp['WP-Kategorie'] = np.where(hp['Gruppe'].isin([1, 4]), 'Luft/Wasser', 'Sole/Wasser')
+    hp.to_csv(os.path.join(path, 'hp_Normheizlast.csv'), index=False)
+
+
+def results_summary(filename, heatpumps=HEATPUMPS, seed=0):
+    """
+    Writes a results_summary.pkl with the columns the web app reads, one row per region,
+    building, test reference year, PV orientation, battery and heat pump.
+    """
+    rng = np.random.default_rng(seed)
+    models = hpl.load_database()
+    models = models[(models['Model'] != 'Generic') & models['Group'].isin([1, 2, 4, 5])]
+    models = models.iloc[np.sort(rng.choice(len(models), min(heatpumps, len(models)), replace=False))]
+    heatpumps = pd.DataFrame({'WP-Hersteller': models['Manufacturer'].values, 'WP-Name': models['Model'].values,
+                              'group': models['Group'].values.astype(int)})
+    generic = pd.DataFrame({'WP-Hersteller': 'Generic', 'WP-Name': 'Generic', 'group': [1, 4, 2, 5]})
+    heatpumps = pd.concat([heatpumps, generic], ignore_index=True)
+    heatpumps['WP-Kategorie'] = np.where(heatpumps['group'].isin([1, 4]), 'Luft/Wasser', 'Sole/Wasser')
+    heatpumps['WP-Typ'] = np.where(heatpumps['group'] > 3, 'einstufig', 'geregelt')
+    heatpumps['quality'] = rng.normal(0, 0.25, len(heatpumps))
+    trj = pd.read_csv(os.path.join(ROOT, 'src', 'simulation_data', 'TRJ-Tabelle.csv'))
+    trj = trj[trj['TRY'] <= 15]
+    grid = pd.MultiIndex.from_product(
+        [trj.index, list(BUILDINGS), ['Süd', 'Ost-West'], list(BATTERIES), heatpumps.index],
+        names=['trj', 'Gebäudetyp', 'PV-Ausrichtung', 'Batteriespeicher [kWh]', 'hp']).to_frame(index=False)
+    df = grid.join(trj[['TRY', 'Year', 'Type', 'T_min_ref']], on='trj').join(heatpumps, on='hp')
+    T_vorlauf = df['Gebäudetyp'].map(BUILDINGS)
+    brine = df['WP-Kategorie'] == 'Sole/Wasser'
+    df['JAZ'] = (2.8 + 0.8 * brine - 0.03 * (T_vorlauf - 35) + 0.03 * (df['T_min_ref'] + 12) + df['quality']
+                 + rng.normal(0, 0.05, len(df))).clip(1.5)
+    heat = np.where(T_vorlauf == 35, 9000, np.where(T_vorlauf == 55, 18000, 27000)) * (1 - 0.02 * (df['T_min_ref'] + 12))
+    E_hp = heat / df['JAZ']
+    E_el = E_hp + 3500
+    E_pv = np.where(df['PV-Ausrichtung'] == 'Süd', 4900, 4300) * (1 + 0.05 * (df['Type'] == 's') - 0.05 * (df['Type'] == 'w'))
+    self_consumption = np.minimum(0.3 + 0.045 * df['Batteriespeicher [kWh]'] - 0.00135 * df['Batteriespeicher [kWh]'] ** 2, 0.7)
+    E_sc = np.minimum(E_pv * self_consumption, E_el * 0.8)
+    summary = pd.DataFrame({
+        'Standort': df['TRY'].astype('int64'),
+        'Gebäudetyp': df['Gebäudetyp'],
+        'Jahr': df['Year'].astype('int64'),
+        'Art des Jahres': df['Type'].map(YEAR_TYPES),
+        'WP-Hersteller': df['WP-Hersteller'],
+        'WP-Name': df['WP-Name'],
+        'WP-Kategorie': df['WP-Kategorie'],
+        'WP-Typ': df['WP-Typ'],
+        'PV-Ausrichtung': df['PV-Ausrichtung'],
+        'Batteriespeicher [kWh]': df['Batteriespeicher [kWh]'].astype('int64'),
+        'Wärmebedarf [kWh]': heat,
+        'Stromverbrauch WP [kWh]': E_hp,
+        'Stromverbrauch gesamt [kWh]': E_el,
+        'PV-Erzeugung [kWh]': E_pv,
+        'Netzbezug [kWh]': E_el - E_sc,
+        'Netzeinspeisung [kWh]': E_pv - E_sc - 0.1 * E_sc * (df['Batteriespeicher [kWh]'] > 0),
+        'Autarkiegrad': E_sc / E_el,
+        'JAZ': df['JAZ'],
+    })
+    summary.to_pickle(filename)
+    return summary
+
+
+def make(root, regions=REGIONS, persons=PERSONS, years=YEARS, heatpumps=HEATPUMPS, seed=0, binary=False):
+    """
+    Writes a complete workspace: simulation data, hp_Normheizlast.csv, results_summary.pkl
+    and T_zones_Ger_final.csv. Run the simulation or the app with root as working directory.
+    Parameters
+    ----------
+    root: folder of the workspace
+    binary: additionally write the binary format of the profiles (src/binary.py)
+    """
+    path = os.path.join(root, 'src', 'simulation_data')
+    os.makedirs(path, exist_ok=True)
+    shutil.copy(os.path.join(ROOT, 'src', 'simulation_data', 'TRJ-Tabelle.csv'), path)
+    shutil.copy(os.path.join(ROOT, 'T_zones_Ger_final.csv'), root)
+    profiles(path, regions, persons, years, seed)
+    normheizlast(path)
+    results_summary(os.path.join(root, 'results_summary.pkl'), heatpumps, seed)
+    if binary:
+        src.binary.convert(path)
+
+
+if __name__ == '__main__':
+    # python -m benchmarks.synthetic <folder of the workspace> [--binary]
+    make(sys.argv[1], binary='--binary' in sys.argv[2:])
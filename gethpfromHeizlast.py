@@ -1,4 +1,7 @@
+import numpy as np
 import pandas as pd
+import src.climate as climate
+import src.datastore as datastore
 
 def fitting_hp(energieverbrauch, standort,Vorlauftemperatur,Baujahr,Personen, eff_tww):
     """
@@ -15,23 +18,68 @@ def fitting_hp(energieverbrauch, standort,Vorlauftemperatur,Baujahr,Personen, ef
     Heizlast (W)
     """
     
-    hp=pd.read_csv('src/simulation_data/hp_Normheizlast.csv')
-    weather=pd.read_csv('src/simulation_data/TRJ-Tabelle.csv').head(15)# average year
-    eff_heiz=0.9                                                    # average from DIN EN 12831 Tabelle 38
-    if Baujahr<=2000:                                                
-        if Baujahr<=1995:                                    
-            eff_heiz=0.85                                           # average from DIN EN 12831 Tabelle 38
-        Heizgrenztemperatur=15                                      # IWU Heizgrenztemperatur 
-        gtz=weather.iloc[standort-1,11] 
-    elif Baujahr>2015: 
-        Heizgrenztemperatur=10 
-        gtz=weather.iloc[standort-1,12] 
-    else: 
-        Heizgrenztemperatur=12 
-        gtz=weather.iloc[standort-1,10] 
-    b=gtz*24/(Heizgrenztemperatur-weather.iloc[standort-1,9])       # DIN/TS 12831-1:2020-04 Formel 50
-    Q_TWW=(14.9*30*Personen)/eff_tww                                # DIN/TS 12831-1:2020-04 Formel 57
-    Heizlast = (energieverbrauch* eff_heiz-Q_TWW) * 1000 / b        # DIN/TS 12831-1:2020-04 Formel 49
-    Heizbedarf=Heizlast+Q_TWW                                       # Aufschlag TWW (500h im Jahr (1.5h am Tag))
+    hp=datastore.heatpumps()
+    weather=datastore.trj(standort)# average year
+    Heizbedarf=heizbedarf(energieverbrauch,standort,Baujahr,Personen,eff_tww)
     hp=hp.loc[(hp['Standort']==standort)& (hp['Vorlauftemperatur']==Vorlauftemperatur)&(hp['Normheizlast']>=Heizbedarf)&(hp['Normheizlast']<=Heizbedarf*1.25)]
-    return hp.sort_values('Normheizlast', ascending=False), Heizbedarf, weather.iloc[standort-1,9]
+    return hp.sort_values('Normheizlast', ascending=False), Heizbedarf, weather['T_min_ref']
+
+def heizbedarf(energieverbrauch, standort, Baujahr, Personen, eff_tww):
+    """
+    Heat load including hot water of one building or of arrays of buildings (numbers or arrays of equal length).
+    Parameters
+    ----------
+    energieverbrauch [kWh]
+    standort (1-15)
+    Baujahr
+    Personen
+    eff_tww
+    Returns
+    -------
+    Heizbedarf (W), float or np.ndarray
+    """
+    regions=np.unique(standort)
+    weather=pd.DataFrame([datastore.trj(region) for region in regions], index=regions).loc[np.atleast_1d(standort)]# average year
+    Baujahr=np.atleast_1d(Baujahr)
+    eff_heiz=np.where(Baujahr<=1995, 0.85, 0.9)                     # average from DIN EN 12831 Tabelle 38
+    Heizgrenztemperatur=climate.heating_limit(Baujahr)             # IWU Heizgrenztemperatur
+    gtz=np.select([Heizgrenztemperatur==limit for limit in climate.DEGREE_DAYS],
+                  [weather[column].to_numpy(dtype=float) for column in climate.DEGREE_DAYS.values()])
+    b=gtz*24/(Heizgrenztemperatur-weather['T_min_ref'].to_numpy(dtype=float))     # DIN/TS 12831-1:2020-04 Formel 50
+    Q_TWW=(14.9*30*np.asarray(Personen))/np.asarray(eff_tww)       # DIN/TS 12831-1:2020-04 Formel 57
+    Heizlast = (np.asarray(energieverbrauch)* eff_heiz-Q_TWW) * 1000 / b     # DIN/TS 12831-1:2020-04 Formel 49
+    Heizbedarf=Heizlast+Q_TWW                                       # Aufschlag TWW (500h im Jahr (1.5h am Tag))
+    return Heizbedarf if np.ndim(standort) else float(Heizbedarf[0])
+
+def candidates(buildings, n=1):
+    """
+    Heat pumps of fitting_hp() for many buildings at once, the n with the highest COP per building.
+    Parameters
+    ----------
+    buildings: pd.DataFrame with the columns standort, E_gas, T_vorlauf, Baujahr, n_Personen and eff_tww
+    n: heat pumps per building
+    Returns
+    -------
+    pd.DataFrame with the index of the building, Heizbedarf (W) and the columns of the heat pumps
+    (Model, COP, Normheizlast, WP-Kategorie, ...), no rows for buildings without fitting heat pump
+    """
+    hp=datastore.heatpumps()
+    buildings=buildings.assign(Heizbedarf=heizbedarf(buildings['E_gas'].to_numpy(), buildings['standort'].to_numpy(),
+                                                     buildings['Baujahr'].to_numpy(), buildings['n_Personen'].to_numpy(),
+                                                     buildings['eff_tww'].to_numpy()))
+    groups=hp.groupby(['Standort', 'Vorlauftemperatur']).indices
+    chosen=[]
+    for (standort, vorlauf), group in buildings.groupby(['standort', 'T_vorlauf']):
+        table=hp.iloc[groups.get((standort, vorlauf), [])].sort_values('Normheizlast', kind='stable')
+        load, cop=table['Normheizlast'].to_numpy(), table['COP'].to_numpy()
+        # heat pumps with Heizbedarf <= Normheizlast <= 1.25 Heizbedarf are a contiguous range of the sorted table
+        start=np.searchsorted(load, group['Heizbedarf'].to_numpy(), side='left')
+        stop=np.searchsorted(load, group['Heizbedarf'].to_numpy()*1.25, side='right')
+        positions, rows=[], []
+        for row, (first, last) in enumerate(zip(start, stop)):
+            best=first+np.argsort(-cop[first:last], kind='stable')[:n]     # like nlargest(n, 'COP')
+            positions.extend(best)
+            rows.extend([row]*len(best))
+        chosen.append(table.iloc[positions].assign(building=group.index[rows], Heizbedarf=group['Heizbedarf'].to_numpy()[rows]))
+    columns=['building', 'Heizbedarf']+hp.columns.tolist()
+    return pd.concat(chosen, ignore_index=True)[columns] if chosen else pd.DataFrame(columns=columns)
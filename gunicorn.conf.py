@@ -0,0 +1,35 @@
+import time
+import src.preload as preload
+
+# gunicorn settings of the web app (Procfile). The master imports app.py once
+# (preload_app) including the modules the callbacks import on first use, and
+# forks the workers from it: a new or recycled worker starts in milliseconds
+# and shares the datasets and modules with the others (src/preload.py). The
+# startup time and the memory of the master and every worker are logged.
+# With preload_app = False every worker imports app.py itself.
+
+preload_app = True
+
+
+def when_ready(server):
+    # master, after preloading app.py and before forking the first worker
+    import app
+    start = time.perf_counter()
+    app.warm()
+    preload.freeze()
+    server.log.info('app ready in %.2f s (app.py %.2f s, deferred modules %.2f s), %s',
+                    time.perf_counter() - preload.STARTED, app.load_time, time.perf_counter() - start,
+                    preload.describe(preload.memory()))
+
+
+def post_fork(server, worker):
+    worker.forked = time.perf_counter()
+
+
+def post_worker_init(worker):
+    worker.log.info('worker %d booted in %.3f s, %s', worker.pid, time.perf_counter() - worker.forked,
+                    preload.describe(preload.memory()))
+
+
+def worker_exit(server, worker):
+    server.log.info('worker %d exits, %s', worker.pid, preload.describe(preload.memory()))
@@ -0,0 +1,213 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import pandas as pd
+import src.resultcache as resultcache
+from gethpfromHeizlast import candidates
+from PLZtoWeatherRegion import getregion
+from simulate import RESOLUTIONS, scenario, simulate
+
+# Simulation of a portfolio of buildings from a CSV file, the path of the web
+# app (getregion -> fitting_hp -> simulate) for thousands of buildings:
+#
+#   python portfolio.py buildings.csv results.csv --workers 8 --candidates 2 --engine kernel
+#   python portfolio.py buildings.csv results.csv --resume     # after an interruption
+#
+# The input has the columns INPUTS (eff_tww as number, e.g. 0.4) and optionally
+# 'id'. It is read in blocks of BLOCK buildings: the regions of all PLZ of a
+# block are looked up at once (offline index), the heat pumps are selected for
+# the whole block (gethpfromHeizlast.candidates(), the heat pumps of
+# fitting_hp() with the highest COP) and the simulations are taken from the
+# result cache or submitted to the worker processes, at most PENDING per
+# worker at a time. Identical simulations of several buildings run once. The
+# results_summary of every building and heat pump is appended to the output as
+# soon as it is finished, so the memory does not grow with the portfolio.
+#
+# After every written simulation the output size is appended to
+# <output>.checkpoint. --resume cuts the output to the last checkpoint and
+# skips the buildings and heat pumps it lists. Buildings without region or
+# fitting heat pump and failed simulations are written to <output>.errors.csv;
+# failed simulations are not checkpointed and run again with --resume.
+
+INPUTS = ['PLZ', 'E_gas', 'T_vorlauf', 'Baujahr', 'n_Personen', 'eff_tww', 'pv_kwp', 'pv_orientation']
+BUILDING = ['id', 'PLZ', 'standort', 'Heizbedarf', 'wp_model', 'COP']     # first columns of the output
+BLOCK = 500                 # buildings read from the input at a time
+PENDING = 4                 # simulations per worker submitted at a time
+
+
+def _simulate(parameters):
+    # runs in the worker processes, only the results_summary is needed
+    return simulate(**parameters, low_memory=parameters['engine'] == 'kernel')
+
+
+def _resume(output, checkpoint):
+    # simulations in the checkpoint, the output is cut to the last one
+    done, size = set(), 0
+    if os.path.exists(checkpoint):
+        with open(checkpoint, encoding='utf-8') as file:
+            for line in file:
+                fields = line.rstrip('\n').split('\t')
+                if line.endswith('\n') and len(fields) == 3:
+                    done.add((fields[0], fields[1]))
+                    size = int(fields[2])
+    if os.path.exists(output):
+        with open(output, 'r+b') as file:
+            file.truncate(size)
+    return done
+
+
+def regions(plz):
+    """
+    Parameters
+    ----------
+    plz: pd.Series of PLZ (str)
+    Returns
+    -------
+    pd.Series with the climate zone of every PLZ, NaN if the offline index cannot resolve it
+    """
+    zones = {}
+    for code in plz.unique():
+        try:
+            zones[code] = getregion(code, geocode=False)
+        except LookupError:
+            zones[code] = float('nan')
+    return plz.map(zones)
+
+
+class _Writer:
+    # output, checkpoint and errors of a run
+    def __init__(self, output, resume):
+        self.done = _resume(output, output + '.checkpoint') if resume else set()
+        mode = 'a' if resume else 'w'
+        self.output = open(output, mode, encoding='utf-8', newline='')
+        self.checkpoint = open(output + '.checkpoint', mode, encoding='utf-8')
+        self.errors = open(output + '.errors.csv', mode, encoding='utf-8', newline='')
+        if self.errors.tell() == 0:
+            self.errors.write('id,PLZ,wp_model,Fehler\n')
+        self.columns = None if self.output.tell() == 0 else pd.read_csv(output, nrows=0).columns.tolist()
+        self.counts = dict(simulated=0, cached=0, failed=0, skipped=0)
+
+    def result(self, building, summary, source):
+        frame = summary.assign(**{column: building[column] for column in BUILDING})
+        if self.columns is None:
+            self.columns = BUILDING + [column for column in summary.columns if column not in BUILDING]
+            frame[self.columns].to_csv(self.output, index=False)
+        else:
+            frame.reindex(columns=self.columns).to_csv(self.output, index=False, header=False)
+        self.output.flush()
+        self.checkpoint.write('%s\t%s\t%d\n' % (building['id'], building['wp_model'], self.output.tell()))
+        self.checkpoint.flush()
+        self.counts[source] += 1
+
+    def error(self, building, message, checkpoint):
+        pd.DataFrame([[building['id'], building['PLZ'], building.get('wp_model', ''), message]]).to_csv(
+            self.errors, index=False, header=False)
+        self.errors.flush()
+        if checkpoint:      # same result on every run
+            self.checkpoint.write('%s\t\t%d\n' % (building['id'], self.output.tell()))
+            self.checkpoint.flush()
+        self.counts['failed'] += 1
+
+    def close(self):
+        for file in (self.output, self.checkpoint, self.errors):
+            file.close()
+
+
+def run(buildings, output, workers=None, n=1, block=BLOCK, resume=False, **options):
+    """
+    Simulates all buildings of a CSV file with their best fitting heat pumps.
+    Parameters
+    ----------
+    buildings: CSV file with the columns INPUTS and optionally 'id' (default the row number)
+    output: CSV file of the results_summary of every building and heat pump
+    workers: number of processes, default os.cpu_count()
+    n: heat pumps per building
+    block: buildings read from the input at a time
+    resume: continue an interrupted run from its checkpoint
+    options: further arguments of simulate.scenario() for all buildings, e.g. resolution=15
+    Returns
+    -------
+    dict with the number of simulated, cached, failed and skipped simulations
+    """
+    workers = workers or os.cpu_count()
+    writer = _Writer(output, resume)
+    waiting = {}                # key of the simulation: future and the buildings that wait for it
+    started = time.perf_counter()
+
+    def collect():
+        finished, _ = wait([future for future, _ in waiting.values()], return_when=FIRST_COMPLETED)
+        for k in [k for k, (future, _) in waiting.items() if future in finished]:
+            future, waiters = waiting.pop(k)
+            for building in waiters:
+                if future.exception() is None:
+                    writer.result(building, future.result(), 'simulated')
+                else:
+                    writer.error(building, repr(future.exception()), checkpoint=False)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            offset = 0
+            for chunk in pd.read_csv(buildings, chunksize=block, dtype={'PLZ': str}):
+                missing = [column for column in INPUTS if column not in chunk]
+                if missing:
+                    raise ValueError('columns missing in ' + str(buildings) + ': ' + ', '.join(missing))
+                if 'id' not in chunk:
+                    chunk['id'] = range(offset, offset + len(chunk))
+                offset += len(chunk)
+                chunk['id'] = chunk['id'].astype(str)
+                plz = chunk['PLZ'].fillna('').str.strip()
+                chunk['PLZ'] = plz.where(~plz.str.isdigit(), plz.str.zfill(5))     # leading zeros lost in spreadsheets
+                chunk['standort'] = regions(chunk['PLZ'])
+                for _, building in chunk[chunk['standort'].isna()].iterrows():
+                    if (building['id'], '') not in writer.done:
+                        writer.error(building, 'no weather region', checkpoint=True)
+                chunk = chunk[chunk['standort'].notna()].astype({'standort': int}).reset_index(drop=True)
+                hp = candidates(chunk, n)
+                for row in sorted(set(range(len(chunk))) - set(hp['building'])):
+                    if (chunk.at[row, 'id'], '') not in writer.done:
+                        writer.error(chunk.loc[row], 'no fitting heat pump', checkpoint=True)
+                # in the order of the regions, the workers load the input data of a region once
+                hp = hp.join(chunk, on='building').sort_values('standort', kind='stable')
+                for _, building in hp.rename(columns={'Model': 'wp_model'}).iterrows():
+                    if (building['id'], building['wp_model']) in writer.done:
+                        writer.counts['skipped'] += 1
+                        continue
+                    parameters = scenario(*[building[column] for column in ['standort', 'E_gas', 'T_vorlauf', 'n_Personen', 'eff_tww',
+                                                                            'Baujahr', 'wp_model', 'pv_kwp', 'pv_orientation']], **options)
+                    summary = resultcache.get(parameters)
+                    if summary is not None:
+                        writer.result(building, summary, 'cached')
+                        continue
+                    k = resultcache.key(parameters)
+                    if k in waiting:
+                        waiting[k][1].append(building)
+                        continue
+                    waiting[k] = (pool.submit(_simulate, parameters), [building])
+                    while len(waiting) >= workers * PENDING:
+                        collect()
+                print('%d buildings, %s, %.0f s' % (offset, ', '.join('%d %s' % (count, name) for name, count in writer.counts.items()),
+                                                   time.perf_counter() - started), file=sys.stderr)
+            while waiting:
+                collect()
+    finally:
+        writer.close()
+    return writer.counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulates a portfolio of buildings with their best fitting heat pumps.')
+    parser.add_argument('buildings', help='CSV file with the columns ' + ', '.join(INPUTS) + ' and optionally id')
+    parser.add_argument('output', help='CSV file of the results')
+    parser.add_argument('--workers', type=int, help='number of processes (default: all cores)')
+    parser.add_argument('--candidates', type=int, default=1, help='heat pumps with the highest COP per building')
+    parser.add_argument('--block', type=int, default=BLOCK, help='buildings read at a time')
+    parser.add_argument('--resolution', type=int, choices=RESOLUTIONS, default=1, help='time step of the simulation [min]')
+    parser.add_argument('--engine', choices=['loop', 'kernel'], default='loop',
+                        help='engine of simulate(), the kernel is much faster (annual values within 0.15 %%)')
+    parser.add_argument('--resume', action='store_true', help='continue from the checkpoint of the output')
+    options = parser.parse_args()
+    counts = run(options.buildings, options.output, options.workers, options.candidates, options.block, options.resume,
+                 resolution=options.resolution, engine=options.engine)
+    print(counts, file=sys.stderr)
@@ -1,68 +1,112 @@
+import functools
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 from hplib import hplib as hpl
 import src.heatstorage as hs
+import src.kernel as kernel
+import src.climate as climate
+import src.battery as battery
+import src.datastore as datastore
+import src.resultcache as resultcache
+import src.profiling as profiling
 from bslib import bslib as bsl
 import numpy as np
 
+PARAMETERS = ['standort', 'E_gas', 'T_vorlauf', 'n_Personen', 'eff_tww', 'Baujahr', 'wp_model', 'pv_kwp', 'pv_orientation']
+RESOLUTIONS = (1, 5, 15)        # time steps [min], see simulate()
 
-def simulate(standort, E_gas, T_vorlauf, n_Personen, eff_tww, Baujahr, wp_model, pv_kwp ,pv_orientation):
-    TRJ=pd.read_csv('src/simulation_data/TRJ-Tabelle.csv').head(15)# average year
-    weather=pd.read_csv('src/simulation_data/weather/weather_'+str(standort)+'_a_2015_1min.csv') 
-    photovoltaic = pd.read_csv('src/simulation_data/pv/pv_' + str(standort)+'_a_2015_1min.csv', header=0, index_col=0)
-    photovoltaic=photovoltaic*pv_kwp
-    P_el_hh=pd.read_csv('src/simulation_data/electrical_load/existing_house.csv')
-    P_tww_load=pd.read_csv('src/simulation_data/dhw_load/dhw_'+str(n_Personen)+'.csv',index_col=0)
-    P_tww_load.index=weather.index
+
+@functools.lru_cache(maxsize=256)
+def heatpump_parameters(wp_model):
+    """
+    hplib.get_parameters() of a model, hplib reads its database on every call.
+    Returns
+    -------
+    pd.DataFrame, shared by all callers: do not modify
+    """
+    return hpl.get_parameters(wp_model)
+
+def scenario(standort, E_gas, T_vorlauf, n_Personen, eff_tww, Baujahr, wp_model, pv_kwp, pv_orientation, engine='loop', battery_sizes=None, resolution=1, year=2015, year_type='a'):
+    """
+    All parameters of a simulation including the defaults of simulate(), as used by the result cache.
+    Returns
+    -------
+    dict
+    """
+    if battery_sizes is None:
+        battery_sizes = battery.SIZES
+    return dict(standort=standort, E_gas=E_gas, T_vorlauf=T_vorlauf, n_Personen=n_Personen, eff_tww=eff_tww,
+                Baujahr=Baujahr, wp_model=wp_model, pv_kwp=pv_kwp, pv_orientation=pv_orientation, engine=engine,
+                battery_sizes=list(battery_sizes), resolution=resolution, year=year, year_type=year_type)
+
+
+def thermal(standort, E_gas, T_vorlauf, n_Personen, eff_tww, Baujahr, wp_model, engine='loop', resolution=1, cache=True, low_memory=False, year=2015, year_type='a', profile=None):
+    """
+    Thermal stage of simulate(): heat pump, storages and the electrical load of the
+    building, which do not depend on PV and battery. The result is cached, so
+    variants with other PV systems or batteries only run the electrical stage.
+    Parameters
+    ----------
+    as in simulate(), profile: profiling.Profile to record the stages into
+    Returns
+    -------
+    dict with the means of kernel.SUMS [W or °C] except P_el_gesamt, which is the series (np.ndarray, float32) [W], rods (heating rod
+    of the heat pump, see kernel.accumulate()), runtime [steps], E_heizstab_h_storage and
+    E_heizstab_tww_storage [Wh], gtz, group_id and P_th_ref of the heat pump [W]
+    """
+    parameters = dict(stage='thermal', standort=standort, E_gas=E_gas, T_vorlauf=T_vorlauf, n_Personen=n_Personen,
+                      eff_tww=eff_tww, Baujahr=Baujahr, wp_model=wp_model, engine=engine,
+                      resolution=resolution, year=year, year_type=year_type)
+    profile = profiling.get(profile)
+    if cache:
+        profile.enter('cache')
+        stage = resultcache.get_arrays(parameters, intermediate=True)
+        if stage is not None:
+            profile.count('thermal stage from cache')
+            return stage
+    profile.enter('inputs')
+    TRJ=datastore.trj(standort, year, year_type)# test reference year, default average year 2015
+    P_el_hh=datastore.resample(datastore.electrical_load(standort, low_energy_house=Baujahr>2015), resolution)
+    P_tww_load=datastore.resample(datastore.dhw_load(n_Personen), resolution)
     #calc loads 
     eff_heiz=0.9                #average from DIN EN 12831 Tabelle 38
-
-    if Baujahr<=2000:           
-        if Baujahr<=1995:
-            eff_heiz=0.85       #average from DIN EN 12831 Tabelle 38
-        Heizgrenztemperatur=15  #IWU Heizgrenztemperatur 
-        gtz=TRJ.iloc[standort-1,11]
-    elif Baujahr>2015:
-        Heizgrenztemperatur=10
-        gtz=TRJ.iloc[standort-1,12]
-        P_el_hh=pd.read_csv('src/simulation_data/electrical_load/low_energy_house.csv')
+    if Baujahr<=1995:
+        eff_heiz=0.85           #average from DIN EN 12831 Tabelle 38
+    Heizgrenztemperatur=climate.heating_limit(Baujahr)     #IWU Heizgrenztemperatur
+    gtz=TRJ[climate.DEGREE_DAYS[Heizgrenztemperatur]]
+    if engine == 'kernel':
+        climate_profiles = climate.profiles(standort, T_vorlauf, Heizgrenztemperatur, resolution, year, year_type)
     else:
-        Heizgrenztemperatur=12
-        gtz=TRJ.iloc[standort-1,10]
+        weather=pd.DataFrame({column: datastore.resample(values, resolution)
+                              for column, values in datastore.weather(standort, year, year_type).items()})
     E_TWW=(14.9*30*n_Personen)/eff_tww
     E_Heiz=(E_gas-E_TWW)* eff_heiz * 1000
-    P_tww_load['load [W]']=P_tww_load['load [W]']+((E_TWW)-((P_tww_load.mean()*8.76)[1]))/8.76 #calibrate to calculated consumption
+    P_tww_load=P_tww_load+((E_TWW)-(P_tww_load.mean()*8.76))/8.76 #calibrate to calculated consumption
     #define simulation parameters
-    HeatPump = hpl.HeatPump(hpl.get_parameters(wp_model))
+    HeatPump = hpl.HeatPump(heatpump_parameters(wp_model))
     group_id=HeatPump.group_id
     P_th_ref=HeatPump.p_th_ref
-    if T_vorlauf<55:
-        t_hs_set=0.85*T_vorlauf-1.75
-        f_hs_exp=1.1
-    else:
-        t_hs_set=2*T_vorlauf/3+8+1/3
-        f_hs_exp=1.3
-    HS=hpl.HeatingSystem(TRJ.iloc[standort-1,9],20,[T_vorlauf,t_hs_set],1,f_hs_exp)
+    HS=climate.heating_system(TRJ['T_min_ref'],T_vorlauf)
     HeatStorage_tww=hs.HeatStorage(Volume=300,ambient_temperature=15)
     HeatStorage_h=hs.HeatStorage(Volume=300,ambient_temperature=15)
-    batteries = pd.DataFrame([['SG1', 0.0, 0.0],['SG1', 1.0, 0.5],['SG1', 2.0, 1.0],['SG1', 3.0, 1.5],['SG1', 4.0, 2.0],
-                            ['SG1', 5.0, 2.5],['SG1', 6.0, 3.0], ['SG1', 7.0, 3.5], ['SG1', 8.0, 4.0],['SG1', 9.0, 4.5],
-                          ['SG1', 10.0, 5.0]],
-                         columns=['system_id', 'e_bat', 'p_inv']
-                         )
     T_sp_tww = 50               # Temperatur beim Start in °C
     P_hp_h = 0                  # Leistung der Wärmepumpe für Heizung beim Start in W
     P_hp_tww = 0                # Leistung der Wärmepumpe für TWW beim Start in W
     hyst_h = 0                  # Hysterese-Schalter Heizung
     hyst_tww = 0                # Hysterese-Schalter Heizung
-    T_sp_h,_=HS.calc_heating_dist_temp(weather.at[0, 'temperature 24h [degC]'])            # Soll-Temperatur
+    if engine == 'kernel':
+        T_sp_h = climate_profiles['T_vl'][0]                                                # Soll-Temperatur
+    else:
+        T_sp_h,_=HS.calc_heating_dist_temp(weather.at[0, 'temperature 24h [degC]'])        # Soll-Temperatur
     T_sp_tww_set = 47           # Soll-Temperatur
-    dt = 60                     # Zeitschrittweite in s
+    dt = 60*resolution          # Zeitschrittweite in s
     T_hyst = 3                  # Hysterese-Temperatur in thermischen Speichern
     runtime = 0                 # Laufzeit der Wärmepumpe
-    heizlänge = 0               # Länge von Load
     E_heizstab_tww_storage = 0  # Energie vom Heizstab im Tww-Storage
     E_heizstab_h_storage = 0    # Energie vom Heizstab im Heating-Storage
-    results_timeseries = pd.DataFrame(index=photovoltaic.index)
+    results_timeseries = pd.DataFrame(index=pd.RangeIndex(len(P_el_hh)))
     # Timeseries Results
     T_SP_h = []
     T_SP_h_set = []
@@ -80,141 +124,272 @@ def simulate(standort, E_gas, T_vorlauf, n_Personen, eff_tww, Baujahr, wp_model,
     T_HP_in = []
     T_AMB_avg_24h = []
 
-    for t in weather.index:
-        temp=weather.at[t, 'temperature 24h [degC]']
-        if temp < Heizgrenztemperatur:
-            P_load_h_th=((20-temp)*E_Heiz/(gtz*24))
-        else:
-            P_load_h_th=0
-        P_load_tww_th = P_tww_load.at[t,'load [W]']
-        T_vl,T_rl = HS.calc_heating_dist_temp(weather.at[t, 'temperature 24h [degC]'])
-        T_sp_h_set = T_vl
-        T_hp_brine = HS.calc_brine_temp(weather.at[t, 'temperature 24h [degC]'])
-        T_amb = weather.at[t, 'temperature [degC]']
-        T_amb_24h = weather.at[t, 'temperature 24h [degC]']
+    profile.enter('thermal')
+    if engine == 'kernel':
         if group_id == 1 or group_id == 4:
-            T_hp_in = T_amb
-        elif group_id==2 or group_id==5:
-            T_hp_in = T_hp_brine
+            T_hp_in = climate_profiles['T_amb']
         else:
-            print('No Simulation for Water/Water HP')
-        # Trinkwarmwasser: Regelung
-        if T_sp_tww < T_sp_tww_set and hyst_tww == 0:
-            hyst_tww = 1
-        if T_sp_tww < T_sp_tww_set+T_hyst and hyst_tww == 1:
-            HP_tww = HeatPump.simulate(t_in_primary=T_hp_in,
-                                        t_in_secondary=T_sp_tww,
-                                        t_amb=T_amb_24h)
-            P_hp_tww_th = HP_tww['P_th']
-            P_hp_tww_el = HP_tww['P_el']
-            cop_tww = HP_tww['COP']
-            runtime = runtime+1
+            T_hp_in = climate_profiles['T_brine']
+        if low_memory:
+            mean, rods, P_el_gesamt, runtime, E_heizstab_h_storage, E_heizstab_tww_storage = kernel.accumulate(
+                climate_profiles['P_load_h_unit']*E_Heiz, P_tww_load,
+                climate_profiles['T_vl'], T_hp_in, climate_profiles['T_amb_24h'], P_el_hh,
+                kernel.heatpump_parameters(HeatPump), HeatStorage_h, HeatStorage_tww,
+                T_sp_h, T_sp_tww, T_sp_tww_set, T_hyst, dt)
         else:
-            hyst_tww = 0
-            P_hp_tww_th = 0
-            P_hp_tww_el = 0
-            cop_tww = 0
+            out, runtime, E_heizstab_h_storage, E_heizstab_tww_storage = kernel.run(
+                climate_profiles['P_load_h_unit']*E_Heiz, P_tww_load,
+                climate_profiles['T_vl'], T_hp_in, climate_profiles['T_amb_24h'],
+                kernel.heatpump_parameters(HeatPump), HeatStorage_h, HeatStorage_tww,
+                T_sp_h, T_sp_tww, T_sp_tww_set, T_hyst, dt)
+            for column, values in zip(kernel.COLUMNS, out):
+                results_timeseries[column] = values
+    else:
+        for t in weather.index:
+            temp=weather.at[t, 'temperature 24h [degC]']
+            if temp < Heizgrenztemperatur:
+                P_load_h_th=((20-temp)*E_Heiz/(gtz*24))
+            else:
+                P_load_h_th=0
+            P_load_tww_th = P_tww_load[t]
+            T_vl,T_rl = HS.calc_heating_dist_temp(weather.at[t, 'temperature 24h [degC]'])
+            T_sp_h_set = T_vl
+            T_hp_brine = HS.calc_brine_temp(weather.at[t, 'temperature 24h [degC]'])
+            T_amb = weather.at[t, 'temperature [degC]']
+            T_amb_24h = weather.at[t, 'temperature 24h [degC]']
+            if group_id == 1 or group_id == 4:
+                T_hp_in = T_amb
+            elif group_id==2 or group_id==5:
+                T_hp_in = T_hp_brine
+            else:
+                print('No Simulation for Water/Water HP')
+            # Trinkwarmwasser: Regelung
+            if T_sp_tww < T_sp_tww_set and hyst_tww == 0:
+                hyst_tww = 1
+            if T_sp_tww < T_sp_tww_set+T_hyst and hyst_tww == 1:
+                HP_tww = HeatPump.simulate(t_in_primary=T_hp_in,
+                                            t_in_secondary=T_sp_tww,
+                                            t_amb=T_amb_24h)
+                P_hp_tww_th = HP_tww['P_th']
+                P_hp_tww_el = HP_tww['P_el']
+                cop_tww = HP_tww['COP']
+                runtime = runtime+1
+            else:
+                hyst_tww = 0
+                P_hp_tww_th = 0
+                P_hp_tww_el = 0
+                cop_tww = 0
 
-        # Trinkwarmwasser: Speichertemperatur
-        T_sp_tww = HeatStorage_tww.calculate_new_storage_temperature(T_sp=T_sp_tww,
-                                                                        dt=dt,
-                                                                        P_hp=P_hp_tww_th,
-                                                                        P_ld=P_load_tww_th)
-        if T_sp_tww < T_sp_tww_set-5:
-            E_heizstab_tww_storage = E_heizstab_tww_storage + P_th_ref / 60
-            T_sp_tww = T_sp_tww + \
-                (1/(HeatStorage_tww.V_sp*HeatStorage_tww.c_w)
-                    ) * P_th_ref * dt
-            P_HEIZSTAB_tww.append(P_th_ref)
-        else:
-            P_HEIZSTAB_tww.append(0)
+            # Trinkwarmwasser: Speichertemperatur
+            T_sp_tww = HeatStorage_tww.calculate_new_storage_temperature(T_sp=T_sp_tww,
+                                                                            dt=dt,
+                                                                            P_hp=P_hp_tww_th,
+                                                                            P_ld=P_load_tww_th)
+            if T_sp_tww < T_sp_tww_set-5:
+                E_heizstab_tww_storage = E_heizstab_tww_storage + P_th_ref * dt / 3600
+                T_sp_tww = T_sp_tww + \
+                    (1/(HeatStorage_tww.V_sp*HeatStorage_tww.c_w)
+                        ) * P_th_ref * dt
+                P_HEIZSTAB_tww.append(P_th_ref)
+            else:
+                P_HEIZSTAB_tww.append(0)
+
+            # Heizung: Regelung
+            if T_sp_h < T_sp_h_set and hyst_h == 0 and hyst_tww == 0:
+                hyst_h = 1
+
+            if T_sp_h < T_sp_h_set+T_hyst and hyst_h == 1 and hyst_tww == 0:
+
+                HP_h = HeatPump.simulate(t_in_primary=T_hp_in,
+                                            t_in_secondary=T_sp_h,
+                                            t_amb=T_amb_24h,
+                                            p_th_min=P_load_h_th*1.5)
 
-        # Heizung: Regelung
-        if T_sp_h < T_sp_h_set and hyst_h == 0 and hyst_tww == 0:
-            hyst_h = 1
+                P_hp_h_th = HP_h['P_th']
+                P_hp_h_el = HP_h['P_el']
+                cop_h = HP_h['COP']
 
-        if T_sp_h < T_sp_h_set+T_hyst and hyst_h == 1 and hyst_tww == 0:
+                if P_load_h_th > 0:
+                    f_power = (P_hp_h_th / (P_load_h_th + 500))
+                else:
+                    f_power = 1
 
-            HP_h = HeatPump.simulate(t_in_primary=T_hp_in,
-                                        t_in_secondary=T_sp_h,
-                                        t_amb=T_amb_24h,
-                                        p_th_min=P_load_h_th*1.5)
+                if f_power < 1:
+                    P_hp_h_th = (P_hp_h_th / f_power) * 1.1
+                    P_hp_h_el = (P_hp_h_el / f_power) * 1.1
 
-            P_hp_h_th = HP_h['P_th']
-            P_hp_h_el = HP_h['P_el']
-            cop_h = HP_h['COP']
+                runtime = runtime+1
 
-            if P_load_h_th > 0:
-                f_power = (P_hp_h_th / (P_load_h_th + 500))
             else:
-                f_power = 1
+                hyst_h = 0
+                P_hp_h_th = 0
+                P_hp_h_el = 0
+                cop_h = 0
+                T_delta = 0
 
-            if f_power < 1:
-                P_hp_h_th = (P_hp_h_th / f_power) * 1.1
-                P_hp_h_el = (P_hp_h_el / f_power) * 1.1
+            # Heizung: Speichertemperaturen
+            T_sp_h = HeatStorage_h.calculate_new_storage_temperature(T_sp=T_sp_h,
+                                                                        dt=dt,
+                                                                        P_hp=P_hp_h_th,
+                                                                        P_ld=P_load_h_th)
+            if T_sp_h < T_sp_h_set-5:
+                E_heizstab_h_storage = E_heizstab_h_storage + P_th_ref * dt / 3600
+                T_sp_h = T_sp_h + \
+                    (1/(HeatStorage_h.V_sp*HeatStorage_h.c_w)) * \
+                    P_th_ref * dt
+                P_HEIZSTAB_h.append(P_th_ref)
+            else:
+                P_HEIZSTAB_h.append(0)
 
-            runtime = runtime+1
+            # Abspeichern relevanter Werte
+            T_SP_h.append(T_sp_h)
+            T_SP_h_set.append(T_sp_h_set)
+            T_HP_in.append(T_hp_in)
+            T_AMB_avg_24h.append(
+                weather.at[t, 'temperature 24h [degC]'])
+            T_SP_tww.append(T_sp_tww)
+            P_LOAD_h.append(P_load_h_th)
+            P_LOAD_tww.append(P_load_tww_th)
+            P_HP_h_th.append(P_hp_h_th)
+            P_HP_tww_th.append(P_hp_tww_th)
+            P_HP_h_el.append(P_hp_h_el)
+            P_HP_tww_el.append(P_hp_tww_el)
+            COP_h.append(cop_h)
+            COP_tww.append(cop_tww)
+
+        results_timeseries['T_sp_h'] = T_SP_h
+        results_timeseries['T_sp_h_set'] = T_SP_h_set
+        results_timeseries['T_hp_in'] = T_HP_in
+        results_timeseries['T_amb_avg_24h'] = T_AMB_avg_24h
+        results_timeseries['T_sp_tww'] = T_SP_tww
+        results_timeseries['P_load_h'] = P_LOAD_h
+        results_timeseries['P_load_tww'] = P_LOAD_tww
+        results_timeseries['P_hp_h_th'] = P_HP_h_th
+        results_timeseries['P_hp_tww_th'] = P_HP_tww_th
+        results_timeseries['P_hp_h_el'] = P_HP_h_el
+        results_timeseries['P_Heizstab_h'] = P_HEIZSTAB_h
+        results_timeseries['P_hp_tww_el'] = P_HP_tww_el
+        results_timeseries['P_Heizstab_tww'] = P_HEIZSTAB_tww
+        results_timeseries['COP_h'] = COP_h
+        results_timeseries['COP_tww'] = COP_tww
+    profile.count('time steps', len(P_el_hh))
+    profile.count('heat pump evaluations', runtime)     # HeatPump.simulate() calls of the loop engine
+    if not low_memory:
+        profile.enter('time series')
+        # Gesamtstromverbrauch Gebäude
+        P_el_gesamt = (results_timeseries['P_hp_h_el'] + \
+            results_timeseries['P_hp_tww_el'] + \
+            P_el_hh + \
+            results_timeseries['P_Heizstab_h'] + \
+            results_timeseries['P_Heizstab_tww']).values
+        # Mittelwerte wie in kernel.accumulate()
+        mean = {column: results_timeseries[column].mean() for column in kernel.SUMS[:-1]}
+        # Heizstab der Wärmepumpe (COP 1): Zeitschritte und Leistung
+        rods = []
+        for cop, p_th in (('COP_h', 'P_hp_h_th'), ('COP_tww', 'P_hp_tww_th')):
+            P_heizstab = results_timeseries.loc[results_timeseries[cop] == 1, p_th]
+            rods += [len(P_heizstab), P_heizstab.iloc[0] if len(P_heizstab) else 0]
+    # float32 is precise to a few mW here and halves the cached stage, a new stage is rounded the same way
+    # so that the results do not depend on whether it came from the cache
+    stage = dict(mean, P_el_gesamt=P_el_gesamt.astype(np.float32), rods=np.asarray(rods, dtype=float),
+                 runtime=runtime, E_heizstab_h_storage=E_heizstab_h_storage,
+                 E_heizstab_tww_storage=E_heizstab_tww_storage, gtz=gtz, group_id=group_id, P_th_ref=P_th_ref)
+    if cache:
+        profile.enter('cache')
+        resultcache.put_arrays(parameters, stage, compressed=True, intermediate=True)
+    return stage
 
-        else:
-            hyst_h = 0
-            P_hp_h_th = 0
-            P_hp_h_el = 0
-            cop_h = 0
-            T_delta = 0
-
-        # Heizung: Speichertemperaturen
-        T_sp_h = HeatStorage_h.calculate_new_storage_temperature(T_sp=T_sp_h,
-                                                                    dt=dt,
-                                                                    P_hp=P_hp_h_th,
-                                                                    P_ld=P_load_h_th)
-        if T_sp_h < T_sp_h_set-5:
-            E_heizstab_h_storage = E_heizstab_h_storage + P_th_ref / 60
-            T_sp_h = T_sp_h + \
-                (1/(HeatStorage_h.V_sp*HeatStorage_h.c_w)) * \
-                P_th_ref * dt
-            P_HEIZSTAB_h.append(P_th_ref)
-        else:
-            P_HEIZSTAB_h.append(0)
-
-        # Abspeichern relevanter Werte
-        T_SP_h.append(T_sp_h)
-        T_SP_h_set.append(T_sp_h_set)
-        T_HP_in.append(T_hp_in)
-        T_AMB_avg_24h.append(
-            weather.at[t, 'temperature 24h [degC]'])
-        T_SP_tww.append(T_sp_tww)
-        P_LOAD_h.append(P_load_h_th)
-        P_LOAD_tww.append(P_load_tww_th)
-        P_HP_h_th.append(P_hp_h_th)
-        P_HP_tww_th.append(P_hp_tww_th)
-        P_HP_h_el.append(P_hp_h_el)
-        P_HP_tww_el.append(P_hp_tww_el)
-        COP_h.append(cop_h)
-        COP_tww.append(cop_tww)
-
-    results_timeseries['T_sp_h'] = T_SP_h
-    results_timeseries['T_sp_h_set'] = T_SP_h_set
-    results_timeseries['T_hp_in'] = T_HP_in
-    results_timeseries['T_amb_avg_24h'] = T_AMB_avg_24h
-    results_timeseries['T_sp_tww'] = T_SP_tww
-    results_timeseries['P_load_h'] = P_LOAD_h
-    results_timeseries['P_load_tww'] = P_LOAD_tww
-    results_timeseries['P_hp_h_th'] = P_HP_h_th
-    results_timeseries['P_hp_tww_th'] = P_HP_tww_th
-    results_timeseries['P_hp_h_el'] = P_HP_h_el
-    results_timeseries['P_Heizstab_h'] = P_HEIZSTAB_h
-    results_timeseries['P_hp_tww_el'] = P_HP_tww_el
-    results_timeseries['P_Heizstab_tww'] = P_HEIZSTAB_tww
-    results_timeseries['COP_h'] = COP_h
-    results_timeseries['COP_tww'] = COP_tww
-    # Gesamtstromverbrauch Gebäude
-    results_summary=pd.DataFrame()
-    P_el_gesamt = results_timeseries['P_hp_h_el'] + \
-        results_timeseries['P_hp_tww_el'] + \
-        P_el_hh[str(standort)].values + \
-        results_timeseries['P_Heizstab_h'] + \
-        results_timeseries['P_Heizstab_tww']
 
+def simulate(standort, E_gas, T_vorlauf, n_Personen, eff_tww, Baujahr, wp_model, pv_kwp ,pv_orientation, engine='loop', battery_sizes=None, resolution=1, cache=True, low_memory=False, grid_series=False, year=2015, year_type='a', profile=None):
+    # engine: 'loop' is the original step by step reference implementation, 'kernel' runs the thermal
+    #         simulation on numpy arrays (src/kernel.py) and all battery sizes in lockstep (src/battery.py),
+    #         the annual values differ from the loop by up to 0.15 % (tests/test_engines.py)
+    if engine not in ('kernel', 'loop'):
+        raise ValueError("engine must be 'kernel' or 'loop'")
+    # battery_sizes: battery capacities in kWh, 0 for no battery, default battery.SIZES
+    if battery_sizes is None:
+        battery_sizes = battery.SIZES
+    # resolution: time step in minutes, 5 or 15 average the 1-minute inputs for a fast screening of
+    #             many variants, see README for the accuracy. Longer steps are rejected: the storages
+    #             are updated with explicit Euler steps, which overshoot with 60 minutes
+    if resolution not in RESOLUTIONS:
+        raise ValueError('resolution must be 1, 5 or 15 minutes')
+    # cache: return the result of an identical earlier simulation and save new results (src/resultcache.py)
+    # low_memory: accumulate sums and maxima in one pass instead of keeping the time series (kernel.accumulate()),
+    #             a few MB instead of ~200 MB per simulation, same results except for rounding, kernel only
+    if low_memory and engine != 'kernel':
+        raise ValueError("low_memory requires engine='kernel'")
+    # grid_series: save the hourly grid supply and feed-in of every battery size for tariff
+    #              evaluations (src/tariffs.py), even with cache=False
+    # year, year_type: test reference year, see datastore.trj() and simulate_years()
+    # profile: True or a profiling.Profile, records time, calls and memory of the stages and
+    #          returns (results_summary, profile), see src/profiling.py
+    profiler = profiling.get(profile)
+    profiler.start()
+    parameters = scenario(standort, E_gas, T_vorlauf, n_Personen, eff_tww, Baujahr, wp_model, pv_kwp, pv_orientation,
+                          engine, battery_sizes, resolution, year, year_type)
+    if cache:
+        profiler.enter('cache')
+        results_summary = resultcache.get(parameters)
+        if results_summary is not None and not (grid_series and not resultcache.contains(dict(parameters, stage='grid'), arrays=True)):
+            profiler.count('results from cache')
+            profiler.stop()
+            return (results_summary, profiler) if profile else results_summary
+    stage = thermal(standort, E_gas, T_vorlauf, n_Personen, eff_tww, Baujahr, wp_model, engine,
+                    resolution, cache, low_memory, year, year_type, profiler)
+    profiler.enter('pv')
+    # Elektrische Stufe: PV, Batterien, Netz
+    P_el_gesamt = stage['P_el_gesamt'].astype(np.float64)
+    mean = dict(stage)
+    gtz, group_id, P_th_ref, rods = stage['gtz'], stage['group_id'], stage['P_th_ref'], stage['rods']
+    runtime, E_heizstab_h_storage, E_heizstab_tww_storage = \
+        stage['runtime'], stage['E_heizstab_h_storage'], stage['E_heizstab_tww_storage']
+    heizlänge = 0               # Länge von Load
+    dt = 60*resolution          # Zeitschrittweite in s
+    P_pv=datastore.resample(datastore.pv(standort, year, year_type)[pv_orientation], resolution)*pv_kwp
+    mean['P_el_gesamt'] = P_el_gesamt.mean()
+    mean['P_pv'] = P_pv.mean()
+    mean['P_du'] = np.minimum(P_el_gesamt, P_pv).mean()
+    batteries = pd.DataFrame({'system_id': 'SG1', 'e_bat': np.asarray(battery_sizes, dtype=float)})
+    batteries['p_inv'] = batteries['e_bat']*battery.C_RATE   # kW
+    # Netzbezug, Netzeinspeisung
+    P_diff = P_pv-P_el_gesamt
+    profiler.enter('battery')
+    profiler.count('battery sizes', len(batteries))
+    if low_memory:
+        balance, hourly = battery.balance(P_diff, batteries['e_bat'].values, batteries['p_inv'].values, dt)
+    else:
+        if engine == 'kernel':
+            P_BS = battery.simulate(P_diff, batteries['e_bat'].values, batteries['p_inv'].values, dt)
+        balance, hourly = [], []
+        for idx in batteries.index:
+            if batteries['e_bat'][idx] == 0.0:
+                BAT_P_bs = np.zeros(len(P_diff))
+            elif engine == 'kernel':
+                BAT_P_bs = P_BS[idx]
+            else:
+                BAT_P_bs = []
+                BAT = bsl.ACBatMod(system_id=batteries['system_id'][idx],
+                                    p_inv_custom=batteries['p_inv'][idx]*1000,   # bslib expects W
+                                    e_bat_custom=batteries['e_bat'][idx])
+                res = BAT.simulate(p_load=0, soc=0, dt=dt)
+                profiler.count('ACBatMod.simulate', len(P_diff))
+                for p_diff in P_diff:
+                    res = BAT.simulate(p_load=p_diff, soc=res[2], dt=dt)
+                    BAT_P_bs.append(res[0])
+                BAT_P_bs=np.asarray(BAT_P_bs)
+            P_gs = np.minimum(0, (P_diff-BAT_P_bs))
+            P_gf = np.maximum(0, (P_diff-BAT_P_bs))
+            balance.append([P_gs.mean(), P_gf.mean(), np.maximum(0, BAT_P_bs).mean(), np.minimum(0, BAT_P_bs).mean(),
+                            np.mean(np.reshape(P_gs*-1, (8760, -1)), 1).max(),  # maximaler Netzbezug Mittelwert über eine Stunde
+                            np.mean(np.reshape(P_gs*-1, (365, -1)), 1).max()])  # maximaler Netzbezug Mittelwert über einen Tag
+            if grid_series:
+                hourly.append([np.mean(np.reshape(P_gs*-1, (8760, -1)), 1), np.mean(np.reshape(P_gf, (8760, -1)), 1)])
+        balance = np.array(balance)
+        hourly = np.array(hourly)
+
+    profiler.enter('kpi')
+    results_summary=pd.DataFrame()
     if group_id == 1 or group_id == 4:
         wpkategorie = 'L/W'
     else:
@@ -224,62 +399,23 @@ def simulate(standort, E_gas, T_vorlauf, n_Personen, eff_tww, Baujahr, wp_model,
     else:
         wptyp = 'geregelt'
 
-    E_load_th = (
-        results_timeseries['P_load_tww']+results_timeseries['P_load_h']).mean()*8.76
-
-    E_hp_h_th = results_timeseries['P_hp_h_th'].mean()*8.76 + \
-        results_timeseries['P_Heizstab_h'].mean()*8.76
-    E_hp_tww_th = results_timeseries['P_hp_tww_th'].mean()*8.76 + \
-        results_timeseries['P_Heizstab_tww'].mean()*8.76
-    E_hp_h_el = results_timeseries['P_hp_h_el'].mean()*8.76 + \
-        results_timeseries['P_Heizstab_h'].mean()*8.76
-    E_hp_tww_el = results_timeseries['P_hp_tww_el'].mean()*8.76 + \
-        results_timeseries['P_Heizstab_tww'].mean()*8.76
+    E_load_th = (mean['P_load_tww']+mean['P_load_h'])*8.76
+
+    E_hp_h_th = mean['P_hp_h_th']*8.76 + mean['P_Heizstab_h']*8.76
+    E_hp_tww_th = mean['P_hp_tww_th']*8.76 + mean['P_Heizstab_tww']*8.76
+    E_hp_h_el = mean['P_hp_h_el']*8.76 + mean['P_Heizstab_h']*8.76
+    E_hp_tww_el = mean['P_hp_tww_el']*8.76 + mean['P_Heizstab_tww']*8.76
     # Gesamtstromverbrauch Wärmepumpe
     E_hp_el = E_hp_tww_el + E_hp_h_el
 
     # Energiebilanz des Heizstabs
-    P_heizstab_tww = results_timeseries.loc[results_timeseries['COP_tww']
-                                            == 1, 'P_hp_tww_th']
-    try:
-        E_heizstab_tww = P_heizstab_tww[0] / \
-            1000 * (len(P_heizstab_tww) / 60)
-    except:
-        E_heizstab_tww = 0
-    P_heizstab_h = results_timeseries.loc[results_timeseries['COP_h']
-                                            == 1, 'P_hp_h_th']
-    try:
-        E_heizstab_h = P_heizstab_h[0] / \
-            1000 * (len(P_heizstab_h) / 60)
-    except:
-        E_heizstab_h = 0
+    E_heizstab_h = rods[1] / 1000 * (rods[0] * dt / 3600)
+    E_heizstab_tww = rods[3] / 1000 * (rods[2] * dt / 3600)
     E_heizstab = E_heizstab_h + E_heizstab_tww + \
         (E_heizstab_h_storage + E_heizstab_tww_storage)/1000
     reihe=0
-    # Netzbezug, Netzeinspeisung
-    P_diff = (photovoltaic[pv_orientation]-P_el_gesamt).values
     for idx in batteries.index:
-        BAT_soc = []
-        BAT_P_bs = []
-
-        BAT = bsl.ACBatMod(system_id=batteries['system_id'][idx],
-                            p_inv_custom=batteries['p_inv'][idx],
-                            e_bat_custom=batteries['e_bat'][idx])
-        if batteries['e_bat'][idx] == 0.0:
-            P_gs = np.minimum(0, P_diff)
-            P_gf = np.maximum(0, P_diff)
-            P_du = np.minimum(P_el_gesamt, photovoltaic[pv_orientation])
-        else:
-            res = BAT.simulate(p_load=0, soc=0, dt=dt)
-            for p_diff in P_diff:
-                res = BAT.simulate(p_load=p_diff, soc=res[2], dt=dt)
-                BAT_soc.append(res[2])
-                BAT_P_bs.append(res[0])
-            BAT_soc=np.asarray(BAT_soc)
-            BAT_P_bs=np.asarray(BAT_P_bs)
-            P_gs = np.minimum(0, (P_diff-BAT_P_bs))
-            P_gf = np.maximum(0, (P_diff-BAT_P_bs))
-
+        P_gs, P_gf, P_bc, P_bd, P_gs_avg_max_1h, P_gs_avg_max_24h = balance[idx]
         # Wetterbedingungen
         # 1,2,3,..
         results_summary.loc[reihe, 'Standort'] = standort
@@ -288,29 +424,27 @@ def simulate(standort, E_gas, T_vorlauf, n_Personen, eff_tww, Baujahr, wp_model,
                             'Gradtagszahlen'] = gtz
         # Gebäudeenergien
         # Neubau / Altbau
-        results_summary.loc[reihe, 'E_load_h'] = results_timeseries['P_load_h'].mean()*8.76  # kWh im Jahr
-        results_summary.loc[reihe, 'E_load_tww'] = results_timeseries['P_load_tww'].mean()*8.76
+        results_summary.loc[reihe, 'E_load_h'] = mean['P_load_h']*8.76  # kWh im Jahr
+        results_summary.loc[reihe, 'E_load_tww'] = mean['P_load_tww']*8.76
         # Gesamtstromsverbrauch
-        results_summary.loc[reihe, 'E_el_gesamt'] = P_el_gesamt.mean()*8.76
+        results_summary.loc[reihe, 'E_el_gesamt'] = mean['P_el_gesamt']*8.76
         # grid feed-in
-        results_summary.loc[reihe, 'E_gf'] = P_gf.mean()*8.76
-        results_summary.loc[reihe, 'E_gs'] = P_gs.mean()*-8.76  # grid supply
+        results_summary.loc[reihe, 'E_gf'] = P_gf*8.76
+        results_summary.loc[reihe, 'E_gs'] = P_gs*-8.76  # grid supply
         # z.B. 0.562 -> Eigenversorgung / Gesamtstromverbrauch
         results_summary.loc[reihe, 'Autarkiegrad'] = round(
-            1-((P_gs.mean()*-8.76)/(P_el_gesamt.mean()*8.76)), 3)
-        results_summary.loc[reihe, 'P_gs_avg_max_1h'] = np.mean(np.reshape(
-            P_gs*-1, (8760, 60)), 1).max()  # maximaler Netzbezug Mittelwert über eine Stunde
-        results_summary.loc[reihe, 'P_gs_avg_max_24h'] = np.mean(np.reshape(
-            P_gs*-1, (365, 1440)), 1).max()  # maximaler Netzbezug Mittelwert über einen Tag
+            1-((P_gs*-8.76)/(mean['P_el_gesamt']*8.76)), 3)
+        results_summary.loc[reihe, 'P_gs_avg_max_1h'] = P_gs_avg_max_1h  # maximaler Netzbezug Mittelwert über eine Stunde
+        results_summary.loc[reihe, 'P_gs_avg_max_24h'] = P_gs_avg_max_24h  # maximaler Netzbezug Mittelwert über einen Tag
         # Wärmepumpe
         # Generic/LW100...
-        results_summary.loc[reihe, 'WP-Hersteller'] = hpl.get_parameters(wp_model).Manufacturer.values[0]
+        results_summary.loc[reihe, 'WP-Hersteller'] = heatpump_parameters(wp_model).Manufacturer.values[0]
         results_summary.loc[reihe, 'WP-Name'] = wp_model
         # L/W / S/W
         results_summary.loc[reihe,
                             'WP-Katergorie'] = wpkategorie
         # Laufzeit in h
-        results_summary.loc[reihe, 'WP-Laufzeit'] = runtime/60
+        results_summary.loc[reihe, 'WP-Laufzeit'] = runtime*dt/3600
         results_summary.loc[reihe, 'Heizlänge'] = heizlänge
         # einstufig / inverter
         results_summary.loc[reihe, 'WP-Typ'] = wptyp
@@ -332,28 +466,127 @@ def simulate(standort, E_gas, T_vorlauf, n_Personen, eff_tww, Baujahr, wp_model,
         # Anteil Heizstab in % der Wärmepumpen-Produktion
         results_summary.loc[reihe, 'f_heizstab'] = round(E_heizstab/(E_hp_h_th+E_hp_tww_th), 3)
         # Wärmspeicher
-        results_summary.loc[reihe, 'T_sp_h_avg'] = results_timeseries['T_sp_h'].mean()
-        results_summary.loc[reihe, 'T_sp_tww_avg'] = results_timeseries['T_sp_tww'].mean()
+        results_summary.loc[reihe, 'T_sp_h_avg'] = mean['T_sp_h']
+        results_summary.loc[reihe, 'T_sp_tww_avg'] = mean['T_sp_tww']
         # Photovoltaik
         # installierte Leistung
         results_summary.loc[reihe, 'P_pv'] = pv_kwp
         # Süd oder Ost/West
         results_summary.loc[reihe, 'PV_orientation'] = pv_orientation
         # Erzeugung in kWh
-        results_summary.loc[reihe, 'E_pv'] = photovoltaic[pv_orientation].mean()*8.76
+        results_summary.loc[reihe, 'E_pv'] = mean['P_pv']*8.76
         # Eigenverbrauch in kWh
-        results_summary.loc[reihe, 'E_pv_sc'] = P_du.mean()*8.76
+        results_summary.loc[reihe, 'E_pv_sc'] = mean['P_du']*8.76
         # Batteriespeicher
         # Speicherkapazität, 0 wenn ohne Batterie
-        results_summary.loc[reihe, 'E_bat'] = BAT._E_BAT / 1000 # kWh
+        results_summary.loc[reihe, 'E_bat'] = batteries['e_bat'][idx] # kWh
         # geladene und entladene Energie
-        if BAT._E_BAT == 0:
-            results_summary.loc[reihe, 'E_bc'] = 0
-            results_summary.loc[reihe, 'E_bd'] = 0
-        else:
-            results_summary.loc[reihe, 'E_bc'] = np.maximum(0, BAT_P_bs).mean()*8.76
-            results_summary.loc[reihe, 'E_bd'] = np.minimum(0, BAT_P_bs).mean()*8.76*-1
+        results_summary.loc[reihe, 'E_bc'] = P_bc*8.76
+        results_summary.loc[reihe, 'E_bd'] = P_bd*8.76*-1
         reihe+=1
-    wp_model=wp_model.replace('/','')
-    results_summary.to_csv('src/simulation_data/simulations/'+str(standort)+'_'+ str(E_gas)+'_'+str(T_vorlauf)+'_'+str(n_Personen)+'_'+str(eff_tww)+'_'+str(Baujahr)+'_'+ wp_model+'_'+str(pv_kwp)+'_'+pv_orientation+'.csv',index=False)
-    return results_summary
+    profiler.count('results_summary.loc', results_summary.size)
+    profiler.enter('cache')
+    if cache:
+        resultcache.put(parameters, results_summary)
+    if grid_series:
+        # Wh per hour = kWh/1000, float32 is far more precise than any tariff
+        resultcache.put_arrays(dict(parameters, stage='grid'),
+                               {'E_bat': batteries['e_bat'].values, 'E_gs': (hourly[:, 0]/1000).astype(np.float32),
+                                'E_gf': (hourly[:, 1]/1000).astype(np.float32)}, compressed=True)
+    profiler.stop()
+    return (results_summary, profiler) if profile else results_summary
+
+
+def simulate_years(standort, E_gas, T_vorlauf, n_Personen, eff_tww, Baujahr, wp_model, pv_kwp, pv_orientation, years=None, **options):
+    """
+    Simulates a building in several test reference years, one simulate() per year. The
+    profiles of the household and hot water and the heat pump parameters do not depend
+    on the year and come from the caches of the process after the first.
+    Parameters
+    ----------
+    years: list of (year, year_type), see datastore.trj(), default all years of the region
+           with weather and PV profiles (datastore.years())
+    options: further keyword arguments of simulate(), e.g. resolution=15
+    Returns
+    -------
+    pd.DataFrame with the results_summary of all years and their 'Jahr' and 'Art des Jahres'
+    """
+    if years is None:
+        years = datastore.years(standort)
+        if not years:
+            raise ValueError('no weather and PV profiles of region '+str(standort))
+    results = []
+    for year, year_type in years:
+        results_summary = simulate(standort, E_gas, T_vorlauf, n_Personen, eff_tww, Baujahr, wp_model, pv_kwp,
+                                   pv_orientation, year=year, year_type=year_type, **options)
+        results.append(results_summary.assign(**{'Jahr': year, 'Art des Jahres': datastore.YEAR_TYPES[year_type]}))
+    return pd.concat(results, ignore_index=True)
+
+
+def _simulate_chunk(chunk, options, errors):
+    # runs in the worker processes, all scenarios of a chunk belong to the same region
+    results = []
+    for i, scenario in chunk:
+        try:
+            results.append((i, simulate(**scenario, **options)))
+        except Exception as error:
+            if errors == 'raise':
+                raise
+            warnings.warn('scenario '+str(i)+' '+str(scenario)+' failed: '+repr(error))
+    return results
+
+
+def _chunks(scenarios, size):
+    # scenarios as keyword arguments, sorted by region and split into chunks of at most size scenarios
+    scenarios = [dict(scenario) if isinstance(scenario, dict) else dict(zip(PARAMETERS, scenario))
+                 for scenario in scenarios]
+    order = sorted(range(len(scenarios)), key=lambda i: scenarios[i]['standort'])
+    chunks = []
+    for i in order:
+        if not chunks or len(chunks[-1]) == size or scenarios[chunks[-1][-1][0]]['standort'] != scenarios[i]['standort']:
+            chunks.append([])
+        chunks[-1].append((i, scenarios[i]))
+    return chunks
+
+
+def iter_simulate_many(scenarios, workers=None, chunksize=4, errors='raise', **options):
+    """
+    Simulates many scenarios on a process pool and yields the results as they finish.
+    Scenarios are grouped by region, so the workers load the input data of a region once.
+    Parameters
+    ----------
+    scenarios: list of dicts with the arguments of simulate() or of tuples in the order of PARAMETERS
+    workers: number of processes, default os.cpu_count(), 1 runs in this process
+    chunksize: maximum number of scenarios per task
+    errors: 'raise' stops at the first failing scenario, 'skip' warns and leaves it out
+    options: further keyword arguments of simulate() for all scenarios, e.g. resolution=15
+    Returns
+    -------
+    generator of (index of the scenario, results_summary)
+    """
+    chunks = _chunks(scenarios, chunksize)
+    if workers == 1:
+        for chunk in chunks:
+            yield from _simulate_chunk(chunk, options, errors)
+        return
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [pool.submit(_simulate_chunk, chunk, options, errors) for chunk in chunks]
+        try:
+            for future in as_completed(futures):
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def simulate_many(scenarios, workers=None, chunksize=4, errors='raise', **options):
+    """
+    Simulates many scenarios on a process pool, see iter_simulate_many().
+    Returns
+    -------
+    pd.DataFrame with the results_summary of all scenarios and their index in the column 'scenario'
+    """
+    results = sorted(iter_simulate_many(scenarios, workers, chunksize, errors, **options), key=lambda result: result[0])
+    if not results:
+        return pd.DataFrame()
+    return pd.concat([summary.assign(scenario=i) for i, summary in results], ignore_index=True)
@@ -0,0 +1,213 @@
+import functools
+import numpy as np
+from bslib import bslib as bsl
+from src.jit import jit, buffer, ENABLED
+
+# Battery sweep of simulate(): all battery sizes are advanced in lockstep over
+# the residual load, following bslib.ACBatMod.simulate() step by step.
+
+SIZES = [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]   # battery capacities in kWh
+C_RATE = 0.5                                                    # inverter power in kW per kWh capacity
+# per battery size of balance(): means of grid supply (negative), feed-in, charging, discharging (negative)
+# and the maximum hourly and daily mean grid supply [W]
+BALANCE = ['P_gs', 'P_gf', 'P_bc', 'P_bd', 'P_gs_avg_max_1h', 'P_gs_avg_max_24h']
+
+
+def parameters(e_bat, p_inv, system_id='SG1'):
+    """
+    Reads the parameters of one bslib.ACBatMod per battery size.
+    Parameters
+    ----------
+    e_bat: battery capacities [kWh]
+    p_inv: inverter powers [kW]
+    system_id: battery system in the bslib database
+    Returns
+    -------
+    read-only np.ndarray with one row per battery size
+    """
+    return _parameters(tuple(float(e) for e in e_bat), tuple(float(p) for p in p_inv), system_id)
+
+
+@functools.lru_cache(maxsize=64)
+def _parameters(e_bat, p_inv, system_id):
+    # bslib reads its database for every ACBatMod
+    generic = bsl.load_parameters(system_id)['Manufacturer (PE)'] == 'Generic'
+    rows = []
+    for e, p in zip(e_bat, p_inv):
+        BAT = bsl.ACBatMod(system_id=system_id, p_inv_custom=p*1000, e_bat_custom=e)
+        rows.append([BAT._E_BAT, BAT._P_AC2BAT_IN, BAT._P_BAT2AC_OUT, BAT._P_AC2BAT_MIN, BAT._P_BAT2AC_MIN,
+                     BAT._P_AC2BAT_DEV, BAT._P_BAT2AC_DEV,
+                     BAT._AC2BAT_A_IN, BAT._AC2BAT_B_IN, BAT._AC2BAT_C_IN,
+                     BAT._BAT2AC_A_OUT, BAT._BAT2AC_B_OUT, BAT._BAT2AC_C_OUT,
+                     BAT._P_AC2BAT_IN/1000 if generic else 1, BAT._P_BAT2AC_OUT/1000 if generic else 1,
+                     np.sqrt(BAT._ETA_BAT), BAT._SOC_THRESHOLD, BAT._CORR_FACTOR,
+                     BAT._P_SYS_SOC0_DC, BAT._P_SYS_SOC0_AC, BAT._P_SYS_SOC1_DC, BAT._P_SYS_SOC1_AC,
+                     BAT._P_PERI_AC])
+    params = np.array(rows, dtype=np.float64).reshape(-1, 23)
+    params.setflags(write=False)
+    return params
+
+
+@jit
+def _step(p_load, soc, threshold, b, dt):
+    # one time step of bslib.ACBatMod.simulate() for the parameters b of one battery
+    E_BAT = b[0]
+    p_bs = p_load - b[22]
+    e_b0 = soc * E_BAT
+    # avoid overcharging
+    e_bs_est = p_bs * dt / 3600
+    if e_bs_est > 0 and e_bs_est > (E_BAT - e_b0):
+        p_bs = (E_BAT - e_b0) * 3600 / dt
+    elif e_bs_est < 0 and abs(e_bs_est) > e_b0:
+        p_bs = -((e_b0 * 3600 / dt) * (1 - b[17]))
+    # stationary deviations and minimum power
+    if p_bs > b[3]:
+        p_bs = max(b[3], p_bs + b[5])
+    elif p_bs < -b[4]:
+        p_bs = min(-b[4], p_bs - b[6])
+    else:
+        p_bs = 0.0
+    # rated power of the battery converter
+    p_bs = max(-b[2], min(b[1], p_bs))
+    if p_bs > 0 and soc < 1 - threshold * (1 - b[16]):
+        p_bs_norm = p_bs / b[1]
+        p_bat = max(0.0, p_bs - (b[7] * p_bs_norm * p_bs_norm + b[8] * p_bs_norm + b[9]) * b[13])
+    elif p_bs < 0 and soc > 0:
+        p_bs_norm = abs(p_bs / b[2])
+        p_bat = p_bs - (b[10] * p_bs_norm * p_bs_norm + b[11] * p_bs_norm + b[12]) * b[14]
+    else:
+        p_bat = 0.0
+    # standby
+    if p_bat == 0:
+        if soc <= 0:
+            p_bat = -max(0.0, b[18])
+            p_bs = b[19]
+        else:
+            p_bat = -max(0.0, b[20])
+            p_bs = b[21]
+    if p_bat > 0:
+        e_b = e_b0 + p_bat * b[15] * dt / 3600
+    elif p_bat < 0:
+        e_b = e_b0 + p_bat / b[15] * dt / 3600
+    else:
+        e_b = e_b0
+    soc = e_b / E_BAT
+    threshold = 1.0 if (threshold > 0 and soc > b[16]) or soc > 1 else 0.0
+    return p_bs, soc, threshold
+
+
+@jit
+def _run(P_diff, params, dt, P_bs):
+    n_sizes = len(params)
+    soc = [0.0] * n_sizes
+    threshold = [0.0] * n_sizes
+    for s in range(n_sizes):
+        if params[s][0] > 0:
+            # first call without load as in simulate()
+            _, soc[s], threshold[s] = _step(0.0, 0.0, 0.0, params[s], dt)
+    for t in range(len(P_diff)):
+        p_diff = P_diff[t]
+        for s in range(n_sizes):
+            if params[s][0] > 0:
+                P_bs[s][t], soc[s], threshold[s] = _step(p_diff, soc[s], threshold[s], params[s], dt)
+            else:
+                P_bs[s][t] = 0.0
+    return soc
+
+
+@jit
+def _balance(P_diff, params, dt, hour, balance, hourly):
+    n_sizes = len(params)
+    soc = [0.0] * n_sizes
+    threshold = [0.0] * n_sizes
+    gs_hour = [0.0] * n_sizes
+    gf_hour = [0.0] * n_sizes
+    gs_day = [0.0] * n_sizes
+    for s in range(n_sizes):
+        if params[s][0] > 0:
+            # first call without load as in simulate()
+            _, soc[s], threshold[s] = _step(0.0, 0.0, 0.0, params[s], dt)
+    for t in range(len(P_diff)):
+        p_diff = P_diff[t]
+        end_of_hour = (t+1) % hour == 0
+        end_of_day = (t+1) % (24*hour) == 0
+        for s in range(n_sizes):
+            if params[s][0] > 0:
+                p_bs, soc[s], threshold[s] = _step(p_diff, soc[s], threshold[s], params[s], dt)
+            else:
+                p_bs = 0.0
+            p_gs = min(0.0, p_diff-p_bs)
+            p_gf = max(0.0, p_diff-p_bs)
+            balance[s][0] += p_gs
+            balance[s][1] += p_gf
+            balance[s][2] += max(0.0, p_bs)
+            balance[s][3] += min(0.0, p_bs)
+            gs_hour[s] -= p_gs
+            gf_hour[s] += p_gf
+            gs_day[s] -= p_gs
+            if end_of_hour:
+                balance[s][4] = max(balance[s][4], gs_hour[s]/hour)
+                hourly[s][0][t // hour] = gs_hour[s]/hour
+                hourly[s][1][t // hour] = gf_hour[s]/hour
+                gs_hour[s] = 0.0
+                gf_hour[s] = 0.0
+            if end_of_day:
+                balance[s][5] = max(balance[s][5], gs_day[s]/(24*hour))
+                gs_day[s] = 0.0
+    return soc
+
+
+def balance(P_diff, e_bat, p_inv, dt=60, system_id='SG1'):
+    """
+    Same as simulate() but only accumulates the grid exchange of every battery
+    size instead of returning the battery power series.
+    Parameters
+    ----------
+    as in simulate(), P_diff must cover whole days
+    Returns
+    -------
+    BALANCE per battery size (np.ndarray n_sizes x len(BALANCE)) [W],
+    hourly mean grid supply and feed-in (np.ndarray n_sizes x 2 x n_hours) [W]
+    """
+    params = parameters(e_bat, p_inv, system_id)
+    n = len(P_diff)
+    hour = int(round(3600 / dt))    # steps per hour
+    if n % (24*hour):
+        raise ValueError('balance() expects whole days')
+    if ENABLED:
+        result, hourly = np.zeros((len(params), len(BALANCE))), np.zeros((len(params), 2, n // hour))
+        _balance(np.ascontiguousarray(P_diff, dtype=np.float64), params, float(dt), hour, result, hourly)
+    else:
+        result = [[0.0]*len(BALANCE) for _ in range(len(params))]
+        hourly = [[[0.0]*(n // hour) for _ in range(2)] for _ in range(len(params))]
+        _balance(buffer(np.ascontiguousarray(P_diff, dtype=np.float64)), params.tolist(), float(dt), hour,
+                 result, hourly)
+    result = np.asarray(result)
+    result[:, :4] /= n
+    return result, np.asarray(hourly)
+
+
+def simulate(P_diff, e_bat, p_inv, dt=60, system_id='SG1'):
+    """
+    Simulates AC-coupled batteries of several sizes on the same residual load.
+    Parameters
+    ----------
+    P_diff: PV generation minus electrical load [W], positive values are excess power
+    e_bat: battery capacities [kWh], 0 for no battery
+    p_inv: inverter powers [kW]
+    dt: time step [s]
+    system_id: battery system in the bslib database
+    Returns
+    -------
+    P_bs: np.ndarray (n_sizes x n_steps), AC power of the battery systems [W],
+    positive for charging, 0 for the sizes without battery
+    """
+    params = parameters(e_bat, p_inv, system_id)
+    n = len(P_diff)
+    if ENABLED:
+        P_bs = np.empty((len(params), n))
+        _run(np.ascontiguousarray(P_diff, dtype=np.float64), params, float(dt), P_bs)
+    else:
+        P_bs = [[0.0]*n for _ in range(len(params))]
+        _run(buffer(np.ascontiguousarray(P_diff, dtype=np.float64)), params.tolist(), float(dt), P_bs)
+    return np.asarray(P_bs)
@@ -0,0 +1,121 @@
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Binary columnar format of the 1-minute simulation datasets. A file holds a
+# small JSON header (column names, dtype, length, time base) and the columns
+# as contiguous little-endian float32 arrays. The columns are memory-mapped
+# read only, so all processes on a machine share the same pages of the page cache.
+# Temperatures are kept in float64: rounding them to float32 shifts the
+# switching times of the storage hysteresis and e.g. the maximum hourly grid
+# supply by several percent.
+#
+# Layout: MAGIC, header length (uint32), JSON header padded to ALIGN bytes, data
+
+MAGIC = b'PVSYMF32'
+ALIGN = 64
+SUFFIX = '.bin'
+FOLDERS = {'weather': '<f8', 'pv': '<f4', 'electrical_load': '<f4', 'dhw_load': '<f4'}   # 1-minute data in src/simulation_data
+
+
+def filename(csv_file):
+    """
+    Name of the binary file belonging to a csv file.
+    """
+    return os.path.splitext(csv_file)[0] + SUFFIX
+
+
+def write(csv_file, dtype='<f4'):
+    """
+    Converts a csv file into the binary format, next to the csv file.
+    A first column 'time' is stored as time base, all other columns as dtype.
+    Parameters
+    ----------
+    csv_file: path of the csv file
+    dtype: numpy dtype of the columns
+    Returns
+    -------
+    path of the binary file
+    """
+    data = pd.read_csv(csv_file)
+    header = {'columns': [], 'dtype': np.dtype(dtype).str, 'length': len(data), 'start': None, 'step': None}
+    if data.columns[0] == 'time':
+        time = pd.to_datetime(data.pop('time'))
+        header['start'] = str(time.iloc[0])
+        header['step'] = (time.iloc[1] - time.iloc[0]).total_seconds()   # s
+    header['columns'] = [str(column) for column in data.columns]
+    text = json.dumps(header).encode()
+    start = len(MAGIC) + 4 + len(text)
+    text += b' ' * (-start % ALIGN)
+    values = np.ascontiguousarray(data.to_numpy(dtype=header['dtype']).T)
+    target = filename(csv_file)
+    tmp = target + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp, 'wb') as file:
+        file.write(MAGIC)
+        file.write(np.uint32(len(text)).tobytes())
+        file.write(text)
+        file.write(values.tobytes())
+    os.replace(tmp, target)
+    return target
+
+
+def read_header(path):
+    """
+    Returns
+    -------
+    (header dict, offset of the data in bytes)
+    """
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(path + ' is not a binary simulation dataset')
+        length = int(np.frombuffer(file.read(4), dtype=np.uint32)[0])
+        header = json.loads(file.read(length))
+    return header, len(MAGIC) + 4 + length
+
+
+def read(path, columns=None):
+    """
+    Memory-maps columns of a binary file.
+    Parameters
+    ----------
+    path: path of the binary file
+    columns: names of the columns, all if None
+    Returns
+    -------
+    dict of read-only np.memmap
+    """
+    header, offset = read_header(path)
+    data = np.memmap(path, dtype=header['dtype'], mode='r', offset=offset,
+                     shape=(len(header['columns']), header['length']))
+    if columns is None:
+        columns = header['columns']
+    return {column: data[header['columns'].index(column)] for column in columns}
+
+
+def convert(path='src/simulation_data/'):
+    """
+    Converts all 1-minute csv files of the simulation data into the binary format.
+    Parameters
+    ----------
+    path: folder of the simulation data
+    Returns
+    -------
+    list of the written files
+    """
+    written = []
+    for folder, dtype in FOLDERS.items():
+        directory = os.path.join(path, folder)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.csv'):
+                written.append(write(os.path.join(directory, name), dtype))
+    return written
+
+
+if __name__ == '__main__':
+    # python -m src.binary [path of the simulation data]
+    for written in convert(*sys.argv[1:2]):
+        print(written)
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+# Server-side aggregation for the explorer of the results (graph3). Above
+# POINTS rows the plots are not sent point by point to the browser:
+# histogram() counts the rows per bin, density() per cell of a 2D grid and
+# boxes() computes the statistics of the box plots. The figures are drawn from
+# these (bars, a density heatmap, boxes from quartiles), so their size depends
+# on the number of bins, not on the size of results_summary.pkl. Columns with at most MAX_BINS distinct values (region,
+# battery size, names) keep their values as bins, numeric columns with more get
+# MAX_BINS bins of equal width.
+
+WEBGL = 2000                # rows, scatter plots above are drawn with WebGL
+POINTS = 50000              # rows, plots above are aggregated on the server
+MAX_BINS = 60
+COUNT = 'Anzahl'
+
+
+def _bins(values):
+    # value of the bin of every row (its center) and the bin width, None for strings
+    if not pd.api.types.is_numeric_dtype(values):
+        return values, None
+    if values.nunique() <= MAX_BINS:
+        # every value is its own bin, as wide as the smallest distance
+        distinct = np.unique(values.dropna().to_numpy(dtype=float))
+        return values, float(np.diff(distinct).min()) if len(distinct) > 1 else 1.0
+    numbers = values.to_numpy(dtype=float)
+    edges = np.histogram_bin_edges(numbers[np.isfinite(numbers)], bins=MAX_BINS)
+    width = edges[1] - edges[0]
+    index = np.clip(np.searchsorted(edges, numbers, side='right') - 1, 0, MAX_BINS - 1)
+    return pd.Series(edges[index] + width/2, index=values.index, name=values.name), width
+
+
+def histogram(df, x, by):
+    """
+    Parameters
+    ----------
+    df: rows of results_summary
+    x: column to count
+    by: columns of the facets and colours
+    Returns
+    -------
+    pd.DataFrame with the columns by, x (center of the bin) and COUNT, and the bin width (None for strings)
+    """
+    by = [column for column in dict.fromkeys(by) if column != x]
+    values, width = _bins(df[x])
+    counts = df[by].assign(**{x: values}).groupby(by + [x], observed=True, sort=True).size()
+    return counts.rename(COUNT).reset_index(), width
+
+
+def density(df, x, y, by):
+    """
+    Parameters
+    ----------
+    df: rows of results_summary
+    x, y: columns of the axes
+    by: columns of the facets
+    Returns
+    -------
+    pd.DataFrame with the columns by, x, y (centers of the cells) and COUNT of the non-empty cells,
+    and the widths of the cells in x and y (None for strings)
+    """
+    by = [column for column in dict.fromkeys(by) if column not in (x, y)]
+    xvalues, xwidth = _bins(df[x])
+    yvalues, ywidth = _bins(df[y])
+    axes = list(dict.fromkeys([x, y]))     # the same column on both axes is the diagonal
+    counts = df[by].assign(**{x: xvalues, y: yvalues}).groupby(by + axes, observed=True).size()
+    return counts.rename(COUNT).reset_index(), xwidth, ywidth
+
+
+def boxes(df, x, y, by):
+    """
+    Statistics of box plots like plotly's (linear quartiles, whiskers to the last value within 1.5 IQR).
+    Parameters
+    ----------
+    df: rows of results_summary
+    x: column of the positions of the boxes, binned like histogram()
+    y: column of the values
+    by: columns of the facets and colours
+    Returns
+    -------
+    pd.DataFrame with the columns by, x, q1, median, q3, lowerfence and upperfence
+    """
+    keys = [column for column in dict.fromkeys(by + [x]) if column != y]
+    values, _ = _bins(df[x])
+    grouping = [values if key == x else df[key] for key in keys]
+    groups = df[y].groupby(grouping, observed=True)
+    q1, q3 = groups.transform('quantile', 0.25), groups.transform('quantile', 0.75)
+    inside = df[y].where((df[y] >= q1 - 1.5*(q3 - q1)) & (df[y] <= q3 + 1.5*(q3 - q1))).groupby(grouping, observed=True)
+    stats = pd.DataFrame({'q1': groups.quantile(0.25), 'median': groups.median(), 'q3': groups.quantile(0.75),
+                          'lowerfence': inside.min(), 'upperfence': inside.max()})
+    return stats.reset_index()
@@ -0,0 +1,87 @@
+import functools
+import numpy as np
+from hplib import hplib as hpl
+import src.datastore as datastore
+from src.kernel import heating_dist_temp
+
+# Thermal inputs of the simulation that only depend on the weather region, the
+# flow temperature and the building class (Heizgrenztemperatur). They are
+# computed once per process and shared by all simulations of the same region.
+
+DEGREE_DAYS = {15: 'G_15', 12: 'G_12', 10: 'G_10'}   # Gradtagszahlen per Heizgrenztemperatur
+
+
+def heating_limit(Baujahr):
+    """
+    IWU Heizgrenztemperatur of a building
+    Parameters
+    ----------
+    Baujahr: year of construction or refurbishment, number or np.ndarray
+    Returns
+    -------
+    Heizgrenztemperatur [°C], int or np.ndarray, a key of DEGREE_DAYS
+    """
+    Baujahr = np.asarray(Baujahr)
+    limit = np.select([Baujahr <= 2000, Baujahr > 2015], [15, 10], 12)
+    return limit if limit.ndim else int(limit)
+
+
+def heating_system(T_min_ref, T_vorlauf):
+    """
+    Heat distribution system with floor heating below and radiators from 55 °C flow temperature.
+    Parameters
+    ----------
+    T_min_ref: reference minimum outside temperature of the region [°C]
+    T_vorlauf: maximum flow temperature [°C]
+    Returns
+    -------
+    hplib.HeatingSystem
+    """
+    if T_vorlauf < 55:
+        t_hs_set = 0.85*T_vorlauf-1.75
+        f_hs_exp = 1.1
+    else:
+        t_hs_set = 2*T_vorlauf/3+8+1/3
+        f_hs_exp = 1.3
+    return hpl.HeatingSystem(T_min_ref, 20, [T_vorlauf, t_hs_set], 1, f_hs_exp)
+
+
+@functools.lru_cache(maxsize=64)
+def profiles(standort, T_vorlauf, Heizgrenztemperatur, resolution=1, year=2015, year_type='a'):
+    """
+    Weather dependent inputs of the thermal simulation.
+    Parameters
+    ----------
+    standort: test reference year region (1-15)
+    T_vorlauf: maximum flow temperature [°C]
+    Heizgrenztemperatur: heating limit temperature of the building class [°C]
+    resolution: time step [min]
+    year, year_type: test reference year, see datastore.trj()
+    Returns
+    -------
+    dict of read-only np.ndarray:
+    T_amb, T_amb_24h: outside temperature and its 24h average [°C]
+    T_vl, T_rl: flow and return temperature of the heating system [°C]
+    T_brine: brine inlet temperature of ground source heat pumps [°C]
+    P_load_h_unit: heating load per Wh of annual heating demand [W/Wh],
+                   multiply with E_Heiz to get the heating load in W
+    """
+    TRJ = datastore.trj(standort, year, year_type)
+    gtz = TRJ[DEGREE_DAYS[Heizgrenztemperatur]]
+    weather = datastore.weather(standort, year, year_type)
+    T_amb_24h = datastore.resample(weather['temperature 24h [degC]'], resolution)
+    HS = heating_system(TRJ['T_min_ref'], T_vorlauf)
+    # the 24h average only takes a few distinct values per day
+    values, inverse = np.unique(T_amb_24h, return_inverse=True)
+    T_vl, T_rl = heating_dist_temp(HS, values)
+    result = {
+        'T_amb': datastore.resample(weather['temperature [degC]'], resolution),
+        'T_amb_24h': T_amb_24h,
+        'T_vl': T_vl[inverse],
+        'T_rl': T_rl[inverse],
+        'T_brine': HS.calc_brine_temp(values)[inverse],
+        'P_load_h_unit': np.where(values < Heizgrenztemperatur, (20-values)/(gtz*24), 0)[inverse],
+    }
+    for array in result.values():
+        array.setflags(write=False)
+    return result
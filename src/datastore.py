@@ -0,0 +1,209 @@
+import collections
+import os
+import threading
+import numpy as np
+import pandas as pd
+import src.binary as binary
+
+# Input data of the simulation (TRJ table, weather, PV, household and DHW
+# profiles). Every dataset is parsed once per process, only with the columns
+# the simulation needs, and kept in a LRU cache limited by MEMORY_BUDGET.
+# Profiles are handed out as read-only np.ndarray, copy them before modifying.
+# If a binary version of a csv file exists (src/binary.py), the profiles are
+# memory-mapped arrays (float32 except the temperatures) instead. They do not
+# count against the budget, their pages are shared between the processes.
+
+PATH = 'src/simulation_data/'
+YEAR_TYPES = {'a': 'durchschnittliches Jahr', 's': 'extremer Sommer', 'w': 'extremer Winter'}   # test reference years
+MEMORY_BUDGET = 256 * 2**20     # bytes, least recently used datasets are dropped above
+
+_cache = collections.OrderedDict()  # key -> (value, size in bytes)
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def _nbytes(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, dict):
+        return sum(_nbytes(array) for array in value.values())
+    if isinstance(value, np.memmap):
+        return 0
+    return value.nbytes
+
+
+def _get(key, load):
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            _stats['hits'] += 1
+            return _cache[key][0]
+        _stats['misses'] += 1
+    value = load()
+    with _lock:
+        _cache[key] = (value, _nbytes(value))
+        _cache.move_to_end(key)
+        size = sum(nbytes for _, nbytes in _cache.values())
+        while size > MEMORY_BUDGET and len(_cache) > 1:
+            _, (_, nbytes) = _cache.popitem(last=False)
+            size -= nbytes
+            _stats['evictions'] += 1
+    return value
+
+
+def _read(filename, columns):
+    # float columns of a csv file as dict of read-only arrays
+    if os.path.exists(binary.filename(PATH + filename)):
+        return binary.read(binary.filename(PATH + filename), columns)
+    data = pd.read_csv(PATH + filename, usecols=columns, dtype={column: np.float64 for column in columns})
+    result = {}
+    for column in columns:
+        array = data[column].to_numpy(copy=True)
+        array.setflags(write=False)
+        result[column] = array
+    return result
+
+
+def trj(standort, year=2015, year_type='a'):
+    """
+    Row of the test reference year table.
+    Parameters
+    ----------
+    standort: test reference year region (1-15)
+    year: 2015 or 2045 (climate projection)
+    year_type: 'a' average, 's' extreme summer, 'w' extreme winter, see YEAR_TYPES
+    Returns
+    -------
+    pd.Series with station, T_min_ref and the Gradtagszahlen G_10, G_12, G_15
+    """
+    table = _get('trj', lambda: pd.read_csv(PATH + 'TRJ-Tabelle.csv'))
+    rows = table[(table['TRY'] == standort) & (table['Year'] == year) & (table['Type'] == year_type)]
+    if rows.empty:
+        raise ValueError('no test reference year '+str((standort, year, year_type)))
+    return rows.iloc[0].copy()
+
+
+def _profile(name, standort, year, year_type):
+    # file of the weather or PV profile of a test reference year
+    return name+'/'+name+'_'+str(standort)+'_'+year_type+'_'+str(year)+'_1min.csv'
+
+
+def _exists(filename):
+    return os.path.exists(PATH + filename) or os.path.exists(binary.filename(PATH + filename))
+
+
+def years(standort):
+    """
+    Returns
+    -------
+    list of the (year, year_type) of the test reference years of a region with weather and PV profiles
+    """
+    table = _get('trj', lambda: pd.read_csv(PATH + 'TRJ-Tabelle.csv'))
+    rows = table[table['TRY'] == standort]
+    return [(int(year), year_type) for year, year_type in zip(rows['Year'], rows['Type'])
+            if _exists(_profile('weather', standort, year, year_type)) and _exists(_profile('pv', standort, year, year_type))]
+
+
+def weather(standort, year=2015, year_type='a'):
+    """
+    1-minute weather of a test reference year, see trj().
+    Parameters
+    ----------
+    standort: test reference year region (1-15)
+    Returns
+    -------
+    dict with 'temperature [degC]' and 'temperature 24h [degC]'
+    """
+    columns = ['temperature [degC]', 'temperature 24h [degC]']
+    filename = _profile('weather', standort, year, year_type)
+    return _get(filename, lambda: _read(filename, columns))
+
+
+def pv(standort, year=2015, year_type='a'):
+    """
+    1-minute PV generation of a test reference year, see trj().
+    Parameters
+    ----------
+    standort: test reference year region (1-15)
+    Returns
+    -------
+    dict with 'Süd' and 'Ost-West' [W/kWp]
+    """
+    columns = ['Süd', 'Ost-West']
+    filename = _profile('pv', standort, year, year_type)
+    return _get(filename, lambda: _read(filename, columns))
+
+
+def electrical_load(standort, low_energy_house=False):
+    """
+    1-minute household electricity demand.
+    Parameters
+    ----------
+    standort: test reference year region (1-15)
+    low_energy_house: profile of buildings built after 2015
+    Returns
+    -------
+    np.ndarray [W]
+    """
+    filename = 'electrical_load/' + ('low_energy_house.csv' if low_energy_house else 'existing_house.csv')
+    column = str(standort)
+    return _get((filename, column), lambda: _read(filename, [column])[column])
+
+
+def dhw_load(n_Personen):
+    """
+    1-minute domestic hot water demand.
+    Parameters
+    ----------
+    n_Personen: number of persons
+    Returns
+    -------
+    np.ndarray [W]
+    """
+    filename = 'dhw_load/dhw_'+str(n_Personen)+'.csv'
+    return _get(filename, lambda: _read(filename, ['load [W]'])['load [W]'])
+
+
+def heatpumps():
+    """
+    Normheizlast of the heat pumps per region and flow temperature, do not modify.
+    Returns
+    -------
+    pd.DataFrame
+    """
+    return _get('hp_Normheizlast', lambda: pd.read_csv(PATH + 'hp_Normheizlast.csv'))
+
+
+def resample(values, resolution):
+    """
+    Averages a 1-minute profile over intervals of resolution minutes.
+    Parameters
+    ----------
+    values: 1-minute profile
+    resolution: length of the intervals [min]
+    Returns
+    -------
+    np.ndarray (float64)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if resolution == 1:
+        return values
+    return values.reshape(-1, resolution).mean(axis=1)
+
+
+def stats():
+    """
+    Returns
+    -------
+    dict with hits, misses, evictions, number of cached datasets, their size and the budget in bytes
+    """
+    with _lock:
+        return dict(_stats, entries=len(_cache), nbytes=sum(nbytes for _, nbytes in _cache.values()),
+                    budget=MEMORY_BUDGET)
+
+
+def clear():
+    with _lock:
+        _cache.clear()
+        for key in _stats:
+            _stats[key] = 0
@@ -0,0 +1,32 @@
+try:
+    from numba import njit
+except ImportError:         # numba is optional, the kernels also run as plain Python
+    njit = None
+
+ENABLED = njit is not None
+
+
+def jit(func):
+    """
+    Compiles a kernel with numba if it is installed, otherwise returns it unchanged.
+    Parameters
+    ----------
+    func: function operating on numpy arrays and scalars only
+    Returns
+    -------
+    compiled or original function
+    """
+    if njit is None:
+        return func
+    return njit(cache=True)(func)
+
+
+def buffer(values):
+    """
+    Returns an indexable buffer suited for the active kernel backend: the numpy
+    array itself for numba, a list of python floats for the plain Python loop
+    (element access on lists is several times faster than on numpy arrays).
+    """
+    if ENABLED:
+        return values
+    return values.tolist()
@@ -0,0 +1,291 @@
+import io
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import numpy as np
+import pandas as pd
+import src.resultcache as resultcache
+import src.surrogate as surrogate
+try:
+    import fcntl
+except ImportError:         # not on Windows, every app process starts its own pool there
+    fcntl = None
+
+# Background simulations of the web app. Jobs are kept in a SQLite database, so
+# all gunicorn workers share one queue without an external broker. Local worker
+# processes claim the jobs one by one, at most MAX_RUNNING at the same time and
+# MAX_RUNNING_PER_USER per user; users with fewer running jobs are served first.
+# Only one app process per database starts worker processes: the first one that
+# submits jobs holds the lock file LOCK, when it ends another one takes over.
+# It restarts worker processes that have died, e.g. killed for memory.
+# The user is the session id sent by the browser, so a client can bypass
+# MAX_RUNNING_PER_USER with new ids: the limit shares the workers fairly between
+# ordinary users, MAX_RUNNING protects the host.
+
+PATH = 'src/simulation_data/jobs.sqlite'
+LOCK = 'src/simulation_data/jobs.lock'          # held by the app process that runs the worker processes
+WORKERS = max(1, (os.cpu_count() or 2) - 1)     # worker processes of the host
+MAX_RUNNING = WORKERS                           # running simulations of all users
+MAX_RUNNING_PER_USER = 2                        # running simulations of one user
+POLL = 0.5                                      # s, idle workers look for new jobs
+SUPERVISE = 5                                   # s, the process with LOCK replaces dead worker processes
+KEEP = 24 * 3600                                # s, finished jobs are deleted afterwards
+
+_processes = []
+_lock = None                # open LOCK of the process that runs the worker processes
+_supervisor = None          # thread of that process that replaces dead worker processes
+_spawning = threading.Lock()
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch TEXT NOT NULL,
+    user TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    parameters TEXT NOT NULL,
+    status TEXT NOT NULL,       -- queued, running, done, failed, cancelled
+    result TEXT,                -- results_summary as json (orient='split')
+    error TEXT,
+    pid INTEGER,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL)'''
+
+
+def _connect():
+    connection = sqlite3.connect(PATH, timeout=30, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute(SCHEMA)
+    connection.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, user)')
+    connection.execute('CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch)')
+    return connection
+
+
+def _native(value):
+    # numpy scalars of the app's DataFrames as python numbers
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('Object of type %s is not JSON serializable' % type(value).__name__)
+
+
+def submit(user, scenarios):
+    """
+    Adds simulations to the queue. Queued jobs of earlier batches of the user are cancelled.
+    Parameters
+    ----------
+    user: id of the user session
+    scenarios: list of dicts with the arguments of simulate(), see simulate.scenario()
+    Returns
+    -------
+    id of the batch
+    """
+    batch = uuid.uuid4().hex
+    now = time.time()
+    connection = _connect()
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        connection.execute("UPDATE jobs SET status='cancelled', finished=? WHERE user=? AND status='queued'",
+                           (now, user))
+        connection.execute("DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND finished<?",
+                           (now - KEEP,))
+        for position, parameters in enumerate(scenarios):
+            summary = resultcache.get(parameters)
+            if summary is None:
+                connection.execute("INSERT INTO jobs (batch, user, position, parameters, status, created) "
+                                   "VALUES (?, ?, ?, ?, 'queued', ?)",
+                                   (batch, user, position, json.dumps(parameters, default=_native), now))
+            else:
+                connection.execute("INSERT INTO jobs (batch, user, position, parameters, status, result, created, finished) "
+                                   "VALUES (?, ?, ?, ?, 'done', ?, ?, ?)",
+                                   (batch, user, position, json.dumps(parameters, default=_native), summary.to_json(orient='split'), now, now))
+        connection.execute('COMMIT')
+    finally:
+        connection.close()
+    start()
+    return batch
+
+
+def status(batch):
+    """
+    Parameters
+    ----------
+    batch: id of the batch
+    Returns
+    -------
+    pd.DataFrame with model, status, error and run time [s] per job
+    """
+    connection = _connect()
+    try:
+        rows = connection.execute('SELECT parameters, status, error, started, finished FROM jobs '
+                                  'WHERE batch=? ORDER BY position', (batch,)).fetchall()
+    finally:
+        connection.close()
+    return pd.DataFrame([{'WP-Name': json.loads(parameters)['wp_model'], 'Status': state, 'Fehler': error or '',
+                          'Laufzeit [s]': round((finished or time.time()) - started) if started else 0}
+                         for parameters, state, error, started, finished in rows],
+                        columns=['WP-Name', 'Status', 'Fehler', 'Laufzeit [s]'])
+
+
+def scenarios(batch, states=('queued', 'running')):
+    """
+    Parameters
+    ----------
+    batch: id of the batch
+    states: status of the jobs
+    Returns
+    -------
+    list of dicts with the arguments of simulate() of the jobs
+    """
+    connection = _connect()
+    try:
+        rows = connection.execute('SELECT parameters FROM jobs WHERE batch=? AND status IN (%s) ORDER BY position'
+                                  % ','.join('?' * len(states)), (batch,) + tuple(states)).fetchall()
+    finally:
+        connection.close()
+    return [json.loads(parameters) for parameters, in rows]
+
+
+def finished(batch):
+    """
+    Returns
+    -------
+    True if no job of the batch is queued or running
+    """
+    return not status(batch)['Status'].isin(['queued', 'running']).any()
+
+
+def results(batch):
+    """
+    Parameters
+    ----------
+    batch: id of the batch
+    Returns
+    -------
+    pd.DataFrame with the results_summary of all finished jobs of the batch
+    """
+    connection = _connect()
+    try:
+        rows = connection.execute("SELECT result FROM jobs WHERE batch=? AND status='done' ORDER BY position",
+                                  (batch,)).fetchall()
+    finally:
+        connection.close()
+    if not rows:
+        return pd.DataFrame()
+    return pd.concat([pd.read_json(io.StringIO(result), orient='split') for result, in rows], ignore_index=True)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _claim(connection):
+    # next job of the user with the fewest running jobs, None if the limits are reached
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        for job, pid in connection.execute("SELECT id, pid FROM jobs WHERE status='running'").fetchall():
+            if not _alive(pid):    # worker died, run the job again
+                connection.execute("UPDATE jobs SET status='queued', pid=NULL, started=NULL WHERE id=?", (job,))
+        running, = connection.execute("SELECT COUNT(*) FROM jobs WHERE status='running'").fetchone()
+        row = None
+        if running < MAX_RUNNING:
+            row = connection.execute(
+                "SELECT j.id, j.parameters FROM jobs j WHERE j.status='queued' "
+                "AND (SELECT COUNT(*) FROM jobs r WHERE r.status='running' AND r.user=j.user) < ? "
+                "ORDER BY (SELECT COUNT(*) FROM jobs r WHERE r.status='running' AND r.user=j.user), j.id LIMIT 1",
+                (MAX_RUNNING_PER_USER,)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE jobs SET status='running', pid=?, started=? WHERE id=?",
+                                   (os.getpid(), time.time(), row[0]))
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    return row
+
+
+def work():
+    """
+    Runs queued jobs until the process is stopped.
+    """
+    from simulate import simulate
+    connection = _connect()
+    new_results = False
+    while True:
+        job = _claim(connection)
+        if job is None:
+            if new_results:     # train the surrogate model when the queue is empty
+                surrogate.update()
+                new_results = False
+            time.sleep(POLL)
+            continue
+        job, parameters = job
+        parameters = json.loads(parameters)
+        try:
+            # no time series are needed, so the workers accumulate the results of the kernel (a few MB per simulation)
+            summary = simulate(**parameters, low_memory=parameters.get('engine', 'loop') == 'kernel')
+            connection.execute("UPDATE jobs SET status='done', result=?, finished=? WHERE id=?",
+                               (summary.to_json(orient='split'), time.time(), job))
+            new_results = True
+        except Exception as error:
+            connection.execute("UPDATE jobs SET status='failed', error=?, finished=? WHERE id=?",
+                               (repr(error), time.time(), job))
+
+
+def start(workers=None):
+    """
+    Starts the local worker processes, if not running yet in this or another process of the host.
+    Parameters
+    ----------
+    workers: number of processes, default WORKERS
+    Returns
+    -------
+    True if this process runs the worker processes
+    """
+    global _lock, _supervisor
+    if _lock is None and fcntl is not None:
+        file = open(LOCK, 'a')
+        try:
+            # the worker processes inherit the lock, it is released when they and this process have ended
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            file.close()
+            return False
+        _lock = file
+    _spawn(workers or WORKERS)
+    if _supervisor is None:
+        _supervisor = threading.Thread(target=_supervise, args=(workers or WORKERS,), daemon=True)
+        _supervisor.start()
+    return True
+
+
+def _spawn(workers):
+    # replaces dead worker processes, the jobs they were running are queued again by _claim()
+    with _spawning:
+        _processes[:] = [process for process in _processes if process.is_alive()]
+        for _ in range(len(_processes), workers):
+            process = multiprocessing.Process(target=work, daemon=True)
+            process.start()
+            _processes.append(process)
+
+
+def _supervise(workers):
+    while True:
+        time.sleep(SUPERVISE)
+        _spawn(workers)
+
+
+if __name__ == '__main__':
+    # python -m src.jobs [number of workers]: runs a worker pool without the web app
+    if not start(*[int(argument) for argument in sys.argv[1:2]]):
+        sys.exit('the worker processes of ' + PATH + ' already run in another process')
+    _supervisor.join()
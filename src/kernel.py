@@ -0,0 +1,313 @@
+import numpy as np
+from src.jit import jit, buffer, ENABLED
+
+# order of the rows in the output array, same names as in simulate.results_timeseries
+COLUMNS = ['T_sp_h', 'T_sp_h_set', 'T_hp_in', 'T_amb_avg_24h', 'T_sp_tww', 'P_load_h', 'P_load_tww',
+           'P_hp_h_th', 'P_hp_tww_th', 'P_hp_h_el', 'P_Heizstab_h', 'P_hp_tww_el', 'P_Heizstab_tww',
+           'COP_h', 'COP_tww']
+# sums of accumulate(), divided by the number of steps: means [W or °C]
+SUMS = ['T_sp_h', 'T_sp_tww', 'P_load_h', 'P_load_tww', 'P_hp_h_th', 'P_hp_tww_th', 'P_hp_h_el', 'P_hp_tww_el',
+        'P_Heizstab_h', 'P_Heizstab_tww', 'P_el_gesamt']
+
+
+def heatpump_parameters(HeatPump):
+    """
+    Packs the heating parameters of a hplib.HeatPump into a flat array for the kernel.
+    Parameters
+    ----------
+    HeatPump: hplib.HeatPump
+    Returns
+    -------
+    np.ndarray [group_id, p1-p4 COP, p1-p4 P_el_h, P_el_ref, P_th_ref, delta_t]
+    """
+    if HeatPump.group_id not in (1, 2, 4, 5):
+        raise ValueError('No Simulation for Water/Water HP')
+    return np.array([HeatPump.group_id,
+                     HeatPump.p1_cop, HeatPump.p2_cop, HeatPump.p3_cop, HeatPump.p4_cop,
+                     HeatPump.p1_p_el_h, HeatPump.p2_p_el_h, HeatPump.p3_p_el_h, HeatPump.p4_p_el_h,
+                     HeatPump.p_el_ref, HeatPump.p_th_ref, HeatPump.delta_t], dtype=np.float64)
+
+
+def heating_dist_temp(HS, t_avg_d):
+    """
+    Vectorized hplib.HeatingSystem.calc_heating_dist_temp() for a whole series.
+    Parameters
+    ----------
+    HS: hplib.HeatingSystem
+    t_avg_d: np.ndarray with the 24h average outside temperature [°C]
+    Returns
+    -------
+    flow and return temperature as np.ndarray [°C]
+    """
+    x = ((1/HS.f_hs_size) * ((HS.t_inside_set-t_avg_d)/(HS.t_inside_set-HS.t_outside_min)))
+    x = np.where(t_avg_d > HS.t_inside_set, 0, x)**(1/HS.f_hs_exp)
+    t_hf = np.where(t_avg_d > HS.t_inside_set, HS.t_hf_min, HS.t_hf_min + x * (HS.t_hf_max - HS.t_hf_min))
+    t_hr = np.where(t_avg_d > HS.t_inside_set, HS.t_hr_min, HS.t_hr_min + x * (HS.t_hr_max - HS.t_hr_min))
+    return t_hf, t_hr
+
+
+@jit
+def _minimum_power(p_th, p_el, cop, p_th_min, hp):
+    """Heating rod and compressor boost of hplib.HeatPump.simulate() for a required thermal power p_th_min."""
+    if cop <= 1:
+        # only heating rod
+        return hp[10], hp[10], 1.0
+    if p_th < p_th_min:
+        if hp[0] < 4:
+            if hp[9] > p_th_min/cop:
+                # increase electrical power for compressor
+                return p_th_min, p_th_min/cop, cop
+            # turn on heating rod and compressor
+            p_el = hp[9] + hp[10]
+            p_th = hp[9]*cop + hp[10]
+            return p_th, p_el, p_th/p_el
+        p_th = p_th + hp[10]
+        p_el = p_el + hp[10]
+        return p_th, p_el, p_th/p_el
+    return p_th, p_el, cop
+
+
+@jit
+def compressor(t_in, t_in_secondary, t_amb, hp):
+    """P_th, P_el and COP of hplib.HeatPump.simulate() in heating mode before the heating rod is considered."""
+    group_id = hp[0]
+    t_out = t_in_secondary + hp[11]
+    if group_id == 1 or group_id == 4:
+        t_amb = t_in
+    cop = hp[1] * t_in + hp[2] * t_out + hp[3] + hp[4] * t_amb
+    p_el = hp[9] * (hp[5] * t_in + hp[6] * t_out + hp[7] + hp[8] * t_amb)
+    if group_id < 4:
+        # regulated heat pumps: lower limit of the compressor at 25 % of the power at -7 °C
+        if group_id == 1:
+            t_in = -7.0
+            t_amb = -7.0
+        else:
+            t_amb = -7.0
+        p_el_25 = 0.25 * hp[9] * (hp[5] * t_in + hp[6] * t_out + hp[7] + hp[8] * t_amb)
+        if p_el < p_el_25:
+            p_el = p_el_25
+    return p_el * cop, p_el, cop
+
+
+@jit
+def heatpump(t_in, t_in_secondary, t_amb, p_th_min, hp):
+    """Scalar copy of hplib.HeatPump.simulate() in heating mode, returns (P_th, P_el, COP)."""
+    p_th, p_el, cop = compressor(t_in, t_in_secondary, t_amb, hp)
+    return _minimum_power(p_th, p_el, cop, p_th_min, hp)
+
+
+@jit
+def _step(P_load_h_th, P_load_tww_th, T_sp_h_set_t, T_hp_in_t, T_amb_24h_t, T_sp_h, T_sp_tww, hyst_h, hyst_tww,
+          hp, T_sp_tww_set, T_hyst, V_sp, c_w, T_amb_sp, P_loss, dt):
+    # one time step of the state machine, returns the new state and the powers of the step
+    P_th_ref = hp[10]
+    running = 0
+    # Trinkwarmwasser: Regelung
+    if T_sp_tww < T_sp_tww_set and hyst_tww == 0:
+        hyst_tww = 1
+    if T_sp_tww < T_sp_tww_set+T_hyst and hyst_tww == 1:
+        P_hp_tww_th, P_hp_tww_el, cop_tww = heatpump(T_hp_in_t, T_sp_tww, T_amb_24h_t, 0.0, hp)
+        running = running+1
+    else:
+        hyst_tww = 0
+        P_hp_tww_th = 0.0
+        P_hp_tww_el = 0.0
+        cop_tww = 0.0
+    # Trinkwarmwasser: Speichertemperatur
+    T_sp_tww = T_sp_tww + (1/(V_sp*c_w))*(P_hp_tww_th - P_load_tww_th - P_loss*(T_sp_tww-T_amb_sp))*dt
+    if T_sp_tww < T_sp_tww_set-5:
+        T_sp_tww = T_sp_tww + (1/(V_sp*c_w)) * P_th_ref * dt
+        P_heizstab_tww = P_th_ref
+    else:
+        P_heizstab_tww = 0.0
+    # Heizung: Regelung
+    if T_sp_h < T_sp_h_set_t and hyst_h == 0 and hyst_tww == 0:
+        hyst_h = 1
+    if T_sp_h < T_sp_h_set_t+T_hyst and hyst_h == 1 and hyst_tww == 0:
+        P_hp_h_th, P_hp_h_el, cop_h = heatpump(T_hp_in_t, T_sp_h, T_amb_24h_t, P_load_h_th*1.5, hp)
+        if P_load_h_th > 0:
+            f_power = (P_hp_h_th / (P_load_h_th + 500))
+        else:
+            f_power = 1.0
+        if f_power < 1:
+            P_hp_h_th = (P_hp_h_th / f_power) * 1.1
+            P_hp_h_el = (P_hp_h_el / f_power) * 1.1
+        running = running+1
+    else:
+        hyst_h = 0
+        P_hp_h_th = 0.0
+        P_hp_h_el = 0.0
+        cop_h = 0.0
+    # Heizung: Speichertemperaturen
+    T_sp_h = T_sp_h + (1/(V_sp*c_w))*(P_hp_h_th - P_load_h_th - P_loss*(T_sp_h-T_amb_sp))*dt
+    if T_sp_h < T_sp_h_set_t-5:
+        T_sp_h = T_sp_h + (1/(V_sp*c_w)) * P_th_ref * dt
+        P_heizstab_h = P_th_ref
+    else:
+        P_heizstab_h = 0.0
+    return (T_sp_h, T_sp_tww, hyst_h, hyst_tww, running, P_hp_h_th, P_hp_h_el, cop_h, P_heizstab_h,
+            P_hp_tww_th, P_hp_tww_el, cop_tww, P_heizstab_tww)
+
+
+@jit
+def _run(P_load_h, P_load_tww, T_sp_h_set, T_hp_in, T_amb_24h, hp, T_sp_h, T_sp_tww, T_sp_tww_set, T_hyst,
+         V_sp, c_w, T_amb_sp, dt, out):
+    P_th_ref = hp[10]
+    P_loss = 0.0038 * V_sp + 0.85
+    hyst_h = 0
+    hyst_tww = 0
+    runtime = 0
+    E_heizstab_h_storage = 0.0
+    E_heizstab_tww_storage = 0.0
+    for t in range(len(P_load_h)):
+        (T_sp_h, T_sp_tww, hyst_h, hyst_tww, running, P_hp_h_th, P_hp_h_el, cop_h, P_heizstab_h,
+         P_hp_tww_th, P_hp_tww_el, cop_tww, P_heizstab_tww) = _step(
+            P_load_h[t], P_load_tww[t], T_sp_h_set[t], T_hp_in[t], T_amb_24h[t], T_sp_h, T_sp_tww, hyst_h, hyst_tww,
+            hp, T_sp_tww_set, T_hyst, V_sp, c_w, T_amb_sp, P_loss, dt)
+        runtime = runtime+running
+        if P_heizstab_tww > 0:
+            E_heizstab_tww_storage = E_heizstab_tww_storage + P_th_ref * dt / 3600
+        if P_heizstab_h > 0:
+            E_heizstab_h_storage = E_heizstab_h_storage + P_th_ref * dt / 3600
+        # Abspeichern relevanter Werte
+        out[0][t] = T_sp_h
+        out[1][t] = T_sp_h_set[t]
+        out[2][t] = T_hp_in[t]
+        out[3][t] = T_amb_24h[t]
+        out[4][t] = T_sp_tww
+        out[5][t] = P_load_h[t]
+        out[6][t] = P_load_tww[t]
+        out[7][t] = P_hp_h_th
+        out[8][t] = P_hp_tww_th
+        out[9][t] = P_hp_h_el
+        out[10][t] = P_heizstab_h
+        out[11][t] = P_hp_tww_el
+        out[12][t] = P_heizstab_tww
+        out[13][t] = cop_h
+        out[14][t] = cop_tww
+    return runtime, E_heizstab_h_storage, E_heizstab_tww_storage
+
+
+@jit
+def _accumulate(P_load_h, P_load_tww, T_sp_h_set, T_hp_in, T_amb_24h, P_el_hh, hp,
+                T_sp_h, T_sp_tww, T_sp_tww_set, T_hyst, V_sp, c_w, T_amb_sp, dt, sums, rods, P_el):
+    P_th_ref = hp[10]
+    P_loss = 0.0038 * V_sp + 0.85
+    hyst_h = 0
+    hyst_tww = 0
+    runtime = 0
+    E_heizstab_h_storage = 0.0
+    E_heizstab_tww_storage = 0.0
+    for t in range(len(P_load_h)):
+        (T_sp_h, T_sp_tww, hyst_h, hyst_tww, running, P_hp_h_th, P_hp_h_el, cop_h, P_heizstab_h,
+         P_hp_tww_th, P_hp_tww_el, cop_tww, P_heizstab_tww) = _step(
+            P_load_h[t], P_load_tww[t], T_sp_h_set[t], T_hp_in[t], T_amb_24h[t], T_sp_h, T_sp_tww, hyst_h, hyst_tww,
+            hp, T_sp_tww_set, T_hyst, V_sp, c_w, T_amb_sp, P_loss, dt)
+        runtime = runtime+running
+        if P_heizstab_tww > 0:
+            E_heizstab_tww_storage = E_heizstab_tww_storage + P_th_ref * dt / 3600
+        if P_heizstab_h > 0:
+            E_heizstab_h_storage = E_heizstab_h_storage + P_th_ref * dt / 3600
+        # Heizstab der Wärmepumpe: Zeitschritte und erste Leistung
+        if cop_h == 1:
+            if rods[0] == 0:
+                rods[1] = P_hp_h_th
+            rods[0] += 1
+        if cop_tww == 1:
+            if rods[2] == 0:
+                rods[3] = P_hp_tww_th
+            rods[2] += 1
+        # Gesamtstromverbrauch Gebäude
+        P_el[t] = P_hp_h_el + P_hp_tww_el + P_el_hh[t] + P_heizstab_h + P_heizstab_tww
+        sums[0] += T_sp_h
+        sums[1] += T_sp_tww
+        sums[2] += P_load_h[t]
+        sums[3] += P_load_tww[t]
+        sums[4] += P_hp_h_th
+        sums[5] += P_hp_tww_th
+        sums[6] += P_hp_h_el
+        sums[7] += P_hp_tww_el
+        sums[8] += P_heizstab_h
+        sums[9] += P_heizstab_tww
+        sums[10] += P_el[t]
+    return runtime, E_heizstab_h_storage, E_heizstab_tww_storage
+
+
+def run(P_load_h, P_load_tww, T_sp_h_set, T_hp_in, T_amb_24h, hp, HeatStorage_h, HeatStorage_tww,
+        T_sp_h, T_sp_tww=50, T_sp_tww_set=47, T_hyst=3, dt=60):
+    """
+    Runs the hysteresis, storage and Heizstab state machine of simulate() on
+    input arrays and writes all results into one preallocated array.
+    Parameters
+    ----------
+    P_load_h: heating load [W]
+    P_load_tww: domestic hot water load [W]
+    T_sp_h_set: set temperature of the heating storage (flow temperature) [°C]
+    T_hp_in: inlet temperature on the primary side of the heat pump [°C]
+    T_amb_24h: 24h average outside temperature [°C]
+    hp: heat pump parameters from heatpump_parameters()
+    HeatStorage_h, HeatStorage_tww: src.heatstorage.HeatStorage, both storages must be identical
+    T_sp_h, T_sp_tww: storage temperatures at the start [°C]
+    T_sp_tww_set: set temperature of the hot water storage [°C]
+    T_hyst: hysteresis of the storages [K]
+    dt: time step [s]
+    Returns
+    -------
+    out (np.ndarray with one row per entry of COLUMNS), runtime [steps],
+    E_heizstab_h_storage [Wh], E_heizstab_tww_storage [Wh]
+    """
+    if (HeatStorage_h.V_sp, HeatStorage_h.c_w, HeatStorage_h.T_amb) != \
+            (HeatStorage_tww.V_sp, HeatStorage_tww.c_w, HeatStorage_tww.T_amb):
+        raise ValueError('The kernel expects heating and hot water storage of the same size')
+    n = len(P_load_h)
+    if ENABLED:
+        out = np.empty((len(COLUMNS), n))
+    else:
+        out = [[0.0]*n for _ in COLUMNS]
+    runtime, E_heizstab_h_storage, E_heizstab_tww_storage = _run(
+        buffer(np.ascontiguousarray(P_load_h, dtype=np.float64)),
+        buffer(np.ascontiguousarray(P_load_tww, dtype=np.float64)),
+        buffer(np.ascontiguousarray(T_sp_h_set, dtype=np.float64)),
+        buffer(np.ascontiguousarray(T_hp_in, dtype=np.float64)),
+        buffer(np.ascontiguousarray(T_amb_24h, dtype=np.float64)),
+        buffer(hp), float(T_sp_h), float(T_sp_tww), float(T_sp_tww_set), float(T_hyst),
+        float(HeatStorage_h.V_sp), float(HeatStorage_h.c_w), float(HeatStorage_h.T_amb), float(dt), out)
+    return np.asarray(out), runtime, E_heizstab_h_storage, E_heizstab_tww_storage
+
+
+def accumulate(P_load_h, P_load_tww, T_sp_h_set, T_hp_in, T_amb_24h, P_el_hh, hp, HeatStorage_h, HeatStorage_tww,
+               T_sp_h, T_sp_tww=50, T_sp_tww_set=47, T_hyst=3, dt=60):
+    """
+    Runs the state machine of run() but only keeps running sums and the total
+    electrical load of the building instead of all time series, so a simulation
+    needs a few MB besides its inputs. Use src.battery.balance() for the grid exchange.
+    Parameters
+    ----------
+    P_el_hh: electrical household load [W]
+    all others as in run()
+    Returns
+    -------
+    means of SUMS (dict), heating rod of the heat pump (cop 1) as [steps heating, P_th heating,
+    steps hot water, P_th hot water], P_el_gesamt (np.ndarray) [W],
+    runtime [steps], E_heizstab_h_storage [Wh], E_heizstab_tww_storage [Wh]
+    """
+    if (HeatStorage_h.V_sp, HeatStorage_h.c_w, HeatStorage_h.T_amb) != \
+            (HeatStorage_tww.V_sp, HeatStorage_tww.c_w, HeatStorage_tww.T_amb):
+        raise ValueError('The kernel expects heating and hot water storage of the same size')
+    n = len(P_load_h)
+    if ENABLED:
+        sums, rods, P_el = np.zeros(len(SUMS)), np.zeros(4), np.empty(n)
+    else:
+        sums, rods, P_el = [0.0]*len(SUMS), [0.0]*4, [0.0]*n
+    runtime, E_heizstab_h_storage, E_heizstab_tww_storage = _accumulate(
+        buffer(np.ascontiguousarray(P_load_h, dtype=np.float64)),
+        buffer(np.ascontiguousarray(P_load_tww, dtype=np.float64)),
+        buffer(np.ascontiguousarray(T_sp_h_set, dtype=np.float64)),
+        buffer(np.ascontiguousarray(T_hp_in, dtype=np.float64)),
+        buffer(np.ascontiguousarray(T_amb_24h, dtype=np.float64)),
+        buffer(np.ascontiguousarray(P_el_hh, dtype=np.float64)),
+        buffer(hp), float(T_sp_h), float(T_sp_tww), float(T_sp_tww_set),
+        float(T_hyst), float(HeatStorage_h.V_sp), float(HeatStorage_h.c_w), float(HeatStorage_h.T_amb), float(dt),
+        sums, rods, P_el)
+    means = dict(zip(SUMS, np.asarray(sums) / n))
+    return means, list(rods), np.asarray(P_el), runtime, E_heizstab_h_storage, E_heizstab_tww_storage
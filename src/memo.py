@@ -0,0 +1,204 @@
+import functools
+import hashlib
+import importlib.metadata
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+import pandas as pd
+import src.resultcache as resultcache
+
+# Memoized outputs of the callbacks of the web app. Many users request the
+# same views (region, building type, PV orientation, heat pump), so the figures
+# and tables are kept as compressed json in a SQLite database, which all
+# gunicorn workers of the machine share. A hit only decodes the json and hands
+# it to dash, without pandas or plotly. Entries expire after TTL seconds, the
+# least recently used ones are deleted above MAX_SIZE. The key is the hash of
+# the normalized inputs, the code of the app and its data, so a new version
+# never returns old figures. Hits and misses are counted per callback:
+#
+#   python -m src.memo              # hit rates, entries and size per callback
+#   python -m src.memo --clear
+
+PATH = 'src/simulation_data/memo.sqlite'
+MAX_SIZE = 50 * 2**20       # bytes of compressed json, least recently used entries are deleted above
+TTL = 6 * 3600              # s, entries are computed again afterwards
+CODE = ['app.py', 'src/resultsindex.py', 'src/memo.py']
+DATA = ['results_summary.pkl']
+PACKAGES = ['plotly', 'hplib']
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS memo (
+    key TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    value BLOB NOT NULL,        -- zlib compressed json
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL)'''
+STATISTICS = '''CREATE TABLE IF NOT EXISTS statistics (
+    name TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL,
+    misses INTEGER NOT NULL)'''
+
+_local = threading.local()
+
+
+def _connect():
+    # one connection per thread, opened again in forked processes
+    if getattr(_local, 'pid', None) != os.getpid():
+        connection = sqlite3.connect(PATH, timeout=5, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')     # a cache, losing the last entries is harmless
+        connection.execute(SCHEMA)
+        connection.execute(STATISTICS)
+        connection.execute('CREATE INDEX IF NOT EXISTS memo_used ON memo (used)')
+        _local.connection, _local.pid = connection, os.getpid()
+    return _local.connection
+
+
+@functools.lru_cache(maxsize=1)
+def version():
+    """
+    Returns
+    -------
+    hash of the code of the app, the packages and size and modification time of its data
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    digest = hashlib.sha1()
+    for filename in CODE:
+        with open(os.path.join(root, filename), 'rb') as file:
+            digest.update(file.read())
+    for filename in DATA:
+        if os.path.isfile(filename):
+            stat = os.stat(filename)
+            digest.update((filename + str(stat.st_size) + str(stat.st_mtime_ns)).encode())
+    for package in PACKAGES:
+        digest.update((package + importlib.metadata.version(package)).encode())
+    return digest.hexdigest()
+
+
+def key(name, inputs):
+    text = json.dumps([name, resultcache.canonical(inputs), version()], sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+
+def _rollback():
+    # e.g. after a timeout of the lock, the next call starts a new transaction
+    connection = getattr(_local, 'connection', None)
+    if connection is not None and connection.in_transaction:
+        connection.rollback()
+
+
+def _count(connection, name, hit):
+    connection.execute('INSERT OR IGNORE INTO statistics (name, hits, misses) VALUES (?, 0, 0)', (name,))
+    connection.execute('UPDATE statistics SET hits=hits+?, misses=misses+? WHERE name=?',
+                       (int(hit), int(not hit), name))
+
+
+def get(name, inputs, ttl=TTL):
+    """
+    Parameters
+    ----------
+    name: name of the callback
+    inputs: normalized inputs, json compatible
+    ttl: s, older entries are not returned
+    Returns
+    -------
+    the memoized output as decoded json, None if there is none
+    """
+    k = key(name, inputs)
+    now = time.time()
+    try:
+        connection = _connect()
+        row = connection.execute('SELECT value FROM memo WHERE key=? AND created>?', (k, now - ttl)).fetchone()
+        connection.execute('BEGIN')
+        if row is not None:
+            connection.execute('UPDATE memo SET used=? WHERE key=?', (now, k))
+        _count(connection, name, row is not None)
+        connection.execute('COMMIT')
+    except sqlite3.Error:
+        _rollback()
+        return None     # without the store the callback computes its output
+    return None if row is None else json.loads(zlib.decompress(row[0]))
+
+
+def put(name, inputs, value):
+    """
+    Saves the output of a callback, which is encoded with plotly's json encoder (figures, numpy arrays).
+    """
+    from plotly.io.json import to_json_plotly
+    blob = zlib.compress(to_json_plotly(value).encode(), 1)
+    now = time.time()
+    try:
+        connection = _connect()
+        connection.execute('BEGIN IMMEDIATE')
+        connection.execute('INSERT OR REPLACE INTO memo (key, name, value, size, created, used) VALUES (?, ?, ?, ?, ?, ?)',
+                           (key(name, inputs), name, blob, len(blob), now, now))
+        connection.execute('DELETE FROM memo WHERE created<?', (now - TTL,))
+        size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM memo').fetchone()[0]
+        if size > MAX_SIZE:
+            # least recently used entries until the size is below 90 % of MAX_SIZE
+            for k, nbytes in connection.execute('SELECT key, size FROM memo ORDER BY used').fetchall():
+                if size <= 0.9 * MAX_SIZE:
+                    break
+                connection.execute('DELETE FROM memo WHERE key=?', (k,))
+                size -= nbytes
+        connection.execute('COMMIT')
+    except sqlite3.Error:
+        _rollback()
+
+
+def memoize(name, inputs=None, ttl=TTL):
+    """
+    Decorator of a callback that returns its memoized output for the same inputs.
+    Parameters
+    ----------
+    name: name of the callback in the store and the statistics
+    inputs: function of the arguments of the callback that returns the inputs which determine its output
+            (e.g. only the name of a clicked bar from clickData), default all arguments
+    ttl: s, lifetime of the entries
+    """
+    def decorator(callback):
+        @functools.wraps(callback)
+        def memoized(*args):
+            normalized = inputs(*args) if inputs else list(args)
+            value = get(name, normalized, ttl)
+            if value is None:
+                value = callback(*args)
+                put(name, normalized, value)
+            return value
+        return memoized
+    return decorator
+
+
+def statistics():
+    """
+    Returns
+    -------
+    pd.DataFrame with hits, misses, hit rate, entries and size [MB] per callback
+    """
+    connection = _connect()
+    counts = pd.read_sql('SELECT name, hits, misses FROM statistics', connection, index_col='name')
+    entries = pd.read_sql('SELECT name, COUNT(*) AS entries, SUM(size)/1048576.0 AS "size [MB]" FROM memo '
+                          'GROUP BY name', connection, index_col='name')
+    summary = counts.join(entries, how='outer').astype(float).fillna(0)
+    summary.insert(2, 'hit rate', summary['hits'] / (summary['hits'] + summary['misses']).where(lambda calls: calls > 0))
+    return summary
+
+
+def clear():
+    """
+    Deletes all entries and statistics.
+    """
+    connection = _connect()
+    connection.execute('DELETE FROM memo')
+    connection.execute('DELETE FROM statistics')
+
+
+if __name__ == '__main__':
+    # python -m src.memo [--clear], in the folder of the app
+    if '--clear' in sys.argv[1:]:
+        clear()
+    print(statistics().to_string())
@@ -0,0 +1,114 @@
+import gc
+import os
+import resource
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# Startup of the web app under gunicorn (gunicorn.conf.py). With preload_app the
+# master imports app.py once, loads the datasets and the modules of the
+# callbacks and forks the workers from it, which share these memory pages
+# copy-on-write as long as nothing writes to them. Besides the code CPython
+# itself writes: every access to a python object changes its reference count
+# and the garbage collector writes into the header of every container it
+# tracks. So readonly() keeps the large DataFrames free of python objects
+# (strings as categoricals, numeric columns as read-only arrays) and freeze()
+# moves the objects of the master out of the collector's reach before the fork.
+#
+# python -m src.preload <pid of the gunicorn master> lists the memory of the
+# master and its workers.
+
+STARTED = time.perf_counter()   # first import, by gunicorn.conf.py or app.py
+
+
+def readonly(df):
+    """
+    Returns the DataFrame with categorical instead of string columns and read-only numeric columns,
+    one array per column, so that reading it leaves the pages shared between forked workers.
+    """
+    columns = {}
+    for column in df.columns:
+        if df[column].dtype == object:
+            columns[column] = df[column].astype('category')
+        else:
+            values = np.array(df[column].to_numpy())
+            values.flags.writeable = False
+            columns[column] = pd.Series(values, index=df.index, name=column, copy=False)
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+
+def writable(df):
+    """
+    Returns a copy of a (small) subset of a readonly() DataFrame with python strings and writable
+    columns, which the callbacks can change and plot like the original DataFrame.
+    """
+    return df.astype({column: object for column in df.columns if isinstance(df[column].dtype, pd.CategoricalDtype)})
+
+
+def freeze():
+    """
+    Moves all objects tracked by the garbage collector to the permanent generation, call in the
+    master before forking the workers.
+    """
+    gc.collect()
+    gc.freeze()
+
+
+def memory(pid=None):
+    """
+    Parameters
+    ----------
+    pid: process id, default the current process
+    Returns
+    -------
+    dict with rss (resident), pss (proportional share of the shared pages) and private (not shared) memory
+    in MB, pss and private None where /proc/<pid>/smaps_rollup is not available
+    """
+    pid = pid or os.getpid()
+    try:
+        with open('/proc/%d/smaps_rollup' % pid) as file:
+            fields = {line.split(':')[0]: int(line.split()[1]) for line in file if line.endswith('kB\n')}
+        return {'rss': fields['Rss']/1024, 'pss': fields['Pss']/1024,
+                'private': (fields['Private_Clean'] + fields['Private_Dirty'])/1024}
+    except (OSError, KeyError):
+        pass
+    try:
+        with open('/proc/%d/statm' % pid) as file:
+            rss = int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        # peak instead of current memory, only of the current process
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == 'darwin' else 1024)
+    return {'rss': rss, 'pss': None, 'private': None}
+
+
+def describe(usage):
+    return ', '.join('%s %.0f MB' % (name, value) for name, value in usage.items() if value is not None)
+
+
+def children(pid):
+    """
+    Returns
+    -------
+    list of the ids of the child processes (Linux)
+    """
+    pids = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open('/proc/' + entry + '/stat') as file:
+                    # the name in parentheses may contain spaces
+                    if int(file.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    return sorted(pids)
+
+
+if __name__ == '__main__':
+    # python -m src.preload <pid>: memory of the process and its children, e.g. the gunicorn workers
+    master = int(sys.argv[1])
+    usage = pd.DataFrame({pid: memory(pid) for pid in [master] + children(master)}).T
+    usage.index.name = 'pid'
+    print(usage.round(1).to_string())
+    print('total pss %.0f MB' % usage['pss'].sum() if usage['pss'].notna().all() else '')
@@ -0,0 +1,141 @@
+import cProfile
+import sys
+import time
+import tracemalloc
+import pandas as pd
+
+# Optional instrumentation of simulate(). A Profile records wall time, number of
+# calls and peak memory per stage (input data, thermal simulation, battery
+# sweep, KPI block, cache) and counters like the heat pump evaluations, and can
+# write a cProfile profile of the whole run. Without a profile simulate() uses
+# DISABLED, whose methods do nothing, so the overhead is a few function calls
+# per simulation. A stage lasts until the next one is entered, there is no
+# nesting, so the instrumented code keeps its structure.
+#
+#   summary, profile = simulate(..., profile=True)
+#   profile.summary()
+#
+# python -m src.profiling runs a single simulation, e.g. under py-spy:
+#   py-spy record -o simulate.svg -- python -m src.profiling 7 15000 35 4 0.4 2010 "VWF 157/4 35 & 55" 5 Süd
+
+
+class Profile:
+    """
+    Wall time, calls and peak memory of the stages of simulations.
+    Parameters
+    ----------
+    memory: record the peak memory allocated in every stage with tracemalloc, slows numpy code down
+    filename: write a cProfile profile of the simulation (pstats, e.g. for snakeviz or gprof2dot)
+    """
+
+    def __init__(self, memory=False, filename=None):
+        self.memory = memory
+        self.filename = filename
+        self.stages = {}    # name: [calls, time [s], peak memory [bytes]]
+        self.counts = {}    # name: number
+        self._profiler = None
+        self._tracing = False
+        self._stage = None
+        self._start = 0.0
+        self._memory = 0
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        if self.filename:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self):
+        self.enter(None)
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.filename)
+            self._profiler = None
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def enter(self, name):
+        """
+        Ends the current stage and starts the stage name, None only ends the current stage.
+        """
+        now = time.perf_counter()
+        if self._stage is not None:
+            stage = self.stages.setdefault(self._stage, [0, 0.0, 0])
+            stage[0] += 1
+            stage[1] += now - self._start
+            if self.memory:
+                stage[2] = max(stage[2], tracemalloc.get_traced_memory()[1] - self._memory)
+        self._stage = name
+        if name is not None and self.memory:
+            if hasattr(tracemalloc, 'reset_peak'):      # Python 3.9
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.stop()
+                tracemalloc.start()
+            self._memory = tracemalloc.get_traced_memory()[0]
+        self._start = time.perf_counter()
+
+    def count(self, name, number=1):
+        self.counts[name] = self.counts.get(name, 0) + number
+
+    def summary(self):
+        """
+        Returns
+        -------
+        pd.DataFrame with calls, time [s], share of the time and peak memory [MB] per stage
+        """
+        summary = pd.DataFrame([[calls, seconds, peak / 2**20] for calls, seconds, peak in self.stages.values()],
+                               index=pd.Index(list(self.stages), name='stage'),
+                               columns=['calls', 'time [s]', 'peak memory [MB]'])
+        summary.insert(2, 'share', summary['time [s]'] / summary['time [s]'].sum())
+        if not self.memory:
+            summary = summary.drop(columns='peak memory [MB]')
+        return summary
+
+
+class _Disabled:
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def enter(self, name):
+        pass
+
+    def count(self, name, number=1):
+        pass
+
+
+DISABLED = _Disabled()
+
+
+def get(profile):
+    """
+    Parameters
+    ----------
+    profile: None/False, True or a Profile
+    Returns
+    -------
+    the Profile to record into, DISABLED if profile is None or False
+    """
+    if profile is True:
+        return Profile()
+    return profile or DISABLED
+
+
+if __name__ == '__main__':
+    # python -m src.profiling standort E_gas T_vorlauf n_Personen eff_tww Baujahr wp_model pv_kwp pv_orientation
+    #                         [engine] [profile.pstats]
+    from simulate import simulate
+    arguments = sys.argv[1:]
+    parameters = [int(arguments[0]), float(arguments[1]), float(arguments[2]), int(arguments[3]), float(arguments[4]),
+                  int(arguments[5]), arguments[6], float(arguments[7]), arguments[8]]
+    engine = arguments[9] if len(arguments) > 9 else 'loop'
+    profile = Profile(memory=True, filename=arguments[10] if len(arguments) > 10 else None)
+    _, profile = simulate(*parameters, engine=engine, cache=False, profile=profile)
+    print(profile.summary().to_string())
+    print(pd.Series(profile.counts).to_string())
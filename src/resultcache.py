@@ -0,0 +1,295 @@
+import collections
+import functools
+import hashlib
+import importlib.metadata
+import json
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+import src.datastore as datastore
+
+# Results of simulate() addressed by the hash of all its parameters, the
+# simulation code, the versions of hplib/bslib and the input data. Changing any
+# of them gives new keys, so outdated results are never returned and are
+# removed by the size limit. The results are kept on disk in PATH (csv with a
+# json file of the parameters) with a small LRU in memory in front.
+# Results made of arrays, like the grid series of simulate(), are kept the same
+# way as npz files. Intermediate stages, like the thermal stage of simulate(), are
+# kept in the subfolder STAGES with their own size limit, so that they never push
+# out the results the app looks up.
+
+PATH = 'src/simulation_data/results/'
+STAGES = 'stages/'          # subfolder of PATH for the intermediate stages
+MAX_SIZE = 200 * 2**20      # bytes on disk, least recently used results are deleted above
+MAX_SIZE_STAGES = 100 * 2**20   # bytes on disk of the intermediate stages, deleted independently
+EVICT_TO = 0.9              # share of the size limit left after deleting, so that the next scan is some results away
+MEMORY_ENTRIES = 256        # results kept in memory per process
+MEMORY_ARRAYS = 16          # array results kept in memory per process, a few MB each
+CODE = ['simulate.py', 'src/kernel.py', 'src/battery.py', 'src/climate.py', 'src/heatstorage.py',
+        'src/datastore.py', 'src/binary.py', 'src/jit.py']
+DATA = ['weather', 'pv', 'electrical_load', 'dhw_load']     # folders of the input data in datastore.PATH
+PACKAGES = ['hplib', 'bslib']
+DATA_TTL = 60               # s, the input files are stat()ed again after, or when a file is added to or removed from DATA
+SCAN_INTERVAL = 60          # s, the size of the folders is summed up again after, other processes add results too
+
+_memory = collections.OrderedDict()     # key -> results_summary
+_arrays = collections.OrderedDict()     # key -> dict of arrays
+_stamps = {}                            # folders and their modification times -> (time of the scan, stamps)
+_usage = {}                             # folder -> [bytes as counted by this process, time of the last scan]
+_lock = threading.Lock()
+
+
+def canonical(value):
+    # json compatible value, numbers as float so that 35, 35.0 and np.int64(35) give the same key
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, dict):
+        return {str(name): canonical(item) for name, item in value.items()}
+    return [canonical(item) for item in value]
+
+
+@functools.lru_cache(maxsize=1)
+def _code_version():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    digest = hashlib.sha1()
+    for filename in CODE:
+        with open(os.path.join(root, filename), 'rb') as file:
+            digest.update(file.read())
+    for package in PACKAGES:
+        digest.update((package + importlib.metadata.version(package)).encode())
+    return digest.hexdigest()
+
+
+def _data_version():
+    # name, size and modification time of the input files, content hashes would take too long. Listing the
+    # folders and stat()ing every file on every key() costs more than a result from memory, so the stamps
+    # are kept per process until the modification time of a folder changes or DATA_TTL has passed
+    # (files changed in place do not change their folder)
+    folders = [datastore.PATH] + [datastore.PATH + folder for folder in DATA]
+    state = tuple((os.path.abspath(folder), os.stat(folder).st_mtime_ns if os.path.isdir(folder) else None)
+                  for folder in folders)
+    scanned = _stamps.get(state)
+    if scanned is not None and time.monotonic() - scanned[0] < DATA_TTL:
+        return scanned[1]
+    started = time.monotonic()
+    stamps = []
+    for filename in ['TRJ-Tabelle.csv'] + [os.path.join(folder, name) for folder in DATA
+                                           if os.path.isdir(datastore.PATH + folder)
+                                           for name in sorted(os.listdir(datastore.PATH + folder))]:
+        if os.path.isfile(datastore.PATH + filename):
+            stat = os.stat(datastore.PATH + filename)
+            stamps.append([filename, stat.st_size, stat.st_mtime_ns])
+    _stamps.clear()
+    _stamps[state] = (started, stamps)
+    return stamps
+
+
+def version():
+    """
+    Returns
+    -------
+    hash of the simulation code, the packages and the input data
+    """
+    return hashlib.sha1(json.dumps([_code_version(), _data_version()]).encode()).hexdigest()
+
+
+def key(parameters):
+    """
+    Parameters
+    ----------
+    parameters: dict with all parameters of the simulation, see simulate.scenario()
+    Returns
+    -------
+    key of the result
+    """
+    text = json.dumps([canonical(parameters), version()], sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+
+def _filename(key):
+    return PATH + key + '.csv'
+
+
+def get(parameters):
+    """
+    Looks up the result of a simulation.
+    Parameters
+    ----------
+    parameters: dict with all parameters of the simulation, see simulate.scenario()
+    Returns
+    -------
+    results_summary or None if not simulated yet
+    """
+    k = key(parameters)
+    with _lock:
+        if k in _memory:
+            _memory.move_to_end(k)
+            return _memory[k].copy()
+    try:
+        summary = pd.read_csv(_filename(k))
+        os.utime(_filename(k))      # recently used, see _evict()
+    except FileNotFoundError:
+        return None
+    _remember(k, summary)
+    return summary.copy()
+
+
+def contains(parameters, arrays=False):
+    """
+    Parameters
+    ----------
+    arrays: look for an array result (put_arrays()) instead of a results_summary
+    Returns
+    -------
+    True if the simulation with these parameters is in the cache
+    """
+    k = key(parameters)
+    with _lock:
+        if k in (_arrays if arrays else _memory):
+            return True
+    return os.path.exists(_folder(False) + k + '.npz' if arrays else _filename(k))
+
+
+def put(parameters, summary):
+    """
+    Saves the result of a simulation.
+    Parameters
+    ----------
+    parameters: dict with all parameters of the simulation, see simulate.scenario()
+    summary: results_summary
+    """
+    k = key(parameters)
+    os.makedirs(PATH, exist_ok=True)
+    tmp = '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+    with open(PATH + k + '.json' + tmp, 'w') as file:
+        json.dump(canonical(parameters), file, sort_keys=True)
+    os.replace(PATH + k + '.json' + tmp, PATH + k + '.json')
+    summary.to_csv(_filename(k) + tmp, index=False)
+    os.replace(_filename(k) + tmp, _filename(k))
+    _remember(k, summary.copy())
+    _evict(PATH, MAX_SIZE, os.path.getsize(_filename(k)))
+
+
+def _folder(intermediate):
+    return PATH + STAGES if intermediate else PATH
+
+
+def get_arrays(parameters, intermediate=False):
+    """
+    Looks up an array result, see put_arrays().
+    Parameters
+    ----------
+    parameters: dict with all parameters of the computation
+    intermediate: as in put_arrays()
+    Returns
+    -------
+    dict of np.ndarray and scalars or None
+    """
+    k = key(parameters)
+    with _lock:
+        if k in _arrays:
+            _arrays.move_to_end(k)
+            return dict(_arrays[k])
+    filename = _folder(intermediate) + k + '.npz'
+    try:
+        with np.load(filename) as data:
+            arrays = {name: data[name] if data[name].ndim else data[name].item() for name in data.files}
+        os.utime(filename)
+    except FileNotFoundError:
+        return None
+    _remember(k, arrays, _arrays, MEMORY_ARRAYS)
+    return dict(arrays)
+
+
+def put_arrays(parameters, arrays, compressed=False, intermediate=False):
+    """
+    Saves an intermediate result made of arrays and scalars. The arrays are copied,
+    get_arrays() returns the read-only copies shared by all callers of the process.
+    Parameters
+    ----------
+    parameters: dict with all parameters of the computation
+    arrays: dict of np.ndarray and numbers
+    compressed: zip compression, for results that are kept long and read rarely
+    intermediate: intermediate stage of a computation, deleted above MAX_SIZE_STAGES
+                  independent of the results
+    """
+    k = key(parameters)
+    folder = _folder(intermediate)
+    os.makedirs(folder, exist_ok=True)
+    tmp = '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+    with open(folder + k + '.json' + tmp, 'w') as file:
+        json.dump(canonical(parameters), file, sort_keys=True)
+    os.replace(folder + k + '.json' + tmp, folder + k + '.json')
+    (np.savez_compressed if compressed else np.savez)(folder + k + tmp + '.npz', **arrays)
+    os.replace(folder + k + tmp + '.npz', folder + k + '.npz')
+    shared = {}
+    for name, value in arrays.items():
+        if isinstance(value, np.ndarray):
+            value = value.copy()
+            value.flags.writeable = False
+        shared[name] = value
+    _remember(k, shared, _arrays, MEMORY_ARRAYS)
+    _evict(folder, MAX_SIZE_STAGES if intermediate else MAX_SIZE, os.path.getsize(folder + k + '.npz'))
+
+
+def _remember(k, value, memory=_memory, entries=MEMORY_ENTRIES):
+    with _lock:
+        memory[k] = value
+        memory.move_to_end(k)
+        while len(memory) > entries:
+            memory.popitem(last=False)
+
+
+def _evict(folder, limit, nbytes):
+    # deletes the least recently used results in folder above limit down to EVICT_TO of it. The process adds
+    # the size of its own results to the total of the last scan and only lists the folder again when that is
+    # above the limit or older than SCAN_INTERVAL, instead of stat()ing every result on every put()
+    with _lock:
+        usage = _usage.setdefault(folder, [0, None])
+        usage[0] += nbytes
+        if usage[1] is not None and usage[0] <= limit and time.monotonic() - usage[1] < SCAN_INTERVAL:
+            return
+        usage[1] = time.monotonic()
+    entries = []
+    for entry in os.scandir(folder):
+        if entry.name.endswith(('.csv', '.npz')) and not entry.name.endswith('.tmp.npz'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.name))
+    size = sum(entry[1] for entry in entries)
+    if size > limit:
+        for _, nbytes, name in sorted(entries):
+            if size <= limit * EVICT_TO:
+                break
+            k = name[:-4]
+            for filename in (folder + name, folder + k + '.json'):
+                try:
+                    os.remove(filename)
+                except FileNotFoundError:
+                    pass
+            with _lock:
+                _memory.pop(k, None)
+                _arrays.pop(k, None)
+            size -= nbytes
+    with _lock:
+        usage[0] = size
+
+
+def clear():
+    """
+    Deletes all results in memory and on disk.
+    """
+    with _lock:
+        _memory.clear()
+        _arrays.clear()
+        _usage.clear()
+    for folder in (PATH, PATH + STAGES):
+        if os.path.isdir(folder):
+            for entry in os.scandir(folder):
+                if entry.name.endswith(('.csv', '.json', '.npz')):
+                    os.remove(entry.path)
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+# Partitions of results_summary.pkl for the callbacks of the results tab. The
+# bar chart of all heat pumps (update_graph) shows one region, building type
+# and PV orientation in the average weather year without battery, the battery
+# chart (update_graph2) one heat pump of such a combination with all battery
+# sizes and weather years. Both are built once at startup: the rows of every
+# partition are stored contiguously in the original order, so a lookup is a
+# dict access and a slice, independent of the size of the dataset. The Generic
+# heat pumps get their displayed names ('Generic Luft/Wasser geregelt') once.
+# The costs depend on the electricity prices, which only the browser applies
+# (assets/prices.js): the callbacks store the grid supply and feed-in of the
+# points of every trace of their figure with energies().
+
+YEAR = 2015                         # weather year of the results tab
+WEATHER = 'durchschnittliches Jahr'
+OVERVIEW = ['Standort', 'Gebäudetyp', 'PV-Ausrichtung']     # key of the bar chart of all heat pumps
+MODEL = OVERVIEW + ['WP-Name']                               # key of the battery chart of one heat pump
+COLUMNS = ['Standort', 'Gebäudetyp', 'PV-Ausrichtung', 'Art des Jahres', 'Batteriespeicher [kWh]', 'WP-Hersteller',
+           'WP-Name', 'WP-Kategorie', 'WP-Typ', 'Netzbezug [kWh]', 'Netzeinspeisung [kWh]']
+
+
+def names(df):
+    """
+    Returns
+    -------
+    pd.Series of the heat pump names as displayed, 'Generic <WP-Kategorie> <WP-Typ>' for the Generic heat pumps
+    """
+    name = df['WP-Name'].astype(object)
+    generic = (name == 'Generic').to_numpy()
+    name[generic] = ('Generic ' + df.loc[generic, 'WP-Kategorie'].astype(object) + ' '
+                     + df.loc[generic, 'WP-Typ'].astype(object))
+    return name
+
+
+def _partitions(df, key):
+    # rows of df grouped by key in their original order and the slice of every group
+    groups = df.groupby(key, sort=False, observed=True).indices
+    df = df.take(np.concatenate(list(groups.values()))).reset_index(drop=True)
+    stops = np.cumsum([len(rows) for rows in groups.values()])
+    return df, {k: slice(int(stop) - len(rows), int(stop)) for (k, rows), stop in zip(groups.items(), stops)}
+
+
+class ResultsIndex:
+    """
+    Partitions of results_summary for the results tab.
+    Parameters
+    ----------
+    df: results_summary.pkl
+    """
+
+    def __init__(self, df):
+        df = df.loc[df['Jahr'] == YEAR, COLUMNS]
+        # strings as python objects for plotly, shared by all rows like the categories they come from
+        df = df.astype({column: object for column in df.columns if isinstance(df[column].dtype, pd.CategoricalDtype)})
+        df['WP-Name'] = names(df)
+        self._model, self._models = _partitions(df, MODEL)
+        overview = df[(df['Art des Jahres'] == WEATHER) & (df['Batteriespeicher [kWh]'] == 0)]
+        self._overview, self._overviews = _partitions(overview, OVERVIEW)
+
+    def overview(self, standort, gebäudetyp, pv_ausrichtung):
+        """
+        Returns
+        -------
+        pd.DataFrame with all heat pumps in the average weather year without battery
+        """
+        return self._overview.iloc[self._overviews.get((standort, gebäudetyp, pv_ausrichtung), slice(0, 0))]
+
+    def model(self, standort, gebäudetyp, pv_ausrichtung, wp_name):
+        """
+        Parameters
+        ----------
+        wp_name: name as displayed, see names()
+        Returns
+        -------
+        pd.DataFrame with all battery sizes and weather years of the heat pump
+        """
+        return self._model.iloc[self._models.get((standort, gebäudetyp, pv_ausrichtung, wp_name), slice(0, 0))]
+
+
+def energies(fig, partition, columns):
+    """
+    Values of the points of every trace of a figure, for the cost calculation in the browser (assets/prices.js).
+    Parameters
+    ----------
+    fig: plotly figure of partition, built with custom_data=['row'] (position of the point in partition) as first
+         custom data
+    partition: rows of ResultsIndex or simulation results
+    columns: dict name in the store -> column of partition
+    Returns
+    -------
+    dict name -> list of the values of every trace
+    """
+    values = {name: partition[column].to_numpy(dtype=float) for name, column in columns.items()}
+    rows = [np.asarray(trace.customdata)[:, 0].astype(int) for trace in fig.data]
+    return {name: [column[index].tolist() for index in rows] for name, column in values.items()}
@@ -0,0 +1,141 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+import pandas as pd
+
+# Tables of the simulation tab (the heat pumps to simulate and their results)
+# on the server. The dcc.Stores 'simhp' and 'simresults' only hold the key of
+# a table instead of the table itself, so a callback sends and receives a few
+# bytes instead of the results of up to ten heat pumps. The tables are kept
+# column by column as compressed json in a SQLite database shared by all
+# gunicorn workers; get() reads only the columns a callback needs. A table is
+# never changed, put() stores a new one with a new key (random, so it cannot be
+# guessed by other users). Tables expire after TTL seconds, the least recently
+# used ones are deleted above MAX_SIZE:
+#
+#   python -m src.sessionstore          # number and size of the tables
+
+PATH = 'src/simulation_data/sessions.sqlite'
+MAX_SIZE = 100 * 2**20      # bytes of compressed json, least recently used tables are deleted above
+TTL = 24 * 3600             # s, like the finished jobs (src/jobs.py)
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS frames (
+    key TEXT PRIMARY KEY,
+    rows INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL)'''
+COLUMNS = '''CREATE TABLE IF NOT EXISTS columns (
+    key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value BLOB NOT NULL,        -- zlib compressed json list
+    PRIMARY KEY (key, name))'''
+
+_local = threading.local()
+
+
+def _connect():
+    # one connection per thread, opened again in forked processes
+    if getattr(_local, 'pid', None) != os.getpid():
+        connection = sqlite3.connect(PATH, timeout=5, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(SCHEMA)
+        connection.execute(COLUMNS)
+        connection.execute('CREATE INDEX IF NOT EXISTS frames_used ON frames (used)')
+        _local.connection, _local.pid = connection, os.getpid()
+    return _local.connection
+
+
+def _delete(connection, keys):
+    for key in keys:
+        connection.execute('DELETE FROM columns WHERE key=?', (key,))
+        connection.execute('DELETE FROM frames WHERE key=?', (key,))
+
+
+def _encode(values):
+    # numpy scalars as python numbers, NaN as null
+    return zlib.compress(json.dumps(values.astype(object).where(values.notna(), None).tolist()).encode(), 1)
+
+
+def put(df):
+    """
+    Parameters
+    ----------
+    df: pd.DataFrame with unique column names
+    Returns
+    -------
+    key of the stored table
+    """
+    key = uuid.uuid4().hex
+    blobs = [(position, str(name), _encode(df[name])) for position, name in enumerate(df.columns)]
+    size = sum(len(blob) for _, _, blob in blobs)
+    now = time.time()
+    connection = _connect()
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        connection.execute('INSERT INTO frames (key, rows, size, created, used) VALUES (?, ?, ?, ?, ?)',
+                           (key, len(df), size, now, now))
+        connection.executemany('INSERT INTO columns (key, position, name, value) VALUES (?, ?, ?, ?)',
+                               [(key, position, name, blob) for position, name, blob in blobs])
+        _delete(connection, [k for k, in connection.execute('SELECT key FROM frames WHERE created<?', (now - TTL,))])
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM frames').fetchone()[0]
+        if total > MAX_SIZE:
+            # least recently used tables until the size is below 90 % of MAX_SIZE, never the new one
+            for k, nbytes in connection.execute('SELECT key, size FROM frames WHERE key!=? ORDER BY used', (key,)).fetchall():
+                if total <= 0.9 * MAX_SIZE:
+                    break
+                _delete(connection, [k])
+                total -= nbytes
+        connection.execute('COMMIT')
+    except BaseException:
+        if connection.in_transaction:
+            connection.rollback()
+        raise
+    return key
+
+
+def get(key, columns=None):
+    """
+    Parameters
+    ----------
+    key: key of the table, see put()
+    columns: names of the columns to read, default all; missing columns are left out
+    Returns
+    -------
+    pd.DataFrame with the columns in the stored order, None if the key is unknown or expired
+    """
+    if not key:
+        return None
+    connection = _connect()
+    now = time.time()
+    row = connection.execute('SELECT rows FROM frames WHERE key=? AND created>?', (key, now - TTL)).fetchone()
+    if row is None:
+        return None
+    if columns is None:
+        values = connection.execute('SELECT name, value FROM columns WHERE key=? ORDER BY position', (key,)).fetchall()
+    else:
+        columns = list(columns)
+        values = connection.execute('SELECT name, value FROM columns WHERE key=? AND name IN (%s) ORDER BY position'
+                                    % ','.join('?' * len(columns)), [key] + columns).fetchall()
+    connection.execute('UPDATE frames SET used=? WHERE key=?', (now, key))
+    return pd.DataFrame({name: json.loads(zlib.decompress(value)) for name, value in values}, index=range(row[0]))
+
+
+def statistics():
+    """
+    Returns
+    -------
+    dict with the number of tables and their size [MB]
+    """
+    tables, size = _connect().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM frames').fetchone()
+    return {'tables': tables, 'size [MB]': size / 2**20}
+
+
+if __name__ == '__main__':
+    # python -m src.sessionstore, in the folder of the app
+    print(statistics())
@@ -0,0 +1,171 @@
+import functools
+import json
+import os
+import numpy as np
+import pandas as pd
+from hplib import hplib as hpl
+from scipy.spatial import cKDTree
+import src.datastore as datastore
+import src.resultcache as resultcache
+
+# Instant estimates of the simulation results from earlier simulations, shown
+# while the exact simulation runs. Every battery size of a results_summary is a
+# sample; the estimate is the distance weighted mean of the K nearest samples
+# with the same battery size in the standardized parameter space and their
+# spread is the uncertainty.
+# Regions are described by degree days and design temperature and heat pumps
+# by their hplib parameters, so unseen combinations still find neighbours.
+# results_summary.pkl only knows building types, not the heat demand and flow
+# temperature of simulate(), so the samples come from the result cache, only
+# results of the current code and input data. The csv files of earlier versions
+# in src/simulation_data/simulations/ are not used, their batteries were
+# simulated with an inverter of 0.5 W instead of 0.5 kW per kWh.
+# The model keeps the key of the result of every sample and drops the samples
+# whose result is outdated or was removed from the cache.
+
+PATH = 'src/simulation_data/surrogate.npz'
+FEATURES = ['G_15', 'T_min_ref', 'E_gas', 'T_vorlauf', 'n_Personen', 'eff_tww', 'Baujahr', 'pv_kwp',
+            'pv_orientation', 'Group', 'P_th_h_ref', 'COP_ref', 'E_bat']
+TARGETS = ['E_gs', 'E_gf', 'JAZ', 'Autarkiegrad']
+K = 8                       # neighbours per estimate
+
+_model = {}                 # loaded model and the modification time of PATH
+
+
+@functools.lru_cache(maxsize=1024)
+def _heatpump(wp_model):
+    parameters = hpl.get_parameters(wp_model)
+    return [float(parameters['Group'].iloc[0]), float(parameters['P_th_h_ref [W]'].iloc[0]),
+            float(parameters['COP_ref'].iloc[0])]
+
+
+def features(parameters, E_bat):
+    """
+    Feature vectors of a simulation.
+    Parameters
+    ----------
+    parameters: dict with the parameters of simulate(), see simulate.scenario()
+    E_bat: battery capacities [kWh]
+    Returns
+    -------
+    np.ndarray (len(E_bat) x len(FEATURES))
+    """
+    region = datastore.trj(int(parameters['standort']), int(parameters.get('year', 2015)), parameters.get('year_type', 'a'))
+    row = [region['G_15'], region['T_min_ref'], parameters['E_gas'], parameters['T_vorlauf'],
+           parameters['n_Personen'], parameters['eff_tww'], parameters['Baujahr'], parameters['pv_kwp'],
+           1.0 if parameters['pv_orientation'] == 'Süd' else 0.0] + _heatpump(parameters['wp_model'])
+    return np.array([row + [e] for e in E_bat], dtype=float)
+
+
+def _samples(parameters, summary):
+    return features(parameters, summary['E_bat'].values), summary[TARGETS].to_numpy(dtype=float)
+
+
+def _sources():
+    # key, parameters and path of the results_summary of the results in the cache of the current version
+    if os.path.isdir(resultcache.PATH):
+        for name in sorted(os.listdir(resultcache.PATH)):
+            if name.endswith('.json') and os.path.exists(resultcache.PATH + name[:-5] + '.csv'):
+                with open(resultcache.PATH + name) as file:
+                    parameters = json.load(file)
+                if parameters.get('resolution', 1) == 1 and resultcache.key(parameters) == name[:-5]:
+                    yield name[:-5], parameters, resultcache.PATH + name[:-5] + '.csv'
+
+
+def update(rebuild=False):
+    """
+    Adds the simulations that are not part of the model yet, drops the outdated ones and saves it.
+    Parameters
+    ----------
+    rebuild: train from scratch
+    Returns
+    -------
+    number of added simulations
+    """
+    sources = {key: (parameters, path) for key, parameters, path in _sources()}
+    X, Y, keys = np.empty((0, len(FEATURES))), np.empty((0, len(TARGETS))), np.empty(0, dtype=str)
+    outdated = False
+    if os.path.exists(PATH) and not rebuild:
+        with np.load(PATH) as data:
+            if len(data['keys']) == len(data['X']):
+                X, Y, keys = data['X'], data['Y'], data['keys']
+            else:           # earlier models with one key per simulation, including the simulations folder
+                outdated = True
+    current = np.isin(keys, list(sources))
+    outdated = outdated or not current.all()
+    X, Y, keys = X[current], Y[current], keys[current]
+    known = set(keys.tolist())
+    new_X, new_Y, new_keys, added = [X], [Y], [keys], 0
+    for key, (parameters, path) in sources.items():
+        if key in known:
+            continue
+        try:
+            x, y = _samples(parameters, pd.read_csv(path))
+        except Exception:
+            continue    # e.g. models which are no longer in the hplib database
+        new_X.append(x)
+        new_Y.append(y)
+        new_keys.append(np.full(len(x), key))
+        added += 1
+    if added or outdated or rebuild:
+        os.makedirs(os.path.dirname(PATH), exist_ok=True)
+        tmp = PATH[:-4] + '.' + str(os.getpid()) + '.tmp.npz'
+        np.savez(tmp, X=np.concatenate(new_X), Y=np.concatenate(new_Y), keys=np.concatenate(new_keys).astype(str))
+        os.replace(tmp, PATH)
+    return added
+
+
+def _load():
+    # model of PATH, reloaded when it was updated by another process
+    mtime = os.path.getmtime(PATH) if os.path.exists(PATH) else None
+    if _model.get('mtime') != mtime or 'trees' not in _model:
+        _model.clear()
+        _model['mtime'] = mtime
+        if mtime is None:
+            return None
+        with np.load(PATH) as data:
+            X, Y = data['X'], data['Y']
+        if len(X) == 0:
+            return None
+        # one tree per battery size, so the neighbours are different simulations
+        _model['trees'] = {}
+        for E_bat in np.unique(X[:, -1]):
+            rows = X[:, -1] == E_bat
+            scale = X[rows, :-1].std(axis=0)
+            scale[scale == 0] = 1
+            _model['trees'][E_bat] = (cKDTree(X[rows, :-1] / scale), Y[rows], scale)
+    return _model
+
+
+def estimate(parameters):
+    """
+    Estimates the results of a simulation from the nearest earlier simulations.
+    Parameters
+    ----------
+    parameters: dict with the parameters of simulate(), see simulate.scenario()
+    Returns
+    -------
+    pd.DataFrame with E_bat and the estimate and standard deviation (<target>_std) of the
+    TARGETS per battery size, None if there are no earlier simulations
+    """
+    model = _load()
+    if model is None:
+        return None
+    E_bat = np.asarray(parameters['battery_sizes'], dtype=float)
+    sizes = np.array(list(model['trees']))
+    rows = []
+    for b, x in enumerate(features(parameters, E_bat)[:, :-1]):
+        tree, Y, scale = model['trees'][sizes[np.abs(sizes - E_bat[b]).argmin()]]  # nearest simulated battery size
+        distance, index = tree.query(x / scale, k=min(K, tree.n))
+        distance, index = np.atleast_1d(distance), np.atleast_1d(index)
+        weights = 1 / (distance + 1e-6)
+        weights /= weights.sum()
+        mean = weights @ Y[index]
+        std = np.sqrt(weights @ (Y[index] - mean)**2)
+        row = {'E_bat': E_bat[b]}
+        for t, target in enumerate(TARGETS):
+            row[target] = mean[t]
+            row[target + '_std'] = std[t]
+        row['Abstand'] = distance.mean()        # standardized distance to the neighbours
+        rows.append(row)
+    return pd.DataFrame(rows)
@@ -0,0 +1,125 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import src.resultcache as resultcache
+
+# Electricity costs of stored simulations for arbitrary tariffs. simulate(...,
+# grid_series=True) saves the hourly grid supply and feed-in of every battery
+# size (float32, compressed) next to the results_summary. The series of all
+# stored simulations are stacked into two matrices, so the costs of any number
+# of hourly tariffs are two matrix products instead of new simulations.
+# Tariffs that depend on the weekday belong to the calendar of one test
+# reference year, evaluate(..., year=...) only uses the simulations of it.
+
+HOURS = 8760                # hours of the simulated year, starting on January 1st 00:00
+YEAR = 2015                 # default year of simulate()
+
+_stack = {}                 # stacked series and the files they were read from
+
+
+def _files():
+    # (key, modification time) of the stored grid series of the current code and data version
+    files = []
+    if not os.path.isdir(resultcache.PATH):
+        return files
+    for entry in os.scandir(resultcache.PATH):
+        if entry.name.endswith('.npz') and not entry.name.endswith('.tmp.npz'):
+            files.append((entry.name[:-4], entry.stat().st_mtime_ns))
+    return sorted(files)
+
+
+def load():
+    """
+    Stacks the hourly grid exchange of all stored simulations.
+    Returns
+    -------
+    pd.DataFrame with the parameters of simulate() and E_bat per row,
+    grid supply and feed-in per row and hour [kWh] (np.ndarray rows x HOURS, float32)
+    """
+    files = _files()
+    if _stack.get('files') == files:
+        return _stack['index'], _stack['supply'], _stack['feedin']
+    rows, supply, feedin = [], [], []
+    for k, _ in files:
+        try:
+            with open(resultcache.PATH + k + '.json') as file:
+                parameters = json.load(file)
+        except FileNotFoundError:
+            continue
+        if parameters.get('stage') != 'grid' or resultcache.key(parameters) != k:
+            continue    # other intermediate results or results of an outdated version
+        try:
+            with np.load(resultcache.PATH + k + '.npz') as series:  # not via the memory of the result cache
+                E_bat, E_gs, E_gf = series['E_bat'], series['E_gs'], series['E_gf']
+        except FileNotFoundError:
+            continue
+        for column in ('stage', 'battery_sizes'):
+            parameters.pop(column)
+        rows += [dict(parameters, E_bat=e) for e in E_bat]
+        supply.append(E_gs)
+        feedin.append(E_gf)
+    index = pd.DataFrame(rows)
+    supply = np.concatenate(supply) if supply else np.empty((0, HOURS), dtype=np.float32)
+    feedin = np.concatenate(feedin) if feedin else np.empty((0, HOURS), dtype=np.float32)
+    _stack.update(files=files, index=index, supply=supply, feedin=feedin)
+    return index, supply, feedin
+
+
+def _prices(price):
+    # tariffs as float32 matrix HOURS x n_tariffs
+    price = np.asarray(price, dtype=np.float32)
+    if price.ndim == 0:
+        price = np.full(HOURS, price, dtype=np.float32)
+    if price.ndim == 1:
+        price = price[:, None]
+    if price.shape[0] != HOURS:
+        raise ValueError('hourly tariffs need '+str(HOURS)+' values')
+    return price
+
+
+def evaluate(supply_price, feedin_price=0, year=None):
+    """
+    Annual electricity costs of all stored simulations for one or several tariffs.
+    Parameters
+    ----------
+    supply_price: price of the grid supply [ct/kWh], a number, an hourly tariff (HOURS)
+                  or several hourly tariffs (HOURS x n_tariffs)
+    feedin_price: feed-in tariff [ct/kWh], same shapes
+    year: only the simulations of this test reference year, for tariffs of its calendar
+          (time_of_use(..., year=year)), default all
+    Returns
+    -------
+    pd.DataFrame with the parameters of simulate(), E_bat and the balanced electricity costs [€]
+    as 'bilanzielle Stromkosten' or 'bilanzielle Stromkosten <i>' for several tariffs
+    """
+    index, supply, feedin = load()
+    if year is not None:
+        rows = (index['year'] == year).values if len(index) else np.zeros(0, dtype=bool)
+        index, supply, feedin = index[rows].reset_index(drop=True), supply[rows], feedin[rows]
+    costs = (supply @ _prices(supply_price) - feedin @ _prices(feedin_price)) / 100
+    if costs.shape[1] == 1:
+        return index.assign(**{'bilanzielle Stromkosten': costs[:, 0]})
+    return pd.concat([index, pd.DataFrame(costs, columns=['bilanzielle Stromkosten ' + str(i)
+                                                          for i in range(costs.shape[1])])], axis=1)
+
+
+def time_of_use(peak, off_peak, hours=(8, 20), weekends=False, year=YEAR):
+    """
+    Hourly tariff with a peak price during the day.
+    Parameters
+    ----------
+    peak: price between hours[0] and hours[1] [ct/kWh]
+    off_peak: price of all other hours [ct/kWh]
+    hours: start and end of the peak time [h]
+    weekends: peak price also on saturdays and sundays
+    year: year of the simulations (simulate(..., year=...)), whose calendar gives the weekdays
+    Returns
+    -------
+    np.ndarray (HOURS) [ct/kWh]
+    """
+    time = pd.date_range(str(year), periods=HOURS, freq='60min')
+    is_peak = (time.hour >= hours[0]) & (time.hour < hours[1])
+    if not weekends:
+        is_peak &= time.dayofweek < 5
+    return np.where(is_peak, peak, off_peak)
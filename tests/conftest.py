@@ -0,0 +1,21 @@
+import os
+import pytest
+import benchmarks.synthetic as synthetic
+
+# The tests run on the synthetic data of the benchmarks (benchmarks/synthetic.py),
+# written to benchmarks/workspace/ on the first run like python -m benchmarks.run.
+
+WORKSPACE = os.path.join(synthetic.ROOT, 'benchmarks', 'workspace')
+
+
+@pytest.fixture(scope='session')
+def workspace():
+    """
+    Folder of the synthetic data, the working directory during the tests that use it.
+    """
+    if not os.path.exists(os.path.join(WORKSPACE, 'results_summary.pkl')):
+        synthetic.make(WORKSPACE)
+    cwd = os.getcwd()
+    os.chdir(WORKSPACE)
+    yield WORKSPACE
+    os.chdir(cwd)
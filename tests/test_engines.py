@@ -0,0 +1,31 @@
+import inspect
+import numpy as np
+import pytest
+from benchmarks.golden import SCENARIOS
+from simulate import scenario, simulate, thermal
+
+# The kernel against the step by step reference implementation. The kernel
+# evaluates the heating load and the heat pump model with the terms in another
+# order, the rounding differences flip single hysteresis switches during the
+# year and move the annual values by up to 0.15 %.
+
+RTOL = 2e-3                 # relative, absolute for values below 1 (ratios, rounded shares)
+BATTERY_SIZES = [0, 5]      # kWh, the loop simulates every battery size step by step
+
+
+@pytest.mark.parametrize('parameters', SCENARIOS, ids=[parameters['wp_model'] for parameters in SCENARIOS])
+def test_kernel_matches_loop(workspace, parameters):
+    loop = simulate(**parameters, engine='loop', battery_sizes=BATTERY_SIZES, cache=False)
+    kernel = simulate(**parameters, engine='kernel', battery_sizes=BATTERY_SIZES, cache=False)
+    assert list(kernel.columns) == list(loop.columns)
+    for column in loop.columns:
+        if np.issubdtype(loop[column].dtype, np.number):
+            np.testing.assert_allclose(kernel[column].to_numpy(dtype=float), loop[column].to_numpy(dtype=float),
+                                       rtol=RTOL, atol=RTOL, err_msg=column)
+        else:
+            assert kernel[column].tolist() == loop[column].tolist(), column
+
+
+def test_loop_is_default():
+    for function in (scenario, thermal, simulate):
+        assert inspect.signature(function).parameters['engine'].default == 'loop'
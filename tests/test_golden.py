@@ -0,0 +1,10 @@
+import pytest
+import benchmarks.golden as golden
+
+# The variants of simulate() against the golden results of the loop engine
+# (benchmarks/golden.json) within the tolerances of golden.VARIANTS.
+
+
+@pytest.mark.parametrize('variant', list(golden.VARIANTS))
+def test_golden(workspace, variant):
+    assert golden.check([variant]) == []
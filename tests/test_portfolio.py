@@ -0,0 +1,51 @@
+import collections
+import pandas as pd
+import pytest
+import portfolio
+import src.resultcache as resultcache
+
+# A portfolio run interrupted while writing a result and resumed gives the
+# same rows as an uninterrupted run, each once.
+
+BUILDINGS = pd.DataFrame({'PLZ': '56626', 'E_gas': [10000, 15000, 20000, 25000, 30000, 12000],
+                          'T_vorlauf': [35, 35, 35, 55, 55, 55], 'Baujahr': [2020, 2010, 1990, 1990, 1980, 2005],
+                          'n_Personen': 4, 'eff_tww': 0.4, 'pv_kwp': 5, 'pv_orientation': 'Süd'})
+OPTIONS = dict(workers=1, block=4, engine='kernel', resolution=15, battery_sizes=[0, 5])
+KEY = ['id', 'wp_model', 'E_bat']
+
+
+@pytest.fixture
+def buildings(workspace, tmp_path, monkeypatch):
+    monkeypatch.setattr(resultcache, 'PATH', str(tmp_path / 'results') + '/')
+    monkeypatch.setattr(resultcache, '_memory', collections.OrderedDict())
+    monkeypatch.setattr(resultcache, '_arrays', collections.OrderedDict())
+    monkeypatch.setattr(resultcache, '_usage', {})
+    BUILDINGS.to_csv(tmp_path / 'buildings.csv', index=False)
+    return str(tmp_path / 'buildings.csv')
+
+
+def test_resume(buildings, tmp_path, monkeypatch):
+    expected = str(tmp_path / 'expected.csv')
+    assert portfolio.run(buildings, expected, **OPTIONS)['simulated'] == len(BUILDINGS)
+
+    # killed while writing the fourth result: half a row in the output, not in the checkpoint
+    result, calls = portfolio._Writer.result, []
+
+    def interrupted(writer, building, summary, source):
+        calls.append(building['id'])
+        if len(calls) == 4:
+            writer.output.write('3,56626,7,')
+            raise KeyboardInterrupt
+        result(writer, building, summary, source)
+
+    output = str(tmp_path / 'output.csv')
+    monkeypatch.setattr(portfolio._Writer, 'result', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        portfolio.run(buildings, output, **OPTIONS)
+    monkeypatch.setattr(portfolio._Writer, 'result', result)
+    counts = portfolio.run(buildings, output, resume=True, **OPTIONS)
+    assert counts['skipped'] == 3
+
+    actual, expected = pd.read_csv(output), pd.read_csv(expected)
+    assert not actual.duplicated(KEY).any()
+    pd.testing.assert_frame_equal(actual.sort_values(KEY, ignore_index=True), expected.sort_values(KEY, ignore_index=True))
@@ -0,0 +1,34 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import benchmarks.synthetic as synthetic
+from PLZtoWeatherRegion import MIN_PREFIX, RegionIndex
+
+# Offline lookup of the weather regions on the stations of T_zones_Ger_final.csv.
+
+
+@pytest.fixture(scope='module')
+def wzones():
+    return pd.read_csv(os.path.join(synthetic.ROOT, 'T_zones_Ger_final.csv'), index_col=0)
+
+
+def test_lookup(wzones):
+    index = RegionIndex(wzones)
+    station = wzones.iloc[0]
+    code = str(int(station['PLZ'])).zfill(5)
+    assert index.plz(code) == station['Climate Zone']
+    assert index.lookup(int(code)) == station['Climate Zone']
+    assert index.place(station['Place']) == station['Climate Zone']
+    assert index.plz(code[:MIN_PREFIX]) is not None
+    assert index.plz(code[:MIN_PREFIX - 1]) is None
+
+
+def test_unknown_plz(wzones):
+    # every 4th station left out of the index, the zone of its PLZ as with the nearest station (75 %)
+    codes = wzones['PLZ'].astype(int).astype(str).str.zfill(5)
+    hits = []
+    for i in range(0, len(wzones), 4):
+        index = RegionIndex(wzones.drop(wzones.index[i]))
+        hits.append(index.plz(codes.iloc[i]) == wzones['Climate Zone'].iloc[i])
+    assert np.mean(hits) >= 0.75
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from benchmarks.golden import SCENARIOS
+from simulate import simulate
+
+# Averaged inputs against the 1-minute simulation (README, Time resolution). The
+# annual values stay within TOLERANCES, the peaks of the grid supply are not
+# usable with 15 minutes and not checked. The resolution does not depend on the
+# engine, the tests use the kernel.
+
+KPIS = ['JAZ', 'SJAZ', 'Autarkiegrad', 'E_gs', 'E_gf']
+TOLERANCES = {5: 0.04, 15: 0.08}    # relative
+BATTERY_SIZES = [0, 5, 10]          # kWh
+
+
+@pytest.mark.parametrize('parameters', SCENARIOS, ids=[parameters['wp_model'] for parameters in SCENARIOS])
+def test_resolution_matches_1min(workspace, parameters):
+    reference = simulate(**parameters, engine='kernel', battery_sizes=BATTERY_SIZES, cache=False)
+    for resolution, tolerance in TOLERANCES.items():
+        summary = simulate(**parameters, engine='kernel', battery_sizes=BATTERY_SIZES, cache=False, resolution=resolution)
+        for column in KPIS:
+            np.testing.assert_allclose(summary[column], reference[column], rtol=tolerance,
+                                       err_msg=column + ', ' + str(resolution) + ' min')
+
+
+def test_60min_is_rejected():
+    with pytest.raises(ValueError):
+        simulate(**SCENARIOS[0], resolution=60)
@@ -0,0 +1,27 @@
+import pytest
+from benchmarks.golden import SCENARIOS
+import src.datastore as datastore
+from simulate import simulate, simulate_years
+
+# The synthetic workspace has the profiles of the average year 2015 of region 7
+# only (benchmarks/synthetic.YEARS), TRJ-Tabelle.csv lists all years.
+
+OPTIONS = dict(engine='kernel', battery_sizes=[0, 5], cache=False)
+
+
+def test_years_with_profiles(workspace):
+    assert datastore.years(7) == [(2015, 'a')]
+    assert datastore.years(4) == []
+
+
+def test_simulate_years(workspace):
+    results = simulate_years(**SCENARIOS[0], **OPTIONS)
+    expected = simulate(**SCENARIOS[0], **OPTIONS)
+    assert results['Jahr'].tolist() == [2015] * len(expected)
+    assert results['Art des Jahres'].tolist() == [datastore.YEAR_TYPES['a']] * len(expected)
+    assert results.drop(columns=['Jahr', 'Art des Jahres']).equals(expected)
+
+
+def test_simulate_years_without_profiles(workspace):
+    with pytest.raises(ValueError):
+        simulate_years(**dict(SCENARIOS[0], standort=4), **OPTIONS)